@@ -4,6 +4,9 @@ import socket
 import json
 import time
 from pygame.locals import *
+from common.framing import FrameReader, encode_message
+
+PAGE_SIZE = 20  # Games asked for at a time; more are fetched when the list is scrolled to its end
 
 class GameListScreen:
     def __init__(self, screen, width=800, height=600):
@@ -70,8 +73,17 @@ class GameListScreen:
         
         # Socket for server communication
         self.socket = None
+        self.reader = None
         self.connected = False
 
+        # The connection stays open and the server pushes LOBBY_DIFF
+        # whenever a game changes, instead of the list being polled
+        self.subscribed = False
+        self.version = None  # Lobby version of the latest page or diff
+        self.cursor = None  # Where the next page starts, None once everything is loaded
+        self.total = 0  # Games the server has in all
+        self.loading = False  # Whether a further page has been asked for
+
     def connect_to_server(self):
         """Connect to the chess server"""
         if self.connected:
@@ -81,6 +93,12 @@ class GameListScreen:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.socket.settimeout(5.0)
             self.socket.connect(("localhost", 50004))
+            self.reader = FrameReader(self.socket)
+            # Heartbeats keep the connection open while the screen only listens
+            self.socket.sendall(encode_message({"type": "HELLO", "encodings": ["json"], "heartbeat": True}))
+            reply = self.reader.read_message()
+            if not reply or reply.get("type") != "HELLO":
+                raise ConnectionError(f"Unexpected reply to HELLO: {reply}")
             self.socket.settimeout(None)
             self.connected = True
             print("Connected to server")
@@ -91,14 +109,26 @@ class GameListScreen:
             self.status_color = self.RED
             return False
 
+    def disconnect(self):
+        """Close the connection, which ends the subscription"""
+        if self.socket:
+            try:
+                self.socket.close()
+            except Exception:
+                pass
+        self.socket = None
+        self.reader = None
+        self.connected = False
+        self.subscribed = False
+        self.loading = False
+
     def send_message(self, message):
         """Send a message to the server"""
         if not self.connected:
             print("Not connected to server")
             return False
         try:
-            data = json.dumps(message).encode('utf-8')
-            self.socket.send(data)
+            self.socket.sendall(encode_message(message))
             return True
         except Exception as e:
             print(f"Error sending message: {e}")
@@ -111,13 +141,13 @@ class GameListScreen:
             return None
         try:
             self.socket.settimeout(5.0)  # Set timeout for receiving
-            data = self.socket.recv(1024).decode('utf-8')
+            message = self.reader.read_message()
             self.socket.settimeout(None)  # Reset timeout
-            if not data:
+            if not message:
                 print("Server closed connection")
                 self.connected = False
                 return None
-            return json.loads(data)
+            return message
         except socket.timeout:
             print("Timeout waiting for server response")
             return None
@@ -141,26 +171,109 @@ class GameListScreen:
         self.draw()
         pygame.display.flip()
         
-        if not self.send_message({"type": "GET_GAMES"}):
+        # The first page, subscribing to changes unless this connection already is
+        request = {"type": "GET_GAMES", "limit": PAGE_SIZE}
+        if not self.subscribed:
+            request["subscribe"] = True
+        if not self.send_message(request):
             self.status_message = "Failed to request games"
             self.status_color = self.RED
             return False
-            
+
         response = self.receive_message()
+        while response and (response.get("type") in ("LOBBY_DIFF", "PING", "PONG") or
+                            (response.get("type") == "GAME_LIST" and self.loading)):
+            self.handle_update(response)
+            response = self.receive_message()
         if not response or response.get("type") != "GAME_LIST":
             self.status_message = "Failed to get game list"
             self.status_color = self.RED
             return False
-            
-        self.games = response.get("games", [])
+
+        self.show_page(response, first=True)
+        if "version" in response:
+            self.subscribed = True
+        else:
+            # A server without a lobby index sends every game and hangs up
+            self.disconnect()
+        self.show_count()
+        return True
+
+    def show_page(self, message, first):
+        """Take a GAME_LIST, as the start of the list or as the page after what we have"""
+        games = message.get("games", [])
+        if first:
+            self.games = games
+            self.scroll_offset = 0
+        else:
+            known = {game["game_id"] for game in self.games}
+            self.games.extend(game for game in games if game["game_id"] not in known)
+        self.cursor = message.get("cursor")
+        self.total = message.get("total", len(self.games))
+        self.version = message.get("version")
+
+    def show_count(self):
         if not self.games:
             self.status_message = "No active games found"
             self.status_color = self.BLUE
         else:
-            self.status_message = f"Found {len(self.games)} active games"
+            self.status_message = f"Showing {len(self.games)} of {self.total} active games"
             self.status_color = self.GREEN
-            
-        return True
+
+    def load_more(self):
+        """Ask for the page after the games we have, if there is one; it arrives via poll_updates"""
+        if not self.subscribed or self.cursor is None or self.loading:
+            return
+        if self.send_message({"type": "GET_GAMES", "cursor": self.cursor, "limit": PAGE_SIZE}):
+            self.loading = True
+
+    def poll_updates(self):
+        """Apply whatever the server has pushed, without waiting"""
+        if not self.subscribed:
+            return
+        try:
+            self.socket.settimeout(0.001)
+            while True:
+                message = self.reader.read_message()
+                if message is None:
+                    raise ConnectionError("server closed the connection")
+                self.handle_update(message)
+        except socket.timeout:
+            if self.socket:
+                self.socket.settimeout(None)
+        except Exception as e:
+            print(f"Lost the game list subscription: {e}")
+            self.disconnect()
+            self.status_message = "Lost connection to server, press Refresh"
+            self.status_color = self.RED
+
+    def handle_update(self, message):
+        message_type = message.get("type")
+        if message_type == "PING":
+            self.send_message({"type": "PONG", "id": message.get("id")})
+        elif message_type == "LOBBY_DIFF":
+            self.apply_diff(message)
+        elif message_type == "GAME_LIST" and self.loading:
+            self.loading = False
+            self.show_page(message, first=False)
+            self.show_count()
+
+    def apply_diff(self, message):
+        """Add, replace and drop the games a LOBBY_DIFF lists"""
+        removed = set(message.get("removed", []))
+        changed = {game["game_id"]: game for game in message.get("changed", [])}
+        games = [changed.pop(game["game_id"], game) for game in self.games if game["game_id"] not in removed]
+        added = message.get("added", [])
+        if self.cursor is None:
+            # Everything is loaded, so a changed game we lack was missed
+            added = added + list(changed.values())
+        # The list is newest first, and new games are the newest
+        added = sorted(added, key=lambda game: game.get("created_at", 0), reverse=True)
+        self.games = added + [game for game in games if game["game_id"] not in {new["game_id"] for new in added}]
+        self.total = max(len(self.games), self.total + len(message.get("added", [])) - len(removed))
+        self.version = message.get("version")
+        self.scroll_offset = max(0, min(self.scroll_offset, len(self.games) - self.max_visible_games))
+        self.show_count()
 
     def run(self):
         # Fetch games when the screen is first shown
@@ -168,6 +281,7 @@ class GameListScreen:
         
         running = True
         while running:
+            self.poll_updates()
             for event in pygame.event.get():
                 if event.type == QUIT:
                     pygame.quit()
@@ -203,6 +317,7 @@ class GameListScreen:
                         if self.selected_game or self.game_field.text:
                             game_id = self.selected_game if self.selected_game else self.game_field.text
                             if self.name_field.text and self.id_field.text:
+                                self.disconnect()
                                 return {
                                     "name": self.name_field.text,
                                     "id": self.id_field.text,
@@ -217,6 +332,7 @@ class GameListScreen:
                     
                     # Check if back button was clicked
                     if self.back_button.is_hovered:
+                        self.disconnect()
                         return None
                         
                     # Check if exit button was clicked
@@ -228,6 +344,8 @@ class GameListScreen:
                 if event.type == MOUSEWHEEL:
                     self.scroll_offset = max(0, min(len(self.games) - self.max_visible_games, 
                                                   self.scroll_offset - event.y))
+                    if self.scroll_offset + self.max_visible_games >= len(self.games):
+                        self.load_more()
             
             # Update button hover states
             mouse_pos = pygame.mouse.get_pos()
@@ -0,0 +1,96 @@
+"""Per-spectator cost of a BOARD_UPDATE broadcast.
+
+Compares serializing the message separately for every recipient (the old
+send_message loop) with SimpleServer.broadcast, which encodes once and fans
+out the same bytes. Sockets are replaced by sinks so only the server-side
+CPU cost is measured.
+
+Usage: python benchmarks/bench_broadcast.py [spectators ...]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chess
+from simple_server import SimpleServer
+
+ROUNDS = 200
+
+
+class SinkSocket:
+    """Stands in for a server.outbound.Connection that never blocks"""
+
+    addr = ("sink", 0)
+    binary = False
+
+    def __init__(self):
+        self.bytes_sent = 0
+
+    def send(self, data, kind=None):
+        self.bytes_sent += len(data)
+        return True
+
+
+def make_game(spectator_count):
+    board = chess.Board()
+    board.push_uci("e2e4")
+    return {
+        "board": board,
+        "players": {
+            "white": {"name": "white", "id": "w", "socket": SinkSocket()},
+            "black": {"name": "black", "id": "b", "socket": SinkSocket()},
+        },
+        "current_player": "black",
+        "status": "playing",
+        "spectators": [
+            {"name": f"spectator{i}", "id": f"s{i}", "socket": SinkSocket()}
+            for i in range(spectator_count)
+        ],
+    }
+
+
+def per_recipient_encoding(server, game, message):
+    for player_data in game["players"].values():
+        server.send_message(player_data["socket"], message)
+    for spectator in game["spectators"]:
+        server.send_message(spectator["socket"], message)
+
+
+def encode_once(server, game, message):
+    server.broadcast(game, message)
+
+
+def measure(fn, server, game, message):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        fn(server, game, message)
+    return time.perf_counter() - start
+
+
+def main():
+    spectator_counts = [int(arg) for arg in sys.argv[1:]] or [10, 100, 500, 2000]
+    server = SimpleServer()
+    print(f"{'spectators':>10} {'per-recipient us':>18} {'encode-once us':>16} {'speedup':>8}")
+    for count in spectator_counts:
+        game = make_game(count)
+        message = {
+            "type": "BOARD_UPDATE",
+            "board": game["board"].fen(),
+            "current_player": game["current_player"],
+            "game_over": False,
+            "winner": None,
+            "white_time": 287.5,
+            "black_time": 300,
+        }
+        recipients = count + 2
+        old = measure(per_recipient_encoding, server, game, message)
+        new = measure(encode_once, server, game, message)
+        old_us = old / (ROUNDS * recipients) * 1e6
+        new_us = new / (ROUNDS * recipients) * 1e6
+        print(f"{count:>10} {old_us:>18.3f} {new_us:>16.3f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
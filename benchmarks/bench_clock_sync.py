@@ -0,0 +1,147 @@
+"""Clock traffic of idle games, 1 Hz TIME_UPDATE against local countdown.
+
+Starts a SimpleServer on a free localhost port and seats a number of games,
+each with a few spectators. White makes one move and then nobody moves, so
+all that reaches the clients is clock traffic. The frames and bytes the
+clients receive over the idle period are counted twice: with a TIME_UPDATE
+every second, as the server used to send, and with CLOCK_SYNC_INTERVAL,
+clients counting the clock down themselves in between.
+
+Usage: python benchmarks/bench_clock_sync.py [seconds] [games] [spectators per game]
+"""
+import contextlib
+import io
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import simple_server
+from common.framing import FrameReader, encode_message
+from server.journal import JournalStore
+from server.utils import configure_store, flush_writes
+
+TARGET_REDUCTION = 0.9
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+class Client:
+    """A raw connection that counts what it receives once counting is on"""
+
+    def __init__(self, port):
+        self.sock = socket.create_connection(("127.0.0.1", port))
+        self.reader = FrameReader(self.sock)
+        self.counting = False
+        self.frames = 0
+        self.bytes = 0
+
+    def send(self, message):
+        self.sock.sendall(encode_message(message))
+
+    def until(self, message_type):
+        while True:
+            message = self.reader.read_message()
+            if message is None:
+                raise RuntimeError(f"Connection lost waiting for {message_type}")
+            if message["type"] == message_type:
+                return message
+
+    def count(self):
+        try:
+            while True:
+                payload = self.reader.read_payload()
+                if payload is None:
+                    return
+                if self.counting:
+                    self.frames += 1
+                    self.bytes += len(payload) + 4
+        except OSError:
+            pass
+
+
+def seat_game(port, number, spectators):
+    white = Client(port)
+    white.send({"type": "CREATE_GAME", "player_name": "white", "player_id": f"w{number}", "time_limit": 3600})
+    game_id = white.until("GAME_CREATED")["game_id"]
+    black = Client(port)
+    black.send({"type": "JOIN_GAME", "player_name": "black", "player_id": f"b{number}", "game_id": game_id})
+    white.until("GAME_START")
+    black.until("GAME_START")
+    watchers = []
+    for index in range(spectators):
+        watcher = Client(port)
+        watcher.send({"type": "SPECTATE", "player_name": f"s{index}", "player_id": f"s{number}-{index}",
+                      "game_id": game_id})
+        watcher.until("SPECTATE_START")
+        watchers.append(watcher)
+    white.send({"type": "MOVE", "move": "e2e4"})
+    white.until("BOARD_UPDATE")
+    black.until("BOARD_UPDATE")
+    for watcher in watchers:
+        watcher.until("BOARD_UPDATE")
+    return [white, black] + watchers
+
+
+def run(seconds, games, spectators, sync_interval):
+    simple_server.PORT = free_port()
+    simple_server.CLOCK_SYNC_INTERVAL = sync_interval
+    simple_server.games.clear()
+    server = simple_server.SimpleServer()
+    threading.Thread(target=server.start, daemon=True).start()
+    time.sleep(0.3)
+
+    clients = []
+    for number in range(games):
+        clients.extend(seat_game(simple_server.PORT, number, spectators))
+    for client in clients:
+        threading.Thread(target=client.count, daemon=True).start()
+        client.counting = True
+    time.sleep(seconds)
+    for client in clients:
+        client.counting = False
+        client.sock.close()
+    server.server_socket.close()
+    return sum(client.frames for client in clients), sum(client.bytes for client in clients)
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 20.0
+    games = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    spectators = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    journal_dir = tempfile.mkdtemp(prefix="bench_clock_sync_")
+    configure_store(JournalStore(journal_dir, fsync_policy="never"))
+    sync_interval = simple_server.CLOCK_SYNC_INTERVAL
+
+    print(f"{games} idle games with {spectators} spectators each, {seconds:.0f}s")
+    try:
+        results = {}
+        for label, interval in (("1 Hz TIME_UPDATE", 1.0), (f"sync every {sync_interval:g}s", sync_interval)):
+            # The server logs every message; keep that out of the report
+            with contextlib.redirect_stdout(io.StringIO()):
+                results[label] = run(seconds, games, spectators, interval)
+                flush_writes()
+            frames, size = results[label]
+            per_minute = 60 / seconds / games
+            print(f"{label:>18}: {frames * per_minute:7.1f} frames and {size * per_minute / 1000:7.2f} kB "
+                  f"per idle game-minute")
+        (before, before_bytes), (after, after_bytes) = results.values()
+        reduction = 1 - after_bytes / max(before_bytes, 1)
+        print(f"frames cut by {1 - after / max(before, 1):.0%}, bytes by {reduction:.0%} "
+              f"(target {TARGET_REDUCTION:.0%}: {'yes' if reduction >= TARGET_REDUCTION else 'NO'})")
+    finally:
+        shutil.rmtree(journal_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Move throughput of SimpleServer with one worker process and with several.
+
+Starts the server in cluster mode on a free localhost port, then runs
+client processes that each seat games through the public port (following
+REDIRECTs like simple_client) and play knight moves as fast as the server
+acknowledges them. Reports moves per second for each worker count, so the
+scaling with cores can be read off directly; it can only be near-linear on
+a machine with at least as many free cores as server and client processes.
+
+Usage: python benchmarks/bench_cluster.py [max workers] [client processes] [seconds]
+"""
+import contextlib
+import multiprocessing
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common.framing import FrameReader, encode_message
+from server.cluster import run_workers
+
+GAMES_PER_CLIENT = 4
+MOVES = ["g1f3", "g8f6", "f3g1", "f6g8"]
+
+
+def free_port(count):
+    """A port with `count` free ports after it, for the workers' direct ports"""
+    while True:
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        if port + count < 65536:
+            return port
+
+
+def serve(index, workers, port, journal_dir):
+    import simple_server
+    from server.journal import JournalStore
+    from server.utils import configure_store
+    configure_store(JournalStore(journal_dir, fsync_policy="never"))
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        simple_server.run_worker(index, workers, "threads", port)
+
+
+class Connection:
+    def __init__(self, port):
+        self.sock = socket.create_connection(("127.0.0.1", port))
+        self.reader = FrameReader(self.sock)
+
+    def send(self, message):
+        self.sock.sendall(encode_message(message))
+
+    def until(self, *message_types):
+        while True:
+            message = self.reader.read_message()
+            if message is None:
+                raise RuntimeError(f"Connection lost waiting for {message_types}")
+            if message["type"] in message_types:
+                return message
+
+
+def request(port, message, reply_type):
+    """Send a request on a new connection, following a REDIRECT to the game's worker"""
+    connection = Connection(port)
+    connection.send(message)
+    reply = connection.until(reply_type, "REDIRECT", "ERROR")
+    if reply["type"] == "REDIRECT":
+        connection.sock.close()
+        connection = Connection(reply["port"])
+        connection.send(message)
+        reply = connection.until(reply_type, "ERROR")
+    if reply["type"] != reply_type:
+        raise RuntimeError(f"{message['type']} failed: {reply}")
+    return connection, reply
+
+
+def play(client, port, seconds, results):
+    tables = []
+    for number in range(GAMES_PER_CLIENT):
+        player = f"{client}-{number}"
+        white, created = request(port, {"type": "CREATE_GAME", "player_name": "w", "player_id": f"w{player}",
+                                        "time_limit": 3600}, "GAME_CREATED")
+        black, _ = request(port, {"type": "JOIN_GAME", "player_name": "b", "player_id": f"b{player}",
+                                  "game_id": created["game_id"]}, "GAME_JOINED")
+        white.until("GAME_START")
+        black.until("GAME_START")
+        tables.append((white, black))
+
+    moves = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        # One move in every game, then wait for all of them
+        for ply in range(len(MOVES)):
+            for white, black in tables:
+                (white if ply % 2 == 0 else black).send({"type": "MOVE", "move": MOVES[ply]})
+            for white, black in tables:
+                white.until("BOARD_UPDATE")
+                black.until("BOARD_UPDATE")
+            moves += len(tables)
+    results.put(moves)
+
+
+def measure(workers, clients, seconds):
+    port = free_port(workers + 1)
+    journal_dir = tempfile.mkdtemp(prefix="bench_cluster_")
+    context = multiprocessing.get_context("spawn")
+    server = context.Process(target=run_workers, args=(workers, serve, port, journal_dir), daemon=False)
+    server.start()
+    try:
+        time.sleep(1.5 + 0.2 * workers)
+        results = context.Queue()
+        players = [context.Process(target=play, args=(client, port, seconds, results)) for client in range(clients)]
+        for player in players:
+            player.start()
+        moves = sum(results.get(timeout=seconds + 60) for _ in players)
+        for player in players:
+            player.join()
+        return moves / seconds
+    finally:
+        server.terminate()
+        server.join()
+        shutil.rmtree(journal_dir, ignore_errors=True)
+
+
+def main():
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count() or 1
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 2 * max_workers
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 5.0
+    print(f"{os.cpu_count()} cores, {clients} client processes with {GAMES_PER_CLIENT} games each, {seconds:.0f}s")
+    baseline = None
+    workers = 1
+    while workers <= max_workers:
+        rate = measure(workers, clients, seconds)
+        baseline = baseline or rate
+        print(f"{workers:3d} workers: {rate:9.0f} moves/s  ({rate / baseline:.2f}x one worker)")
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main()
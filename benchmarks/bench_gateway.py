@@ -0,0 +1,52 @@
+"""Games that change node when gateway.py's ring grows or shrinks.
+
+Places a set of game IDs on N nodes with the gateway's consistent-hash ring
+and with plain hash-mod-N, then adds a node and removes one and counts the
+games whose node changed. The ring should move about 1/N of them, the
+ideal, where mod-N moves most. Also reports the share of the busiest node
+and the time per lookup.
+
+Usage: python benchmarks/bench_gateway.py [nodes] [games]
+"""
+import os
+import sys
+import time
+import zlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from gateway import HashRing, new_game_id
+
+
+def modulo_for(nodes):
+    return lambda key: nodes[zlib.crc32(key.encode("utf-8")) % len(nodes)]
+
+
+def moved(keys, before, after):
+    return sum(before(key) != after(key) for key in keys) / len(keys)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    games = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    nodes = [("127.0.0.1", 50010 + index) for index in range(count + 1)]
+    keys = list({new_game_id() for _ in range(games)})
+    print(f"{len(keys)} games on {count} nodes")
+
+    ring = HashRing(nodes[:count])
+    start = time.perf_counter()
+    owners = [ring.node_for(key) for key in keys]
+    lookup = (time.perf_counter() - start) / len(keys)
+    busiest = max(owners.count(node) for node in nodes[:count]) / len(keys)
+    print(f"ring lookup {lookup * 1e6:.1f} us, busiest node {busiest:.1%} (even share {1 / count:.1%})")
+
+    for label, after in (("add a node", nodes), ("remove a node", nodes[:count - 1])):
+        ring_moved = moved(keys, ring.node_for, HashRing(after).node_for)
+        modulo_moved = moved(keys, modulo_for(nodes[:count]), modulo_for(after))
+        ideal = abs(len(after) - count) / max(len(after), count)
+        print(f"{label:>14}: ring moves {ring_moved:6.1%}, mod-N moves {modulo_moved:6.1%} (ideal {ideal:.1%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Cost of persisting one move as the number of live games grows.
+
+Every live game gets a journal with a few plies in it, then moves are
+recorded round-robin across all of them. With the old whole-file JSON
+rewrite a move cost O(live games); with the journal it is one append.
+
+Usage: python benchmarks/bench_journal.py [live_games ...]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.journal import JournalStore
+
+MOVES = 2000
+# Knights out and back, so the position stays legal however long we go
+CYCLE = ["g1f3", "g8f6", "f3g1", "f6g8"]
+
+
+def state_after(ply):
+    return {
+        "board": "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+        "current_player": "white" if ply % 2 == 0 else "black",
+        "players": {"white": "white", "black": "black"},
+        "game_over": False,
+    }
+
+
+def measure(live_games, fsync_policy):
+    directory = tempfile.mkdtemp(prefix="bench_journal_")
+    try:
+        store = JournalStore(directory, fsync_policy=fsync_policy)
+        game_ids = [f"game{i}" for i in range(live_games)]
+        for game_id in game_ids:
+            store.save_state(game_id, state_after(0))
+        plies = {game_id: 0 for game_id in game_ids}
+
+        start = time.perf_counter()
+        for i in range(MOVES):
+            game_id = game_ids[i % live_games]
+            ply = plies[game_id]
+            store.record_move(game_id, CYCLE[ply % len(CYCLE)], state_after(ply + 1))
+            plies[game_id] = ply + 1
+        elapsed = time.perf_counter() - start
+
+        for game_id in game_ids:
+            store.journal(game_id).close()
+        return elapsed / MOVES * 1e6
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    live_counts = [int(arg) for arg in sys.argv[1:]] or [1, 10, 100, 1000]
+    print(f"{'live games':>10} {'never us/move':>14} {'interval us/move':>17}")
+    for count in live_counts:
+        print(f"{count:>10} {measure(count, 'never'):>14.1f} {measure(count, 'interval'):>17.1f}")
+
+
+if __name__ == "__main__":
+    main()
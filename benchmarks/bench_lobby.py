@@ -0,0 +1,110 @@
+"""Cost of GET_GAMES with and without the lobby index.
+
+Fills a SimpleServer (not listening) with games and compares, per request,
+building the whole list by walking every game under its lock, as
+handle_get_games used to, with one page from server.lobby_index. Then it
+makes a number of changes and compares what lobby watchers are sent: the
+LOBBY_DIFFs of the change feed against each watcher polling the whole list
+once per diff interval.
+
+Usage: python benchmarks/bench_lobby.py [games] [changes]
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import simple_server
+from server.lobby_index import DIFF_INTERVAL, PAGE_SIZE
+
+
+class ManualScheduler:
+    """Runs scheduled callbacks only when told to"""
+
+    def __init__(self):
+        self.callbacks = []
+
+    def call_later(self, delay, callback, *args):
+        self.callbacks.append((callback, args))
+
+    def run(self):
+        callbacks, self.callbacks = self.callbacks, []
+        for callback, args in callbacks:
+            callback(*args)
+
+
+def walk_games(server):
+    """The full list as handle_get_games built it before the index"""
+    game_list = []
+    for game_id, game in server.list_games():
+        with game["lock"]:
+            if game["status"] in ["waiting", "playing"]:
+                game_info = {"game_id": game_id, "status": game["status"],
+                             "spectator_count": len(game.get("spectators", [])), "players": {}}
+                for color, player_data in game["players"].items():
+                    game_info["players"][color] = player_data["name"]
+                game_list.append(game_info)
+    return game_list
+
+
+def timed(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    changes = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    server = simple_server.SimpleServer(port=1)
+    server.server_socket.close()
+    scheduler = server.scheduler = ManualScheduler()
+    simple_server.games.clear()
+    for number in range(count):
+        game_id = f"G{number:06d}"
+        game = simple_server.games[game_id] = {
+            "players": {"white": {"name": f"w{number}"}, "black": {"name": f"b{number}"}},
+            "status": "playing" if number % 3 else "waiting",
+            "spectators": [None] * (number % 7),
+            "created_at": 1000000.0 + number,
+            "lock": threading.RLock()
+        }
+        server.publish_game(game_id, game)
+
+    walk, full = timed(lambda: walk_games(server), 20)
+    page, (games, _, _, _) = timed(lambda: server.lobby.page(limit=PAGE_SIZE), 2000)
+    popular, _ = timed(lambda: server.lobby.page("playing", "popular", limit=PAGE_SIZE), 2000)
+    print(f"{count} games")
+    print(f"  whole list, walking games: {walk * 1000:8.3f} ms, {len(json.dumps(full)) / 1000:8.1f} kB")
+    print(f"  page of {PAGE_SIZE}, newest:      {page * 1000:8.3f} ms, {len(json.dumps(games)) / 1000:8.1f} kB")
+    print(f"  page of {PAGE_SIZE}, popular:     {popular * 1000:8.3f} ms")
+
+    diffs = []
+    server.lobby.subscribe(diffs.append)
+    start = time.perf_counter()
+    for number in range(changes):
+        game_id = f"G{number * 7919 % count:06d}"
+        game = simple_server.games[game_id]
+        with game["lock"]:
+            game["spectators"].append(None)
+            server.publish_game(game_id, game)
+        if number % 10 == 9:
+            # Ten changes per diff interval
+            scheduler.run()
+    scheduler.run()
+    elapsed = time.perf_counter() - start
+    feed = sum(len(json.dumps(diff)) for diff in diffs)
+    polled = len(diffs) * len(json.dumps(full))
+    print(f"{changes} changes in {len(diffs)} diffs ({DIFF_INTERVAL:g}s apart), "
+          f"{elapsed / changes * 1e6:.1f} us per change")
+    print(f"  per watcher: {feed / 1000:8.1f} kB of LOBBY_DIFF against {polled / 1000:8.1f} kB polling the list "
+          f"({polled / max(feed, 1):.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Throughput of the matchmaking queue in server.matchmaking.
+
+Queues players with normally distributed ratings on a few time controls,
+cancels and requeues some of them, then runs matching passes one simulated
+second apart, as the servers do every MATCH_INTERVAL, until the windows
+have widened as far as they go. Reports the rate of each operation, the
+players matched per second of pass time against the 50k/s target, and
+how close and how long-waited the pairings were. Last, players arrive one
+at a time and are paired on arrival with find_opponent().
+
+Usage: python benchmarks/bench_matchmaking.py [players]
+"""
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from server.matchmaking import BASE_WINDOW, MAX_RATING, MAX_WINDOW, MIN_RATING, WIDEN_RATE, Matchmaker
+
+TARGET = 50000  # Queued players matched per second
+TIME_CONTROLS = ["1+0", "3+2", "10+0"]
+
+
+def random_rating(rng):
+    return int(min(MAX_RATING, max(MIN_RATING, rng.gauss(1500, 300))))
+
+
+def rate(count, elapsed):
+    return count / elapsed if elapsed else float("inf")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    rng = random.Random(1)
+    players = [(f"p{number}", random_rating(rng), rng.choice(TIME_CONTROLS)) for number in range(count)]
+    matchmaker = Matchmaker(clock=lambda: 0.0)
+
+    start = time.perf_counter()
+    for player_id, rating, time_control in players:
+        matchmaker.enqueue(player_id, rating, time_control, now=0.0)
+    enqueue = time.perf_counter() - start
+
+    leaving = rng.sample(players, count // 10)
+    start = time.perf_counter()
+    for player_id, _, _ in leaving:
+        matchmaker.cancel(player_id)
+    cancel = time.perf_counter() - start
+    for player_id, rating, time_control in leaving:
+        matchmaker.enqueue(player_id, rating, time_control, now=0.0)
+
+    print(f"{count} players on {len(TIME_CONTROLS)} time controls")
+    print(f"  enqueue {rate(count, enqueue):12,.0f}/s   cancel {rate(len(leaving), cancel):12,.0f}/s")
+
+    # Windows stop widening after this long
+    seconds = int((MAX_WINDOW - BASE_WINDOW) / WIDEN_RATE) + 1
+    matched = 0
+    passes = 0.0
+    differences = []
+    waits = []
+    for now in range(seconds + 1):
+        start = time.perf_counter()
+        pairs = matchmaker.match(now=float(now))
+        passes += time.perf_counter() - start
+        matched += 2 * len(pairs)
+        differences.extend(abs(first.rating - second.rating) for first, second in pairs)
+        waits.extend(now - first.queued_at for first, _ in pairs)
+    per_second = rate(matched, passes)
+    print(f"  {seconds + 1} passes: matched {matched} players ({matched / count:.1%}) in {passes * 1000:.1f} ms, "
+          f"{per_second:12,.0f} players/s (target {TARGET:,}: {'met' if per_second >= TARGET else 'NOT met'})")
+    differences.sort()
+    waits.sort()
+    print(f"  rating difference median {differences[len(differences) // 2]}, max {differences[-1]}; "
+          f"wait median {waits[len(waits) // 2]:.0f}s, max {waits[-1]:.0f}s; {len(matchmaker)} still waiting")
+
+    # Players arriving one at a time, a simulated millisecond apart
+    matchmaker = Matchmaker()
+    paired = 0
+    start = time.perf_counter()
+    for number, (player_id, rating, time_control) in enumerate(players):
+        ticket = matchmaker.enqueue(player_id, rating, time_control, now=number / 1000)
+        if matchmaker.find_opponent(ticket, now=number / 1000):
+            paired += 2
+    arrivals = time.perf_counter() - start
+    print(f"  on arrival: {rate(count, arrivals):12,.0f} arrivals/s, {paired / count:.1%} paired straight away")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Move round-trip latency between ChessClientSocket and ChessServer.
+
+Starts a ChessServer on free localhost ports, pairs two clients through the
+lobby and times each move from send_message until the mover receives the
+GAME_UPDATE acknowledging its sequence number. Before the send paths lost
+their fixed 200 ms sleeps a single round-trip took well over 200 ms.
+
+Moves are persisted by a background worker, so the fsync policy of the
+journal should make no difference to the round-trip.
+
+Usage: python benchmarks/bench_move_latency.py [games] [always|interval|never]
+"""
+import contextlib
+import io
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from client.client_socket import ChessClientSocket
+from common.message import Message
+from server.journal import JournalStore
+from server.server import ChessServer
+from server.utils import configure_store, flush_writes, remove_game
+
+TARGET_MS = 5.0
+# Knights out and back three times: 12 plies without a fivefold repetition
+MOVES = ["g1f3", "g8f6", "f3g1", "f6g8"] * 3
+
+
+def receive_until(client, message_type, predicate=None):
+    while True:
+        message = client.receive()
+        if message is None:
+            raise RuntimeError(f"Connection lost waiting for {message_type}")
+        if message.type == message_type and (predicate is None or predicate(message)):
+            return message
+
+
+def play_game(server, number):
+    clients = {}
+    for name in ("a", "b"):
+        client = ChessClientSocket("127.0.0.1", server.port, server.chat_port)
+        client.connect()
+        client.send_message(Message("JOIN_LOBBY", {"player_id": f"bench{number}{name}"}))
+        clients[name] = client
+
+    colors = {}
+    for client in clients.values():
+        start = receive_until(client, "GAME_START")
+        colors[start.data["color"]] = client
+    game_id = start.data["game_id"]
+
+    samples = []
+    for ply, move in enumerate(MOVES):
+        mover = colors["white" if ply % 2 == 0 else "black"]
+        other = colors["black" if ply % 2 == 0 else "white"]
+        started = time.perf_counter()
+        seq = mover.send_message(Message("MOVE", {"move": move}))
+        receive_until(mover, "GAME_UPDATE", lambda m: m.data.get("ack") == seq)
+        samples.append((time.perf_counter() - started) * 1000)
+        receive_until(other, "GAME_UPDATE")
+
+    for client in clients.values():
+        client.close()
+    remove_game(game_id)
+    return samples
+
+
+def main():
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    fsync_policy = sys.argv[2] if len(sys.argv) > 2 else "interval"
+    journal_dir = tempfile.mkdtemp(prefix="bench_journal_")
+    configure_store(JournalStore(journal_dir, fsync_policy=fsync_policy))
+
+    samples = []
+    # The server and clients log every message; keep that out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        server = ChessServer(host="127.0.0.1", port=0, chat_port=0)
+        server.bind()
+        threading.Thread(target=server.serve, daemon=True).start()
+        for number in range(games):
+            samples.extend(play_game(server, number))
+        flush_writes()
+
+    shutil.rmtree(journal_dir, ignore_errors=True)
+
+    samples.sort()
+    median = statistics.median(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{len(samples)} moves over {games} games, journal fsync policy {fsync_policy}")
+    print(f"round-trip ms: median {median:.3f}  p95 {p95:.3f}  max {samples[-1]:.3f}")
+    print(f"median below {TARGET_MS} ms: {'yes' if median < TARGET_MS else 'NO'}")
+
+
+if __name__ == "__main__":
+    main()
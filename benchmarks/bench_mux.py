@@ -0,0 +1,170 @@
+"""Sockets, threads and move latency with and without multiplexing.
+
+Runs the same workload against a ChessServer three times: with every client
+on two connections (PORT and CHAT_PORT), with every client multiplexing game
+and chat on one connection, and multiplexed again with the channels written
+in one FIFO instead of their priority lanes (server.outbound.CHANNEL_PRIORITY).
+Each game plays knight moves while both players flood the game's chat, and
+the move round-trip is timed as in bench_move_latency. The chat rate has to
+be high enough for chat to back up in the server's outbound queues before
+the lanes make a difference. Server and clients share this process, so the
+socket and thread counts cover both sides.
+
+Usage: python benchmarks/bench_mux.py [games] [chat messages per second per player]
+"""
+import contextlib
+import io
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from client.client_socket import ChessClientSocket
+from common.message import Message
+from server import outbound
+from server.journal import JournalStore
+from server.server import ChessServer
+from server.utils import configure_store, flush_writes
+
+MOVES = ["g1f3", "g8f6", "f3g1", "f6g8"] * 3
+CHAT_TEXT = "x" * 200
+
+
+def receive_until(client, message_type, predicate=None):
+    while True:
+        message = client.receive()
+        if message is None:
+            if not client.connected:
+                raise RuntimeError(f"Connection lost waiting for {message_type}")
+            continue
+        if message.type == message_type and (predicate is None or predicate(message)):
+            return message
+
+
+def open_socket_count():
+    count = 0
+    for fd in os.listdir("/proc/self/fd"):
+        try:
+            count += os.readlink(f"/proc/self/fd/{fd}").startswith("socket:")
+        except OSError:
+            # The descriptor listdir itself used
+            pass
+    return count
+
+
+class Table:
+    """Two paired clients, their chat drain threads and chat flooders"""
+
+    def __init__(self, server, number, multiplex, chat_rate):
+        self.clients = {}
+        for name in ("a", "b"):
+            client = ChessClientSocket("127.0.0.1", server.port, server.chat_port, multiplex=multiplex)
+            client.connect()
+            client.send_message(Message("JOIN_LOBBY", {"player_id": f"mux{int(multiplex)}{number}{name}"}))
+            self.clients[name] = client
+        self.colors = {}
+        for client in self.clients.values():
+            start = receive_until(client, "GAME_START")
+            self.colors[start.data["color"]] = client
+        self.game_id = start.data["game_id"]
+        self.chat_rate = chat_rate
+        self.running = True
+
+    def start_chat(self):
+        for client in self.clients.values():
+            threading.Thread(target=self.drain_chat, args=(client,), daemon=True).start()
+            if self.chat_rate:
+                threading.Thread(target=self.flood_chat, args=(client,), daemon=True).start()
+
+    def drain_chat(self, client):
+        while self.running and client.connected:
+            client.receive_chat()
+
+    def flood_chat(self, client):
+        while self.running and client.connected:
+            client.send_chat(Message("CHAT", {"game_id": self.game_id, "message": CHAT_TEXT}))
+            time.sleep(1 / self.chat_rate)
+
+    def play(self):
+        samples = []
+        for ply, move in enumerate(MOVES):
+            mover = self.colors["white" if ply % 2 == 0 else "black"]
+            other = self.colors["black" if ply % 2 == 0 else "white"]
+            started = time.perf_counter()
+            seq = mover.send_message(Message("MOVE", {"move": move}))
+            receive_until(mover, "GAME_UPDATE", lambda m: m.data.get("ack") == seq)
+            samples.append((time.perf_counter() - started) * 1000)
+            receive_until(other, "GAME_UPDATE")
+        return samples
+
+    def close(self):
+        self.running = False
+        for client in self.clients.values():
+            client.close()
+
+
+def run(games, multiplex, chat_rate):
+    server = ChessServer(host="127.0.0.1", port=0, chat_port=0)
+    server.bind()
+    threading.Thread(target=server.serve, daemon=True).start()
+    time.sleep(0.2)
+
+    sockets_before = open_socket_count()
+    threads_before = threading.active_count()
+    tables = [Table(server, number, multiplex, chat_rate) for number in range(games)]
+    # Let the chat connections reach their handler threads
+    time.sleep(0.5)
+    sockets = open_socket_count() - sockets_before
+    threads = threading.active_count() - threads_before
+
+    for table in tables:
+        table.start_chat()
+    samples = []
+    results = []
+    players = [threading.Thread(target=lambda table=table: results.append(table.play())) for table in tables]
+    for thread in players:
+        thread.start()
+    for thread in players:
+        thread.join()
+    for table in tables:
+        table.close()
+    for result in results:
+        samples.extend(result)
+
+    server.server_socket.close()
+    server.chat_socket.close()
+    return sockets, threads, sorted(samples)
+
+
+def main():
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    chat_rate = float(sys.argv[2]) if len(sys.argv) > 2 else 2000.0
+    journal_dir = tempfile.mkdtemp(prefix="bench_mux_")
+    configure_store(JournalStore(journal_dir, fsync_policy="never"))
+
+    print(f"{games} games, each player sending {chat_rate:.0f} chat messages/s")
+    try:
+        for label, multiplex, lanes in (("two sockets", False, True), ("multiplexed", True, True),
+                                        ("multiplexed, one FIFO", True, False)):
+            outbound.CHANNEL_PRIORITY = lanes
+            # The server and clients log every message; keep that out of the report
+            with contextlib.redirect_stdout(io.StringIO()):
+                sockets, threads, samples = run(games, multiplex, chat_rate)
+                flush_writes()
+            clients = 2 * games
+            print(f"{label}: "
+                  f"{sockets / clients:.1f} sockets and {threads / clients:.1f} threads per client "
+                  f"(both sides); move round-trip ms median {statistics.median(samples):.3f} "
+                  f"p95 {samples[int(len(samples) * 0.95) - 1]:.3f} max {samples[-1]:.3f}")
+    finally:
+        shutil.rmtree(journal_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
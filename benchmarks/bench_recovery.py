@@ -0,0 +1,125 @@
+"""Time to recover live games when simple_server restarts.
+
+Fills a temporary store with games in progress, each a snapshot plus a
+journal tail of up to SNAPSHOT_EVERY plies, then times
+SimpleServer.recover_games rebuilding every board and clock from it.
+Restarts have to finish in seconds even with many games in flight.
+
+Usage: python benchmarks/bench_recovery.py [games] [journal|sqlite]
+"""
+import contextlib
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chess
+
+import simple_server
+from server.journal import JournalStore, SNAPSHOT_EVERY
+from server.sqlite_store import SQLiteGameStore
+
+TARGET_SECONDS = 5.0
+MAX_PLIES = 60
+
+
+def random_game(rng, plies):
+    """A legal move sequence of up to `plies` moves and the FENs along the way."""
+    board = chess.Board()
+    moves, fens = [], [board.fen()]
+    for _ in range(plies):
+        legal = list(board.legal_moves)
+        if not legal:
+            break
+        move = rng.choice(legal)
+        board.push(move)
+        moves.append(move.uci())
+        fens.append(board.fen())
+    return moves, fens
+
+
+def game_state(fen, ply, clocks):
+    return {
+        "server": "simple_server",
+        "board": fen,
+        "current_player": "white" if ply % 2 == 0 else "black",
+        "status": "playing",
+        "game_over": False,
+        "time_limit": 300,
+        "created_at": time.time(),
+        "players": {"white": {"name": "w", "id": "w"}, "black": {"name": "b", "id": "b"}},
+        "clocks": clocks,
+    }
+
+
+def fill_store(store, games, rng):
+    """Write `games` games through write_batch, as the persistence worker would.
+
+    Returns {game_id: expected final FEN}.
+    """
+    moves, fens = random_game(rng, MAX_PLIES)
+    expected = {}
+    batch = []
+    for number in range(games):
+        game_id = f"G{number:06d}"
+        plies = rng.randint(0, len(moves))
+        clocks = {"white": 300.0, "black": 300.0}
+        batch.append(("state", game_id, (game_state(fens[0], 0, dict(clocks)),)))
+        for ply in range(plies):
+            clocks["white" if ply % 2 == 0 else "black"] -= 1.5
+            batch.append(("move", game_id, (moves[ply], game_state(fens[ply + 1], ply + 1, dict(clocks)))))
+        expected[game_id] = fens[plies]
+        if len(batch) >= 5000:
+            store.write_batch(batch)
+            batch = []
+    store.write_batch(batch)
+    return expected
+
+
+def main():
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    kind = sys.argv[2] if len(sys.argv) > 2 else "journal"
+    directory = tempfile.mkdtemp(prefix="bench_recovery_")
+    try:
+        if kind == "sqlite":
+            store = SQLiteGameStore(os.path.join(directory, "games.db"))
+        else:
+            store = JournalStore(directory, fsync_policy="never")
+
+        started = time.perf_counter()
+        expected = fill_store(store, games, random.Random(1))
+        print(f"Stored {games} games ({kind}, snapshot every {SNAPSHOT_EVERY} plies) "
+              f"in {time.perf_counter() - started:.2f}s")
+
+        # A fresh store object, as after a restart
+        if kind == "sqlite":
+            store.close()
+            store = SQLiteGameStore(os.path.join(directory, "games.db"))
+        else:
+            store = JournalStore(directory, fsync_policy="never")
+
+        simple_server.games.clear()
+        server = simple_server.SimpleServer()
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            recovered = server.recover_games(store)
+        elapsed = time.perf_counter() - started
+        server.server_socket.close()
+
+        wrong = [game_id for game_id, fen in expected.items()
+                 if simple_server.games[game_id]["board"].fen() != fen]
+        print(f"Recovered {recovered} games in {elapsed:.2f}s "
+              f"({elapsed / max(recovered, 1) * 1e6:.0f} us per game)")
+        print(f"boards matching the last move: {recovered - len(wrong)}/{recovered}")
+        print(f"under {TARGET_SECONDS} s: {'yes' if elapsed < TARGET_SECONDS else 'NO'}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
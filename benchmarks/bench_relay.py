@@ -0,0 +1,136 @@
+"""Origin cost of a watched game with and without a spectator relay.
+
+Starts a SimpleServer and a relay.py on free localhost ports, seats one
+game and adds spectators, either all on the server or, with the relay
+configured and RELAY_THRESHOLD at 0, all redirected to the relay. The two
+players then trade knight moves and the frames the server queues per
+move are counted, along with the time until the last spectator has it.
+Directly the count grows with the audience; through the relay it stays at
+one per player plus one for the relay.
+
+Usage: python benchmarks/bench_relay.py [moves] [spectator counts...]
+"""
+import asyncio
+import contextlib
+import io
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import relay
+import simple_server
+from common.framing import FrameReader, encode_message
+from server.journal import JournalStore
+from server.utils import configure_store, flush_writes
+
+MOVES = ["g1f3", "g8f6", "f3g1", "f6g8"]
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+class Client:
+    def __init__(self, port):
+        self.sock = socket.create_connection(("127.0.0.1", port))
+        self.reader = FrameReader(self.sock)
+
+    def send(self, message):
+        self.sock.sendall(encode_message(message))
+
+    def until(self, message_type):
+        while True:
+            message = self.reader.read_message()
+            if message is None:
+                raise RuntimeError(f"Connection lost waiting for {message_type}")
+            if message["type"] == message_type:
+                return message
+
+
+def spectate(port, game_id, number):
+    request = {"type": "SPECTATE", "player_name": f"s{number}", "player_id": f"s{number}", "game_id": game_id}
+    watcher = Client(port)
+    watcher.send(request)
+    reply = watcher.reader.read_message()
+    if reply["type"] == "REDIRECT":
+        watcher.sock.close()
+        watcher = Client(reply["port"])
+        watcher.send(request)
+        reply = watcher.reader.read_message()
+    if reply["type"] != "SPECTATE_START":
+        raise RuntimeError(f"SPECTATE failed: {reply}")
+    return watcher
+
+
+def run(moves, spectators, relayed):
+    port, relay_port = free_port(), free_port()
+    simple_server.games.clear()
+    simple_server.RELAY_THRESHOLD = 0
+    server = simple_server.SimpleServer(port=port, relays=[("127.0.0.1", relay_port)] if relayed else [])
+    frames = [0]
+    send_bytes = server.send_bytes
+
+    def counting_send_bytes(connection, data, kind=None):
+        frames[0] += 1
+        send_bytes(connection, data, kind)
+
+    server.send_bytes = counting_send_bytes
+    threading.Thread(target=server.start, daemon=True).start()
+    if relayed:
+        node = relay.Relay(("127.0.0.1", port), [], host="127.0.0.1", port=relay_port)
+        threading.Thread(target=lambda: asyncio.run(node.serve()), daemon=True).start()
+    time.sleep(0.3)
+
+    white = Client(port)
+    white.send({"type": "CREATE_GAME", "player_name": "white", "player_id": "w", "time_limit": 3600})
+    game_id = white.until("GAME_CREATED")["game_id"]
+    black = Client(port)
+    black.send({"type": "JOIN_GAME", "player_name": "black", "player_id": "b", "game_id": game_id})
+    white.until("GAME_START")
+    black.until("GAME_START")
+    watchers = [spectate(port, game_id, number) for number in range(spectators)]
+
+    frames[0] = 0
+    start = time.perf_counter()
+    for ply in range(moves):
+        (white if ply % 2 == 0 else black).send({"type": "MOVE", "move": MOVES[ply % len(MOVES)]})
+        for client in [white, black] + watchers:
+            client.until("BOARD_UPDATE")
+    elapsed = time.perf_counter() - start
+    for client in [white, black] + watchers:
+        client.sock.close()
+    server.server_socket.close()
+    return frames[0] / moves, elapsed / moves
+
+
+def main():
+    moves = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    counts = [int(arg) for arg in sys.argv[2:]] or [10, 100, 300]
+    journal_dir = tempfile.mkdtemp(prefix="bench_relay_")
+    configure_store(JournalStore(journal_dir, fsync_policy="never"))
+    print(f"{moves} moves per run")
+    try:
+        for spectators in counts:
+            for relayed in (False, True):
+                # The server and relay log every message; keep that out of the report
+                with contextlib.redirect_stdout(io.StringIO()):
+                    frames, latency = run(moves, spectators, relayed)
+                    flush_writes()
+                label = "via relay" if relayed else "direct"
+                print(f"{spectators:5d} spectators {label:>9}: {frames:7.1f} origin frames per move, "
+                      f"{latency * 1000:7.2f} ms until everyone has it")
+    finally:
+        shutil.rmtree(journal_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
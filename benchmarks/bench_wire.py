@@ -0,0 +1,96 @@
+"""Bytes and CPU per message, JSON against the binary wire format.
+
+Replays the traffic of one game (a BOARD_DELTA or BOARD_UPDATE per move and
+a TIME_UPDATE per second) through encode_message and decode_payload in both
+encodings, and reports what a fan-out to many spectators would send.
+
+Usage: python benchmarks/bench_wire.py [spectators]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chess
+
+from common.framing import encode_message, decode_payload, HEADER
+from common.position import position_hash
+
+PLIES = 80
+SECONDS_PER_PLY = 5
+ROUNDS = 200
+
+
+def game_traffic(delta):
+    """The messages one spectator receives over a game"""
+    rng = random.Random(7)
+    board = chess.Board()
+    clocks = {"white": 300.0, "black": 300.0}
+    server_time = 1.7e9
+    messages = []
+    for _ in range(PLIES):
+        legal = list(board.legal_moves)
+        if not legal:
+            break
+        mover = "white" if board.turn == chess.WHITE else "black"
+        for _ in range(SECONDS_PER_PLY):
+            clocks[mover] -= 1.0 + rng.random() / 100
+            server_time += 1.0
+            messages.append({"type": "TIME_UPDATE", "white_time": clocks["white"],
+                             "black_time": clocks["black"], "server_time": server_time,
+                             "current_player": mover})
+        move = rng.choice(legal)
+        board.push(move)
+        current = "white" if board.turn == chess.WHITE else "black"
+        if delta:
+            messages.append({"type": "BOARD_DELTA", "move": move.uci(), "ply": board.ply(),
+                             "hash": position_hash(board), "current_player": current,
+                             "white_time": round(clocks["white"], 3), "black_time": round(clocks["black"], 3),
+                             "server_time": server_time})
+        else:
+            messages.append({"type": "BOARD_UPDATE", "board": board.fen(), "current_player": current,
+                             "game_over": False, "winner": None,
+                             "white_time": clocks["white"], "black_time": clocks["black"],
+                             "server_time": server_time})
+    return messages
+
+
+def measure(messages, binary):
+    frames = [encode_message(message, binary) for message in messages]
+    size = sum(len(frame) for frame in frames)
+
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        for message in messages:
+            encode_message(message, binary)
+    encode_us = (time.perf_counter() - started) / (ROUNDS * len(messages)) * 1e6
+
+    payloads = [frame[HEADER.size:] for frame in frames]
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        for payload in payloads:
+            decode_payload(payload)
+    decode_us = (time.perf_counter() - started) / (ROUNDS * len(messages)) * 1e6
+    return size, encode_us, decode_us
+
+
+def main():
+    spectators = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    for delta in (False, True):
+        messages = game_traffic(delta)
+        label = "BOARD_DELTA" if delta else "BOARD_UPDATE"
+        print(f"{len(messages)} messages per game with {label} ({PLIES} plies, TIME_UPDATE every second)")
+        results = {}
+        for binary in (False, True):
+            results[binary] = measure(messages, binary)
+            size, encode_us, decode_us = results[binary]
+            print(f"  {'binary' if binary else 'json  '}: {size / len(messages):6.1f} bytes/msg  "
+                  f"encode {encode_us:5.2f} us  decode {decode_us:5.2f} us  "
+                  f"{size * spectators / 1e6:8.2f} MB to {spectators} spectators")
+        print(f"  binary sends {results[True][0] / results[False][0]:.0%} of the JSON bytes")
+
+
+if __name__ == "__main__":
+    main()
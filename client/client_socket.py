@@ -1,37 +1,72 @@
+import queue
 import socket
-import time
+import threading
 from common.constants import HOST, PORT, CHAT_PORT
 from common.message import Message
-import json
+from common.framing import FrameReader, FrameError
+from common.mux import CHAT, CONTROL, decode_channel_payload, encode_channel_frame
 
 class ChessClientSocket:
-    def __init__(self):
+    """Client side of the ChessServer protocol.
+
+    By default game messages and chat use separate connections to PORT and
+    CHAT_PORT. With multiplex=True both share one connection to PORT (see
+    common.mux): receive() reads every channel and sets chat aside for
+    receive_chat(), so a thread must keep calling receive().
+
+    The server pings connections that have been quiet for a while; the
+    receive methods answer those PINGs themselves.
+    """
+
+    def __init__(self, host=HOST, port=PORT, chat_port=CHAT_PORT, multiplex=False):
+        self.host = host
+        self.port = port
+        self.chat_port = chat_port
+        self.multiplex = multiplex
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.chat_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.reader = FrameReader(self.sock)
+        if multiplex:
+            self.chat_sock = None
+            self.chat_reader = None
+            self.chat_inbox = queue.Queue()  # Chat messages read by receive()
+        else:
+            self.chat_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.chat_reader = FrameReader(self.chat_sock)
         self.connected = False
+        self.pending = []  # Frames queued by send_message(flush=False)
+        self.send_lock = threading.Lock()  # PONGs are sent from the receiving thread
+        # Chat and flush() may run on other threads than send_message()
+        self.pending_lock = threading.Lock()  # Guards seq and pending
+        self.seq = 0  # Sequence number of the last message sent
+        self.acked_seq = 0  # Highest sequence number the server has acknowledged
 
     def connect(self):
         try:
             # Set a shorter connection timeout for initial connection
             self.sock.settimeout(5.0)
-            self.chat_sock.settimeout(5.0)
 
             # Try to connect to the main server
-            print(f"Connecting to server at {HOST}:{PORT}...")
-            self.sock.connect((HOST, PORT))
+            print(f"Connecting to server at {self.host}:{self.port}...")
+            self.sock.connect((self.host, self.port))
             self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            # Moves are tiny; send them now instead of waiting to coalesce
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
-            # Try to connect to the chat server
-            print(f"Connecting to chat server at {HOST}:{CHAT_PORT}...")
-            self.chat_sock.connect((HOST, CHAT_PORT))
-            self.chat_sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-
-            # Set longer timeouts for normal operation
             self.sock.settimeout(60.0)
-            self.chat_sock.settimeout(60.0)
+
+            if self.chat_sock is not None:
+                # Try to connect to the chat server
+                print(f"Connecting to chat server at {self.host}:{self.chat_port}...")
+                self.chat_sock.settimeout(5.0)
+                self.chat_sock.connect((self.host, self.chat_port))
+                self.chat_sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+                self.chat_sock.settimeout(60.0)
 
             self.connected = True
-            print("Successfully connected to server and chat server")
+            if self.multiplex:
+                print("Successfully connected to server, multiplexing chat on the same connection")
+            else:
+                print("Successfully connected to server and chat server")
         except socket.timeout:
             print("Connection timed out. Server might not be running.")
             self.connected = False
@@ -42,29 +77,59 @@ class ChessClientSocket:
             print(f"Error connecting to server: {e}")
             self.connected = False
 
-    def send_message(self, message):
+    def send_message(self, message, flush=True):
+        """Send a message to the game server and return its sequence number.
+
+        The sequence number is stored in message.data["seq"]; the server
+        echoes it as "ack" once the move has been applied. With flush=False
+        the frame is only queued, so several messages can be pipelined and
+        written together by flush().
+        """
         if not self.connected:
             print("Cannot send message: Not connected to server")
-            return
+            return None
+        with self.pending_lock:
+            self.seq += 1
+            seq = message.data["seq"] = self.seq
+            self.pending.append(encode_channel_frame(message) if self.multiplex else message.to_frame())
+        print(f"Sending message: {message.type} (seq {seq})")
+        if flush:
+            self.flush()
+        return seq
+
+    def flush(self):
+        """Write every queued frame in a single sendall."""
         try:
-            json_data = message.to_json()
-            print(f"Sending message: {json_data}")
-            self.sock.send(json_data.encode('utf-8'))
-            time.sleep(0.2)  # Increased delay to ensure server processes the message
+            # Taking the frames under send_lock keeps concurrent flushes in order
+            with self.send_lock:
+                with self.pending_lock:
+                    frames, self.pending = self.pending, []
+                if not frames:
+                    return
+                self.sock.sendall(b"".join(frames))
         except Exception as e:
             print(f"Error sending message: {e}")
             self.connected = False
             raise
 
+    def unacked(self):
+        """Number of messages sent since the last acknowledgement."""
+        return self.seq - self.acked_seq
+
     def send_chat(self, message):
         if not self.connected:
             print("Cannot send chat: Not connected to server")
             return
         try:
-            json_data = message.to_json()
-            print(f"Sending chat message: {json_data}")
-            self.chat_sock.send(json_data.encode('utf-8'))
-            time.sleep(0.2)  # Increased delay to ensure server processes the message
+            print(f"Sending chat message: {message.data}")
+            if self.multiplex:
+                # Queued game messages go first
+                with self.pending_lock:
+                    self.pending.append(encode_channel_frame(message, CHAT))
+                self.flush()
+            else:
+                with self.send_lock:
+                    self.chat_sock.sendall(message.to_frame())
         except Exception as e:
             print(f"Error sending chat: {e}")
             self.connected = False
@@ -75,32 +140,41 @@ class ChessClientSocket:
             print("Cannot receive message: Not connected to server")
             return None
         try:
-            self.sock.settimeout(5.0)  # Set timeout for receiving
-            data = self.sock.recv(1024).decode('utf-8')
-            self.sock.settimeout(None)  # Reset timeout
-            if not data:
-                print("Server closed connection")
-                self.connected = False
-                return None
-                
-            # Handle potential JSON parsing errors
-            try:
-                return Message.from_json(data)
-            except json.JSONDecodeError as e:
-                print(f"JSON decode error: {e}")
-                print(f"Problematic data: {data}")
-                # Try to recover by extracting valid JSON if possible
+            while True:
+                self.sock.settimeout(5.0)  # Set timeout for receiving
+                payload = self.reader.read_payload()
+                self.sock.settimeout(None)  # Reset timeout
+                if payload is None:
+                    print("Server closed connection")
+                    self.connected = False
+                    return None
+
+                # Frames are self-delimiting, so a bad payload only costs that one message
                 try:
-                    # Find the first '{' and last '}' to extract potential valid JSON
-                    start = data.find('{')
-                    end = data.rfind('}') + 1
-                    if start >= 0 and end > start:
-                        valid_json = data[start:end]
-                        return Message.from_json(valid_json)
-                except:
-                    pass
-                self.connected = False
-                return None
+                    if self.multiplex:
+                        channel, message = decode_channel_payload(payload)
+                    else:
+                        channel, message = None, Message.from_json(payload)
+                except (ValueError, KeyError) as e:
+                    print(f"JSON decode error: {e}")
+                    print(f"Problematic data: {payload}")
+                    return None
+                if message.type == "PING":
+                    self.send_pong(self.sock, message, CONTROL if self.multiplex else None)
+                elif message.type == "PONG":
+                    continue
+                elif channel != CHAT:
+                    break
+                else:
+                    self.chat_inbox.put(message)
+            ack = message.data.get("ack") if isinstance(message.data, dict) else None
+            if ack is not None:
+                self.acked_seq = max(self.acked_seq, ack)
+            return message
+        except FrameError as e:
+            print(f"Framing error, dropping connection: {e}")
+            self.connected = False
+            return None
         except socket.timeout:
             print("Timeout waiting for server message")
             return None
@@ -117,14 +191,23 @@ class ChessClientSocket:
         if not self.connected:
             print("Cannot receive chat: Not connected to server")
             return None
-        try:
-            data = self.chat_sock.recv(1024)
-            if not data:
-                print("Received empty data from chat server")
+        if self.multiplex:
+            try:
+                return self.chat_inbox.get(timeout=60.0)
+            except queue.Empty:
+                print("Timeout waiting for chat message")
                 return None
-            data_str = data.decode('utf-8')
-            print(f"Raw chat data received: {data_str}")
-            return Message.from_json(data_str)
+        try:
+            while True:
+                data = self.chat_reader.read_message()
+                if not data:
+                    print("Received empty data from chat server")
+                    return None
+                print(f"Raw chat data received: {data}")
+                message = Message.from_dict(data)
+                if message.type != "PING":
+                    return message
+                self.send_pong(self.chat_sock, message)
         except socket.timeout:
             print("Timeout waiting for chat message")
             return None
@@ -137,10 +220,19 @@ class ChessClientSocket:
             self.connected = False
             raise
 
+    def send_pong(self, sock, ping, channel=None):
+        """Answer a heartbeat PING from the server"""
+        pong = Message("PONG", {"id": ping.data.get("id")})
+        with self.send_lock:
+            sock.sendall(encode_channel_frame(pong, channel) if channel is not None else pong.to_frame())
+
     def close(self):
         try:
             self.sock.close()
-            self.chat_sock.close()
+            if self.chat_sock is not None:
+                self.chat_sock.close()
+            else:
+                self.chat_inbox.put(None)  # Wakes up receive_chat()
             self.connected = False
             print("Client sockets closed")
         except Exception as e:
@@ -0,0 +1,160 @@
+import struct
+
+# Compact binary payloads for the messages sent many times a second.
+#
+# A binary payload starts with a tag byte below 0x20, which a JSON payload
+# (always starting with "{") never does, so a receiver can decode either
+# without knowing what was negotiated. Message types without a layout here
+# are always sent as JSON.
+#
+# Moves are 16-bit codes: from square | to square << 6 | promotion << 12,
+# squares numbered a1=0 .. h8=63 and promotion 0 (none) or 1-4 (n, b, r, q).
+# Clocks are whole milliseconds, and so is the server's wall-clock time they
+# were read at (server_time, milliseconds since the epoch). The flags byte packs the side to move
+# (bit 0 set for black), game over (bit 1) and the winner (bits 2-3).
+
+MOVE_TAG = 0x01
+BOARD_DELTA_TAG = 0x02
+TIME_UPDATE_TAG = 0x03
+BOARD_UPDATE_TAG = 0x04
+
+MOVE = struct.Struct("!BH")
+BOARD_DELTA = struct.Struct("!BHHQIIQB")  # tag, move, ply, hash, white ms, black ms, server ms, flags
+TIME_UPDATE = struct.Struct("!BIIQB")  # tag, white ms, black ms, server ms, flags
+BOARD_UPDATE = struct.Struct("!BIIQB")  # tag, white ms, black ms, server ms, flags; the FEN follows
+
+PROMOTIONS = "nbrq"
+WINNERS = (None, "white", "black", "draw")
+
+# Keys each layout carries; a message with any other key is sent as JSON
+MOVE_KEYS = {"type", "move"}
+BOARD_DELTA_KEYS = {"type", "move", "ply", "hash", "current_player", "white_time", "black_time",
+                    "server_time", "game_over", "winner"}
+TIME_UPDATE_KEYS = {"type", "white_time", "black_time", "server_time", "current_player"}
+BOARD_UPDATE_KEYS = {"type", "board", "current_player", "game_over", "winner", "white_time", "black_time",
+                     "server_time"}
+
+
+def is_binary(payload):
+    return len(payload) > 0 and payload[0] < 0x20
+
+
+def encode_move(uci):
+    """UCI move string -> 16-bit move code"""
+    if len(uci) not in (4, 5):
+        raise ValueError(f"Not a UCI move: {uci!r}")
+    code = _square(uci[0:2]) | _square(uci[2:4]) << 6
+    if len(uci) == 5:
+        code |= (PROMOTIONS.index(uci[4]) + 1) << 12
+    return code
+
+
+def decode_move(code):
+    """16-bit move code -> UCI move string"""
+    uci = _square_name(code & 0x3F) + _square_name(code >> 6 & 0x3F)
+    promotion = code >> 12 & 0x7
+    if promotion:
+        uci += PROMOTIONS[promotion - 1]
+    return uci
+
+
+def encode_binary(message):
+    """Encode a message dict as a binary payload, or return None if it has no binary layout."""
+    kind = message.get("type")
+    try:
+        if kind == "MOVE" and message.keys() <= MOVE_KEYS:
+            return MOVE.pack(MOVE_TAG, encode_move(message["move"]))
+        if kind == "BOARD_DELTA" and message.keys() <= BOARD_DELTA_KEYS:
+            return BOARD_DELTA.pack(
+                BOARD_DELTA_TAG, encode_move(message["move"]), message["ply"], int(message["hash"], 16),
+                _millis(message["white_time"]), _millis(message["black_time"]),
+                _millis(message["server_time"]), _flags(message))
+        if kind == "TIME_UPDATE" and message.keys() <= TIME_UPDATE_KEYS:
+            return TIME_UPDATE.pack(
+                TIME_UPDATE_TAG, _millis(message["white_time"]), _millis(message["black_time"]),
+                _millis(message["server_time"]), _flags(message))
+        if kind == "BOARD_UPDATE" and message.keys() <= BOARD_UPDATE_KEYS:
+            return BOARD_UPDATE.pack(
+                BOARD_UPDATE_TAG, _millis(message["white_time"]), _millis(message["black_time"]),
+                _millis(message["server_time"]), _flags(message)) + message["board"].encode("ascii")
+    except (KeyError, ValueError, TypeError, struct.error):
+        # Out-of-range or malformed fields; JSON can still carry them
+        return None
+    return None
+
+
+def decode_binary(payload):
+    """Decode a binary payload into the dict its JSON form would give.
+
+    Raises ValueError for a payload that is not a valid binary message.
+    """
+    try:
+        return _decode(payload)
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise ValueError(f"Malformed binary message: {e}")
+
+
+def _decode(payload):
+    tag = payload[0]
+    if tag == MOVE_TAG:
+        _, move = MOVE.unpack(payload)
+        return {"type": "MOVE", "move": decode_move(move)}
+    if tag == BOARD_DELTA_TAG:
+        _, move, ply, position_hash, white_ms, black_ms, server_ms, flags = BOARD_DELTA.unpack(payload)
+        message = {
+            "type": "BOARD_DELTA",
+            "move": decode_move(move),
+            "ply": ply,
+            "hash": format(position_hash, "016x"),
+            "current_player": "black" if flags & 1 else "white",
+            "white_time": white_ms / 1000,
+            "black_time": black_ms / 1000,
+            "server_time": server_ms / 1000
+        }
+        if flags & 2:
+            message["game_over"] = True
+            message["winner"] = WINNERS[flags >> 2 & 3]
+        return message
+    if tag == TIME_UPDATE_TAG:
+        _, white_ms, black_ms, server_ms, flags = TIME_UPDATE.unpack(payload)
+        return {
+            "type": "TIME_UPDATE",
+            "white_time": white_ms / 1000,
+            "black_time": black_ms / 1000,
+            "server_time": server_ms / 1000,
+            "current_player": "black" if flags & 1 else "white"
+        }
+    if tag == BOARD_UPDATE_TAG:
+        _, white_ms, black_ms, server_ms, flags = BOARD_UPDATE.unpack_from(payload)
+        return {
+            "type": "BOARD_UPDATE",
+            "board": payload[BOARD_UPDATE.size:].decode("ascii"),
+            "current_player": "black" if flags & 1 else "white",
+            "game_over": bool(flags & 2),
+            "winner": WINNERS[flags >> 2 & 3],
+            "white_time": white_ms / 1000,
+            "black_time": black_ms / 1000,
+            "server_time": server_ms / 1000
+        }
+    raise ValueError(f"Unknown binary message tag {tag:#04x}")
+
+
+def _square(name):
+    if len(name) != 2 or name[0] not in "abcdefgh" or name[1] not in "12345678":
+        raise ValueError(f"Not a square: {name!r}")
+    return (ord(name[0]) - ord("a")) | (int(name[1]) - 1) << 3
+
+
+def _square_name(square):
+    return chr(ord("a") + (square & 7)) + str((square >> 3) + 1)
+
+
+def _millis(seconds):
+    return max(0, int(round(seconds * 1000)))
+
+
+def _flags(message):
+    flags = 1 if message.get("current_player") == "black" else 0
+    if message.get("game_over"):
+        flags |= 2 | WINNERS.index(message.get("winner")) << 2
+    return flags
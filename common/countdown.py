@@ -0,0 +1,54 @@
+import time
+
+
+class Countdown:
+    """A client's view of the game clocks.
+
+    The server only sends the clocks when something changes them (moves,
+    game start, rejoin, resync) plus an occasional TIME_UPDATE correction.
+    Between readings the player on move is counted down locally.
+    """
+
+    def __init__(self, seconds=300):
+        self.white_time = seconds
+        self.black_time = seconds
+        self.read_at = self.now()  # When the reading above was taken, on our clock
+        self.server_time = None  # server_time of that reading
+        self.paused = True
+
+    @staticmethod
+    def now():
+        return time.monotonic()
+
+    def reset(self, seconds):
+        """Both clocks back to the full time of a new game"""
+        self.white_time = self.black_time = seconds
+
+    def update(self, message, now=None):
+        """Take the clocks in a message as the new reading to count down from.
+
+        A reading older than ours by server_time has been overtaken and is
+        ignored. Returns True if the reading was taken.
+        """
+        server_time = message.get("server_time")
+        if server_time is not None and self.server_time is not None and server_time < self.server_time:
+            return False
+        self.white_time = message.get("white_time", self.white_time)
+        self.black_time = message.get("black_time", self.black_time)
+        self.server_time = server_time
+        self.paused = message.get("clock_paused", False)
+        self.read_at = self.now() if now is None else now
+        return True
+
+    def time_left(self, color, on_move, now=None):
+        """Time left on a player's clock now; `on_move` is the player whose clock runs, or None"""
+        seconds = self.white_time if color == "white" else self.black_time
+        if color == on_move and not self.paused:
+            seconds -= (self.now() if now is None else now) - self.read_at
+        return max(0, seconds)
+
+    def stop(self, on_move, now=None):
+        """Freeze both clocks where they are, as at GAME_OVER"""
+        self.white_time = self.time_left("white", on_move, now)
+        self.black_time = self.time_left("black", on_move, now)
+        self.paused = True
@@ -0,0 +1,141 @@
+import asyncio
+import json
+import struct
+from collections import deque
+
+from common.binary import encode_binary, decode_binary, is_binary
+
+# Every frame on the wire is a 4-byte big-endian payload length followed by
+# the payload itself, so a reader never has to guess where a message ends.
+HEADER = struct.Struct("!I")
+MAX_FRAME_SIZE = 1024 * 1024
+RECV_SIZE = 65536
+
+
+class FrameError(ValueError):
+    """Raised when the byte stream does not contain a valid frame."""
+
+
+def encode_frame(payload):
+    """Prefix a payload (bytes) with its length."""
+    if len(payload) > MAX_FRAME_SIZE:
+        raise FrameError(f"Frame of {len(payload)} bytes exceeds the {MAX_FRAME_SIZE} byte limit")
+    return HEADER.pack(len(payload)) + payload
+
+
+def encode_message(message, binary=False):
+    """Serialize a dict or a common.message.Message into a complete frame.
+
+    With binary=True, dicts with a layout in common.binary are sent in that
+    compact form; everything else is JSON.
+    """
+    if hasattr(message, "to_json"):
+        payload = message.to_json().encode('utf-8')
+    else:
+        payload = encode_binary(message) if binary else None
+        if payload is None:
+            payload = json.dumps(message).encode('utf-8')
+    return encode_frame(payload)
+
+
+def decode_payload(payload):
+    """Turn a frame payload, JSON or binary, back into a dict."""
+    if is_binary(payload):
+        return decode_binary(payload)
+    return json.loads(payload.decode('utf-8'))
+
+
+class FrameDecoder:
+    """Streaming decoder that accepts arbitrary chunks of bytes.
+
+    A chunk may hold part of a frame, exactly one frame or several frames;
+    incomplete data is kept until the rest of the frame arrives.
+    """
+
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE):
+        self.max_frame_size = max_frame_size
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """Add received bytes and return the list of complete payloads."""
+        self.buffer += data
+        payloads = []
+        offset = 0
+        buffered = len(self.buffer)
+        while buffered - offset >= HEADER.size:
+            (length,) = HEADER.unpack_from(self.buffer, offset)
+            if length > self.max_frame_size:
+                raise FrameError(f"Frame of {length} bytes exceeds the {self.max_frame_size} byte limit")
+            end = offset + HEADER.size + length
+            if end > buffered:
+                break
+            payloads.append(bytes(self.buffer[offset + HEADER.size:end]))
+            offset = end
+        if offset:
+            del self.buffer[:offset]
+        return payloads
+
+    def feed_messages(self, data):
+        """Like feed, but decodes each payload into a dict."""
+        return [decode_payload(payload) for payload in self.feed(data)]
+
+    def has_partial_frame(self):
+        return len(self.buffer) > 0
+
+
+class FrameReader:
+    """Reads whole messages from a blocking socket.
+
+    Every recv pulls in as much data as is available, so a burst of messages
+    costs one system call; the extra messages are handed out by later calls.
+    Socket timeouts propagate to the caller without losing buffered data.
+    """
+
+    def __init__(self, sock, max_frame_size=MAX_FRAME_SIZE):
+        self.sock = sock
+        self.decoder = FrameDecoder(max_frame_size)
+        self.pending = deque()
+
+    def read_payload(self):
+        """Return the next payload, or None when the peer closed the connection."""
+        while not self.pending:
+            data = self.sock.recv(RECV_SIZE)
+            if not data:
+                return None
+            self.pending.extend(self.decoder.feed(data))
+        return self.pending.popleft()
+
+    def read_message(self):
+        """Return the next message as a dict, or None when the peer closed the connection."""
+        payload = self.read_payload()
+        if payload is None:
+            return None
+        return decode_payload(payload)
+
+
+async def read_payload_async(reader):
+    """Read one frame's payload from an asyncio.StreamReader.
+
+    Returns None if the stream ended cleanly between frames.
+    """
+    try:
+        header = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise FrameError("Connection closed in the middle of a frame header")
+        return None
+    (length,) = HEADER.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise FrameError(f"Frame of {length} bytes exceeds the {MAX_FRAME_SIZE} byte limit")
+    return await reader.readexactly(length)
+
+
+async def read_message_async(reader):
+    """Read one message from an asyncio.StreamReader.
+
+    Returns None if the stream ended cleanly between frames.
+    """
+    payload = await read_payload_async(reader)
+    if payload is None:
+        return None
+    return decode_payload(payload)
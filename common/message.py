@@ -1,4 +1,5 @@
 import json
+from common.framing import encode_frame
 
 class Message:
     def __init__(self, type, data):
@@ -8,7 +9,15 @@ class Message:
     def to_json(self):
         return json.dumps({"type": self.type, "data": self.data})
 
+    def to_frame(self):
+        """Serialize the message as a length-prefixed frame ready to send."""
+        return encode_frame(self.to_json().encode('utf-8'))
+
     @staticmethod
     def from_json(json_str):
         data = json.loads(json_str)
-        return Message(data["type"], data["data"])
\ No newline at end of file
+        return Message(data["type"], data["data"])
+
+    @staticmethod
+    def from_dict(data):
+        return Message(data["type"], data["data"])
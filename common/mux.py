@@ -0,0 +1,59 @@
+from common.framing import encode_frame
+from common.message import Message
+
+# Multiplexed connections to server.server.ChessServer.
+#
+# A multiplexed client talks to the game port only: game, chat and control
+# messages share the one socket instead of chat having its own connection to
+# CHAT_PORT. Every payload starts with a channel byte followed by the usual
+# Message JSON. The channel byte is below 0x20, which a plain JSON payload
+# (always starting with "{") never is, so the server recognises a
+# multiplexed client from its first frame.
+#
+# On the server each channel is an outbound lane: queued game frames are
+# written before queued control frames, and those before chat, so moves
+# are not held up behind a burst of chat.
+
+CONTROL = 0
+GAME = 1
+CHAT = 2
+
+CHANNEL_NAMES = {CONTROL: "control", GAME: "game", CHAT: "chat"}
+# Outbound lane of each channel, lowest first
+CHANNEL_LANES = {GAME: 0, CONTROL: 1, CHAT: 2}
+LANES = len(CHANNEL_LANES)
+
+GAME_TYPES = {"MOVE", "GAME_START", "GAME_UPDATE", "INVALID_MOVE", "SPECTATE_START"}
+
+
+def channel_for(message_type):
+    """The channel a message of the given type travels on."""
+    if message_type == "CHAT":
+        return CHAT
+    if message_type in GAME_TYPES:
+        return GAME
+    return CONTROL
+
+
+def is_channel_payload(payload):
+    return len(payload) > 0 and payload[0] in CHANNEL_NAMES
+
+
+def encode_channel_frame(message, channel=None):
+    """Frame a Message for a multiplexed connection, on its type's channel by default."""
+    if channel is None:
+        channel = channel_for(message.type)
+    return encode_frame(bytes([channel]) + message.to_json().encode('utf-8'))
+
+
+def decode_channel_payload(payload):
+    """Split a multiplexed payload into (channel, Message).
+
+    Raises ValueError for an unknown channel or a body that is not a message.
+    """
+    if not is_channel_payload(payload):
+        raise ValueError(f"Not a multiplexed payload: {payload[:1]!r}")
+    try:
+        return payload[0], Message.from_json(payload[1:])
+    except (UnicodeDecodeError, KeyError, TypeError) as e:
+        raise ValueError(f"Malformed multiplexed message: {e}")
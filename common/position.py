@@ -0,0 +1,10 @@
+import chess.polyglot
+
+
+def position_hash(board):
+    """Zobrist hash of a position as 16 hex digits.
+
+    Sent with every BOARD_DELTA so a client can check that pushing the move
+    on its own board gave the same position as on the server.
+    """
+    return format(chess.polyglot.zobrist_hash(board), "016x")
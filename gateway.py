@@ -0,0 +1,538 @@
+import asyncio
+import bisect
+import hashlib
+import random
+import sys
+import time
+
+from common.framing import HEADER, encode_message, decode_payload, read_message_async, read_payload_async
+from server.clock import TimeControl
+from server.lobby_index import PAGE_FIELDS, PAGE_SIZE, merge_pages, wants_page
+
+# Front gateway for several SimpleServer nodes.
+#
+# Clients connect to the gateway exactly as they would to a single
+# simple_server.py. The gateway reads the first request of a connection,
+# picks the node that has (or will have) the game, replays the request there
+# and from then on relays bytes both ways, so moves, clocks, heartbeats and
+# the binary encoding all pass through untouched.
+#
+# Games are placed on a consistent-hash ring of the live nodes, keyed by game
+# ID. The gateway chooses the ID of every new game and asks the node to use
+# it, so it can route JOIN_GAME, SPECTATE, REJOIN_GAME and RESUME without
+# asking anyone. When a node joins or leaves, only the games on the arcs it
+# takes or gives up change owner, and games already being played on a node
+# are pinned to it until they finish, so nothing in progress moves.
+#
+# GET_GAMES, including from a lobby connection, is answered with the games of
+# every node. A paged request goes to every node and their pages are merged
+# into one, in the same GAME_LIST format a single node sends. A subscribing
+# client gets the merged first page, then the LOBBY_DIFFs of every node,
+# which the gateway subscribes to on its own connection to each.
+#
+# Matchmaking only pairs players on the same time control, so every
+# JOIN_LOBBY for one time control goes to the same node, the one the ring
+# gives its lobby key. The node picks the ID of a game it matches, so the
+# gateway pins that game to it when it sees the MATCH_FOUND.
+#
+# Nodes on the same host each need their own port and journal, e.g.
+#   python simple_server.py --port 50010 --journal journal-50010
+
+HOST = "0.0.0.0"
+PORT = 50004  # Where clients connect, the port simple_client uses
+NODES = [("127.0.0.1", 50010), ("127.0.0.1", 50011)]  # Backend SimpleServer nodes, overridable with --node
+VIRTUAL_NODES = 100  # Points per node on the ring; more points even out each node's share
+HEALTH_INTERVAL = 2.0  # Seconds between checks of every node
+NODE_TIMEOUT = 2.0  # Seconds a node has to accept a connection or answer GET_GAMES
+ROUTED_TYPES = {"JOIN_GAME", "SPECTATE", "REJOIN_GAME", "RESUME"}
+LOBBY_TIME_LIMIT = 300  # SimpleServer's DEFAULT_TIME_LIMIT, for a JOIN_LOBBY without time_limit
+RELAY_CHUNK = 65536
+
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent-hash ring of nodes, each at VIRTUAL_NODES points.
+
+    A key belongs to the first node point at or after its hash, wrapping
+    around, so adding a node only takes keys from the arcs its points land
+    on and removing one only hands its own keys to their next points.
+    """
+
+    def __init__(self, nodes=(), replicas=VIRTUAL_NODES):
+        self.replicas = replicas
+        self.points = []  # Sorted (hash, node)
+        self.nodes = set()
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for replica in range(self.replicas):
+            bisect.insort(self.points, (ring_hash(f"{node_name(node)}#{replica}"), node))
+
+    def remove(self, node):
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        self.points = [point for point in self.points if point[1] != node]
+
+    def node_for(self, key):
+        """The node a key belongs to, or None if the ring is empty"""
+        if not self.points:
+            return None
+        index = bisect.bisect_left(self.points, (ring_hash(key),))
+        return self.points[index % len(self.points)][1]
+
+
+def node_name(node):
+    host, port = node
+    return f"{host}:{port}"
+
+
+def lobby_key(message):
+    """Ring key of the node that matches a JOIN_LOBBY: one per time control"""
+    try:
+        time_control = TimeControl.parse(message.get("time_limit", LOBBY_TIME_LIMIT))
+    except ValueError:
+        # The node answers with an ERROR; any node will do for that
+        return "lobby"
+    return f"lobby/{time_control.base:g}+{time_control.increment:g}d{time_control.delay:g}"
+
+
+def new_game_id():
+    """A game ID in the same style as SimpleServer's: 3 letters and 3 digits"""
+    letters = 'ABCDEFGHJKLMNPQRSTUVWXYZ'
+    numbers = '23456789'
+    return ''.join(random.choice(letters) for _ in range(3)) + ''.join(random.choice(numbers) for _ in range(3))
+
+
+class Gateway:
+    def __init__(self, nodes=None, host=HOST, port=PORT):
+        self.configured = list(nodes or NODES)
+        self.host = host
+        self.port = port
+        # Every node counts as live until a health check says otherwise
+        self.ring = HashRing(self.configured)
+        self.pins = {}  # game_id -> node, for live games the ring now places elsewhere
+        self.pinned_at = {}  # game_id -> when it was pinned
+        self.node_games = {node: [] for node in self.configured}  # Last game list of each node
+
+    def start(self):
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            print("Gateway stopped")
+
+    async def serve(self):
+        await self.check_nodes()
+        server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        print(f"Gateway on {self.host}:{self.port} for {', '.join(node_name(node) for node in self.configured)}")
+        asyncio.create_task(self.health_loop())
+        async with server:
+            await server.serve_forever()
+
+    def node_for(self, game_id):
+        return self.pins.get(game_id) or self.ring.node_for(game_id)
+
+    def pin(self, game_id, node):
+        self.pins[game_id] = node
+        self.pinned_at[game_id] = time.monotonic()
+
+    # Node membership
+
+    async def health_loop(self):
+        while True:
+            await asyncio.sleep(HEALTH_INTERVAL)
+            try:
+                await self.check_nodes()
+            except Exception as e:
+                print(f"Error checking nodes: {e}")
+
+    async def check_nodes(self):
+        """List every node's games; nodes that do not answer leave the ring, ones that do (re)join it"""
+        started = time.monotonic()
+        results = await asyncio.gather(*(self.fetch_games(node) for node in self.configured),
+                                       return_exceptions=True)
+        live = set()
+        for node, result in zip(self.configured, results):
+            if isinstance(result, BaseException):
+                if node in self.ring.nodes:
+                    print(f"Node {node_name(node)} is down: {result}")
+                continue
+            live.add(node)
+            self.node_games[node] = result
+        if live != self.ring.nodes:
+            self.rebalance(live)
+        self.prune_pins(started)
+
+    def rebalance(self, live):
+        """Move the ring to the live nodes, pinning games in progress to where they are"""
+        ring = HashRing(live, self.ring.replicas)
+        moved = 0
+        for node in live:
+            for game in self.node_games[node]:
+                game_id = game["game_id"]
+                if ring.node_for(game_id) != node:
+                    self.pin(game_id, node)
+                    moved += 1
+        for node in self.ring.nodes - live:
+            self.node_games[node] = []
+        joined = sorted(node_name(node) for node in live - self.ring.nodes)
+        left = sorted(node_name(node) for node in self.ring.nodes - live)
+        print(f"Ring now {len(live)} nodes (joined {joined}, left {left}); {moved} games pinned in place")
+        self.ring = ring
+
+    def prune_pins(self, listed_at):
+        """Forget pins of games that have finished or whose node is gone.
+
+        Games pinned after listed_at, when the game lists were fetched, may
+        be too new to be listed and are kept until the next check.
+        """
+        listed = {game["game_id"]: node for node in self.ring.nodes for game in self.node_games[node]}
+        for game_id, node in list(self.pins.items()):
+            if listed.get(game_id) != node and self.pinned_at.get(game_id, 0) < listed_at:
+                del self.pins[game_id]
+                self.pinned_at.pop(game_id, None)
+
+    async def request(self, node, message):
+        """Send a node one request on a new connection and return its reply"""
+        reader, writer = await self.connect(node)
+        try:
+            writer.write(encode_message(message))
+            reply = await asyncio.wait_for(read_message_async(reader), NODE_TIMEOUT)
+        finally:
+            writer.close()
+        if not reply:
+            raise ValueError(f"No reply to {message.get('type')}")
+        return reply
+
+    async def fetch_games(self, node):
+        """A node's own games (GET_GAMES with scope "local")"""
+        reply = await self.request(node, {"type": "GET_GAMES", "scope": "local"})
+        if reply.get("type") != "GAME_LIST":
+            raise ValueError(f"Unexpected reply to GET_GAMES: {reply}")
+        return reply.get("games", [])
+
+    async def all_games(self):
+        results = await asyncio.gather(*(self.fetch_games(node) for node in self.ring.nodes),
+                                       return_exceptions=True)
+        games = []
+        for result in results:
+            if not isinstance(result, BaseException):
+                games.extend(result)
+        return games
+
+    async def game_page(self, message):
+        """Reply to a paged GET_GAMES: every node's page merged, or the ERROR a node answered with"""
+        request = {field: message[field] for field in PAGE_FIELDS if field in message and field != "subscribe"}
+        request["type"] = "GET_GAMES"
+        results = await asyncio.gather(*(self.request(node, request) for node in self.ring.nodes),
+                                       return_exceptions=True)
+        pages = [result for result in results if not isinstance(result, BaseException)]
+        error = next((page for page in pages if page.get("type") != "GAME_LIST"), None)
+        if error:
+            return error
+        return merge_pages(pages, request.get("order", "newest"), request.get("limit", PAGE_SIZE))
+
+    async def games_reply(self, message):
+        """GAME_LIST for a GET_GAMES without subscribe"""
+        if wants_page(message):
+            return await self.game_page(message)
+        return {"type": "GAME_LIST", "games": await self.all_games()}
+
+    # Client connections
+
+    async def handle_client(self, reader, writer):
+        addr = writer.get_extra_info("peername")
+        upstream = None
+        try:
+            hello = None
+            message = await read_message_async(reader)
+            if message and message.get("type") == "HELLO":
+                # The client waits for the reply before saying which game it
+                # wants, so negotiate with some node now and move later if needed
+                hello = message
+                upstream = await self.handshake(writer, self.ring.node_for(str(addr)), hello)
+                message = await read_message_async(reader)
+            if not message:
+                return
+
+            message_type = message.get("type")
+            if message_type == "GET_GAMES" and message.get("subscribe"):
+                await self.watch_lobby(reader, writer, message)
+                return
+            if message_type == "GET_GAMES":
+                writer.write(encode_message(await self.games_reply(message)))
+                await writer.drain()
+                return
+
+            if message_type == "CREATE_GAME":
+                game_id = new_game_id()
+                while game_id in self.pins:
+                    game_id = new_game_id()
+                message["game_id"] = game_id
+            elif message_type == "JOIN_LOBBY":
+                # Players can only be matched on the node their time control's
+                # lobby lives on; the lobby's GET_GAMES are answered here
+                game_id = lobby_key(message)
+            else:
+                game_id = message.get("game_id")
+            node = self.node_for(str(game_id))
+            if node is None:
+                writer.write(encode_message({"type": "ERROR", "message": "No game server available"}))
+                await writer.drain()
+                return
+
+            print(f"{addr}: {message_type} {game_id} -> {node_name(node)}")
+            if upstream and upstream[0] != node:
+                upstream[2].close()
+                upstream = None
+            await self.relay(reader, writer, node, hello, message, upstream)
+        except Exception as e:
+            print(f"Error handling client {addr}: {e}")
+        finally:
+            if upstream:
+                upstream[2].close()
+            writer.close()
+
+    async def connect(self, node):
+        return await asyncio.wait_for(asyncio.open_connection(*node), NODE_TIMEOUT)
+
+    async def handshake(self, client_writer, node, hello):
+        """Pass HELLO to a node and its reply back; (node, reader, writer), or None if no node answers"""
+        try:
+            if node is None:
+                raise OSError("no live nodes")
+            node_reader, node_writer = await self.connect(node)
+            node_writer.write(encode_message(hello))
+            payload = await asyncio.wait_for(read_payload_async(node_reader), NODE_TIMEOUT)
+            if payload is None:
+                raise OSError("closed during HELLO")
+        except (OSError, asyncio.TimeoutError) as e:
+            print(f"HELLO via {node_name(node) if node else 'gateway'} failed: {e}")
+            client_writer.write(encode_message({"type": "HELLO", "encoding": "json"}))
+            return None
+        client_writer.write(HEADER.pack(len(payload)) + payload)
+        return node, node_reader, node_writer
+
+    async def relay(self, client_reader, client_writer, node, hello, message, upstream=None):
+        """Send the client's request to the node, then relay both ways until either side closes.
+
+        upstream is a connection to the node that already did the HELLO;
+        otherwise HELLO is repeated on a new one and the node's reply, which
+        the client already has, is dropped.
+        """
+        try:
+            if upstream:
+                node, node_reader, node_writer = upstream
+            else:
+                node_reader, node_writer = await self.connect(node)
+                if hello:
+                    node_writer.write(encode_message(hello))
+                    await asyncio.wait_for(read_payload_async(node_reader), NODE_TIMEOUT)
+        except (OSError, asyncio.TimeoutError) as e:
+            print(f"Node {node_name(node)} unreachable: {e}")
+            client_writer.write(encode_message({"type": "ERROR", "message": "Game server unavailable"}))
+            await client_writer.drain()
+            return
+        message_type = message.get("type")
+        try:
+            node_writer.write(encode_message(message))
+            if message_type == "CREATE_GAME":
+                await self.watch_created(node_reader, client_writer, node, message["game_id"])
+            if message_type == "JOIN_LOBBY":
+                # Whole frames only, as GAME_LIST replies from here go in between
+                to_node = self.pump_lobby(client_reader, node_writer, client_writer)
+                to_client = self.watch_matches(node_reader, client_writer, node)
+            else:
+                to_node = self.pump(client_reader, node_writer)
+                to_client = self.pump(node_reader, client_writer)
+            tasks = [asyncio.create_task(to_node), asyncio.create_task(to_client)]
+            # Either side closing ends the session
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in pending:
+                task.cancel()
+            for task in done:
+                if task.exception():
+                    print(f"Relay with {node_name(node)} ended: {task.exception()}")
+        finally:
+            node_writer.close()
+
+    async def watch_created(self, node_reader, client_writer, node, game_id):
+        """Forward the node's replies up to GAME_CREATED, pinning the game if the node chose another ID"""
+        while True:
+            payload = await read_payload_async(node_reader)
+            if payload is None:
+                return
+            client_writer.write(HEADER.pack(len(payload)) + payload)
+            message = decode_payload(payload)
+            if message.get("type") == "GAME_CREATED":
+                if message.get("game_id") != game_id:
+                    self.pin(message.get("game_id"), node)
+                return
+            if message.get("type") == "ERROR":
+                return
+
+    async def watch_matches(self, node_reader, client_writer, node):
+        """Forward a lobby player's frames, pinning the game of their MATCH_FOUND to the node"""
+        matched = False
+        while True:
+            payload = await read_payload_async(node_reader)
+            if payload is None:
+                return
+            client_writer.write(HEADER.pack(len(payload)) + payload)
+            if not matched:
+                message = decode_payload(payload)
+                if message.get("type") == "MATCH_FOUND":
+                    # The node chose the ID, so the ring may place it elsewhere
+                    self.pin(message.get("game_id"), node)
+                    matched = True
+            await client_writer.drain()
+
+    async def pump(self, reader, writer):
+        while True:
+            data = await reader.read(RELAY_CHUNK)
+            if not data:
+                return
+            writer.write(data)
+            await writer.drain()
+
+    async def pump_lobby(self, client_reader, node_writer, client_writer):
+        """Client to node frame by frame, answering GET_GAMES with every node's games.
+
+        As on a node, a GET_GAMES from the lobby gets a page, by default of
+        the games waiting for an opponent, and cannot subscribe.
+        """
+        while True:
+            payload = await read_payload_async(client_reader)
+            if payload is None:
+                return
+            try:
+                message = decode_payload(payload)
+            except ValueError:
+                message = None
+            if message and message.get("type") == "GET_GAMES":
+                page = await self.game_page(dict({"status": "waiting"}, **message))
+                client_writer.write(encode_message(page))
+                await client_writer.drain()
+                continue
+            node_writer.write(HEADER.pack(len(payload)) + payload)
+            await node_writer.drain()
+
+    # Lobby subscriptions
+
+    async def watch_lobby(self, client_reader, client_writer, message):
+        """Serve a GET_GAMES with subscribe from every node.
+
+        The client gets one merged first page, then each node's LOBBY_DIFF
+        as it comes, and can ask for further pages on the same connection.
+        The session ends when the client or any watched node goes away; the
+        client subscribes again for a fresh list, which also picks up nodes
+        that joined meanwhile.
+        """
+        subscriptions = []
+        try:
+            for node in list(self.ring.nodes):
+                try:
+                    subscriptions.append(await self.subscribe_node(node, message))
+                except (OSError, ValueError, asyncio.TimeoutError) as e:
+                    print(f"Lobby subscription to {node_name(node)} failed: {e}")
+            pages = [page for _, _, _, page in subscriptions]
+            error = next((page for page in pages if page.get("type") != "GAME_LIST"), None)
+            if error:
+                client_writer.write(encode_message(error))
+                await client_writer.drain()
+                return
+            client_writer.write(encode_message(
+                merge_pages(pages, message.get("order", "newest"), message.get("limit", PAGE_SIZE))))
+            await client_writer.drain()
+
+            # Each node numbers its own diffs; the client sees the sum, as in the first page
+            versions = {node: page.get("version", 0) for node, _, _, page in subscriptions}
+            tasks = [asyncio.create_task(self.forward_diffs(node, node_reader, node_writer, client_writer, versions))
+                     for node, node_reader, node_writer, _ in subscriptions]
+            tasks.append(asyncio.create_task(self.serve_watcher(client_reader, client_writer)))
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in pending:
+                task.cancel()
+            for task in done:
+                if task.exception():
+                    print(f"Lobby subscription ended: {task.exception()}")
+        finally:
+            for _, _, node_writer, _ in subscriptions:
+                node_writer.close()
+
+    async def subscribe_node(self, node, message):
+        """Subscribe to a node's lobby; (node, reader, writer, its first page or ERROR)"""
+        node_reader, node_writer = await self.connect(node)
+        try:
+            # With heartbeats the node keeps an idle subscription open for as long as we answer PING
+            node_writer.write(encode_message({"type": "HELLO", "encodings": ["json"], "heartbeat": True}))
+            node_writer.write(encode_message(dict(message, subscribe=True)))
+            while True:
+                reply = await asyncio.wait_for(read_message_async(node_reader), NODE_TIMEOUT)
+                if not reply:
+                    raise OSError("closed before the first page")
+                if reply.get("type") in ("GAME_LIST", "ERROR"):
+                    return node, node_reader, node_writer, reply
+                if reply.get("type") == "PING":
+                    node_writer.write(encode_message({"type": "PONG", "id": reply.get("id")}))
+        except BaseException:
+            node_writer.close()
+            raise
+
+    async def forward_diffs(self, node, node_reader, node_writer, client_writer, versions):
+        """Pass a node's LOBBY_DIFFs on to a watching client and answer its PINGs"""
+        while True:
+            message = await read_message_async(node_reader)
+            if not message:
+                print(f"Lobby subscription to {node_name(node)} closed")
+                return
+            if message.get("type") == "PING":
+                node_writer.write(encode_message({"type": "PONG", "id": message.get("id")}))
+                await node_writer.drain()
+            elif message.get("type") == "LOBBY_DIFF":
+                versions[node] = message.get("version", versions[node])
+                client_writer.write(encode_message(dict(message, version=sum(versions.values()))))
+                await client_writer.drain()
+
+    async def serve_watcher(self, client_reader, client_writer):
+        """Answer a watching client's PINGs and requests for further pages"""
+        while True:
+            message = await read_message_async(client_reader)
+            if not message:
+                return
+            if message.get("type") == "PING":
+                client_writer.write(encode_message({"type": "PONG", "id": message.get("id")}))
+            elif message.get("type") == "GET_GAMES":
+                client_writer.write(encode_message(await self.game_page(dict(message, subscribe=False))))
+            await client_writer.drain()
+
+
+def parse_node(text):
+    host, _, port = text.rpartition(":")
+    return (host or "127.0.0.1", int(port))
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    nodes = []
+    port = PORT
+    try:
+        while args:
+            option = args.pop(0)
+            if option == "--node":
+                nodes.append(parse_node(args.pop(0)))
+            elif option == "--port":
+                port = int(args.pop(0))
+            else:
+                raise ValueError(option)
+    except (IndexError, ValueError):
+        print("Usage: python gateway.py [--port PORT] [--node HOST:PORT]...")
+        sys.exit(1)
+    Gateway(nodes, port=port).start()
@@ -0,0 +1,374 @@
+import asyncio
+import sys
+import time
+import uuid
+
+import chess
+
+from common.framing import encode_message, decode_payload, read_message_async, read_payload_async
+from common.position import position_hash
+from server.relay import redirect_for
+
+# Spectator relay for busy games.
+#
+# A relay subscribes to a game once, as a single spectator of its upstream,
+# and re-broadcasts what it receives to its own spectators, so the game's
+# server sends every update once per relay instead of once per watcher.
+# SimpleServer REDIRECTs new spectators of a game that already has
+# RELAY_THRESHOLD of them to a relay picked from the game ID, and a relay
+# with --child relays does the same in turn, which makes a fan-out tree:
+#
+#   python relay.py --port 50020 --upstream 127.0.0.1:50004
+#   python simple_server.py --relay 127.0.0.1:50020
+#
+# The upstream can be a SimpleServer, a cluster, gateway.py or another relay.
+# Spectators talk to a relay as they would to the server: HELLO (binary or
+# JSON, no heartbeats), SPECTATE, then CHAT and RESYNC_REQUEST. The relay
+# keeps the board and clocks itself, so it greets late spectators, answers
+# resyncs and turns BOARD_DELTA into BOARD_UPDATE for spectators that did not
+# ask for deltas without going upstream.
+
+HOST = "0.0.0.0"
+PORT = 50020
+UPSTREAM = ("127.0.0.1", 50004)  # Server (or parent relay) games are fetched from, overridable with --upstream
+CHILDREN = []  # Relays this one hands extra spectators to, added with --child
+RELAY_THRESHOLD = 500  # Spectators a game keeps here before new ones are sent to a child relay
+WIRE_ENCODINGS = ("binary", "json")
+UPSTREAM_TIMEOUT = 5.0  # Seconds the upstream has to connect and answer SPECTATE
+MAX_REDIRECTS = 3  # Upstream REDIRECTs followed (cluster workers) before giving up
+LINGER = 10.0  # Seconds a game stays subscribed after its last spectator leaves
+SUBSCRIBER_BUFFER_LIMIT = 256 * 1024  # Unsent bytes after which a spectator that cannot keep up is dropped
+
+
+class RelayedGame:
+    """One game's upstream subscription, its state and the spectators it feeds"""
+
+    def __init__(self, game_id):
+        self.game_id = game_id
+        self.board = None
+        self.state = {}  # current_player, clocks, game_over and winner as last received
+        self.received = time.monotonic()  # When the clocks in state were read
+        self.subscribers = {}  # writer -> {"name", "binary", "delta"}
+        self.upstream = None  # StreamWriter to the upstream
+        self.ready = asyncio.get_running_loop().create_future()  # SPECTATE_START or the upstream's ERROR
+        self.linger = None
+
+    def update(self, message):
+        """Take what a message says about the game; False if a delta does not fit our board"""
+        if "board" in message and message["type"] != "BOARD_DELTA":
+            self.board = chess.Board(message["board"])
+        elif message["type"] == "BOARD_DELTA":
+            if self.board is None:
+                return False
+            try:
+                self.board.push_uci(message["move"])
+            except ValueError:
+                return False
+            if self.board.ply() != message.get("ply") or position_hash(self.board) != message.get("hash"):
+                return False
+        for key in ("current_player", "game_over", "winner"):
+            if key in message:
+                self.state[key] = message[key]
+        if "white_time" in message:
+            self.state["white_time"] = message["white_time"]
+            self.state["black_time"] = message["black_time"]
+            self.state["server_time"] = message.get("server_time")
+            self.state["clock_paused"] = message.get("clock_paused", False)
+            self.received = time.monotonic()
+        if message["type"] == "GAME_OVER":
+            # Resignation, timeout and disconnect say only who won; the clocks stop as they are now
+            self.state.update(self.clock_fields())
+            self.received = time.monotonic()
+            self.state["game_over"] = True
+            self.state["clock_paused"] = True
+        return True
+
+    def clock_fields(self):
+        """The clocks as of now, counting the player on move down since they were read"""
+        fields = {key: self.state.get(key) for key in ("white_time", "black_time", "server_time")}
+        elapsed = time.monotonic() - self.received
+        if fields["server_time"] is not None:
+            fields["server_time"] += elapsed
+        if not self.state.get("clock_paused") and not self.state.get("game_over"):
+            key = f"{self.state.get('current_player')}_time"
+            if fields.get(key) is not None:
+                fields[key] = round(max(0.0, fields[key] - elapsed), 3)
+        if self.state.get("clock_paused"):
+            fields["clock_paused"] = True
+        return fields
+
+    def board_update(self):
+        return {
+            "type": "BOARD_UPDATE",
+            "board": self.board.fen(),
+            "current_player": self.state.get("current_player"),
+            "game_over": bool(self.state.get("game_over")),
+            "winner": self.state.get("winner"),
+            **self.clock_fields()
+        }
+
+    def spectate_start(self):
+        return {
+            "type": "SPECTATE_START",
+            "game_id": self.game_id,
+            "board": self.board.fen(),
+            **self.clock_fields(),
+            "current_player": self.state.get("current_player")
+        }
+
+    def resync(self):
+        return {
+            "type": "RESYNC",
+            "game_id": self.game_id,
+            "color": None,
+            "opponent": None,
+            "board": self.board.fen(),
+            "ply": self.board.ply(),
+            "moves": None,
+            "current_player": self.state.get("current_player"),
+            **self.clock_fields(),
+            "game_over": bool(self.state.get("game_over")),
+            "winner": self.state.get("winner")
+        }
+
+
+class Relay:
+    def __init__(self, upstream=None, children=None, host=HOST, port=PORT):
+        self.upstream = upstream or UPSTREAM
+        self.children = list(children if children is not None else CHILDREN)
+        self.host = host
+        self.port = port
+        self.games = {}  # game_id -> RelayedGame
+
+    def start(self):
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            print("Relay stopped")
+
+    async def serve(self):
+        server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        print(f"Relay on {self.host}:{self.port} for {self.upstream[0]}:{self.upstream[1]}")
+        async with server:
+            await server.serve_forever()
+
+    # Spectators
+
+    async def handle_client(self, reader, writer):
+        addr = writer.get_extra_info("peername")
+        binary = False
+        try:
+            message = await read_message_async(reader)
+            if message and message.get("type") == "HELLO":
+                offered = message.get("encodings") or ["json"]
+                encoding = next((name for name in WIRE_ENCODINGS if name in offered), "json")
+                binary = encoding == "binary"
+                writer.write(encode_message({"type": "HELLO", "encoding": encoding}))
+                message = await read_message_async(reader)
+            if not message:
+                return
+            if message.get("type") != "SPECTATE":
+                writer.write(encode_message({"type": "ERROR", "message": "Only SPECTATE is served here"}))
+                return
+            player_name = message.get("player_name")
+            game_id = message.get("game_id")
+            if not player_name or not message.get("player_id") or not isinstance(game_id, str):
+                writer.write(encode_message({"type": "ERROR", "message": "Missing information"}))
+                return
+
+            game = self.games.get(game_id)
+            redirect = redirect_for(game_id, self.children, len(game.subscribers) if game else 0, message,
+                                    RELAY_THRESHOLD)
+            if redirect:
+                print(f"Sending spectator of {game_id} to {redirect['host']}:{redirect['port']}")
+                writer.write(encode_message(redirect))
+                return
+            game = await self.subscribe(game_id)
+            if isinstance(game, dict):
+                writer.write(encode_message(game))
+                return
+
+            if game.linger:
+                game.linger.cancel()
+                game.linger = None
+            writer.write(encode_message(game.spectate_start(), binary))
+            game.subscribers[writer] = {"name": player_name, "binary": binary,
+                                        "delta": bool(message.get("delta_updates"))}
+            print(f"{addr}: {player_name} spectating {game_id} ({len(game.subscribers)} here)")
+            try:
+                await self.serve_spectator(reader, writer, game)
+            except ConnectionError:
+                pass
+            finally:
+                self.unsubscribe(game, writer)
+        except Exception as e:
+            print(f"Error handling spectator {addr}: {e}")
+        finally:
+            writer.close()
+
+    async def serve_spectator(self, reader, writer, game):
+        subscriber = game.subscribers[writer]
+        while True:
+            message = await read_message_async(reader)
+            if not message:
+                return
+            message_type = message.get("type")
+            if message_type == "PING":
+                writer.write(encode_message({"type": "PONG", "id": message.get("id")}))
+            elif message_type == "RESYNC_REQUEST":
+                writer.write(encode_message(game.resync(), subscriber["binary"]))
+            elif message_type == "CHAT" and message.get("message") and game.upstream:
+                # Upstream sees the relay as the speaker, so say who it was;
+                # upstream does not echo to the relay, so tell our own here
+                game.upstream.write(encode_message({"type": "CHAT",
+                                                    "message": f"{subscriber['name']}: {message['message']}"}))
+                self.broadcast(game, {"type": "CHAT", "player_name": f"[Spectator] {subscriber['name']}",
+                                      "message": message["message"]}, exclude=writer)
+
+    def unsubscribe(self, game, writer):
+        if game.subscribers.pop(writer, None) is None:
+            return
+        if not game.subscribers and self.games.get(game.game_id) is game:
+            game.linger = asyncio.get_running_loop().call_later(LINGER, self.drop, game)
+
+    def drop(self, game):
+        """Stop following a game nobody here watches any more"""
+        if game.subscribers:
+            return
+        print(f"Unsubscribing from {game.game_id}")
+        if self.games.get(game.game_id) is game:
+            del self.games[game.game_id]
+        if game.upstream:
+            game.upstream.close()
+
+    def broadcast(self, game, message, exclude=None):
+        """Send a message to every spectator, encoding it once per variant.
+
+        BOARD_DELTA goes as it is to spectators that asked for deltas and as
+        a BOARD_UPDATE to the rest. Writes are not awaited, so one slow
+        spectator cannot hold up the others; one whose unsent data passes
+        SUBSCRIBER_BUFFER_LIMIT is dropped instead.
+        """
+        frames = {}
+        for writer, subscriber in list(game.subscribers.items()):
+            if writer is exclude:
+                continue
+            delta = message["type"] == "BOARD_DELTA" and subscriber["delta"]
+            variant = (delta, subscriber["binary"])
+            data = frames.get(variant)
+            if data is None:
+                outgoing = game.board_update() if message["type"] == "BOARD_DELTA" and not delta else message
+                data = frames[variant] = encode_message(outgoing, subscriber["binary"])
+            if writer.is_closing():
+                continue
+            writer.write(data)
+            if writer.transport.get_write_buffer_size() > SUBSCRIBER_BUFFER_LIMIT:
+                print(f"Dropping {subscriber['name']}, who fell behind in {game.game_id}")
+                writer.close()
+                game.subscribers.pop(writer, None)
+
+    # Upstream
+
+    async def subscribe(self, game_id):
+        """The RelayedGame for a game, subscribing upstream first if needed, or the upstream's ERROR"""
+        game = self.games.get(game_id)
+        if game is None:
+            game = self.games[game_id] = RelayedGame(game_id)
+            asyncio.create_task(self.follow(game))
+        error = await asyncio.shield(game.ready)
+        return error or game
+
+    async def follow(self, game):
+        """Spectate a game upstream and pass on everything that arrives until it ends"""
+        error = None
+        try:
+            reader, writer = await self.open_upstream(game)
+            game.upstream = writer
+            game.ready.set_result(None)
+            print(f"Subscribed to {game.game_id} upstream")
+            while True:
+                payload = await read_payload_async(reader)
+                if payload is None:
+                    break
+                message = decode_payload(payload)
+                message_type = message.get("type")
+                if message_type == "PING":
+                    writer.write(encode_message({"type": "PONG", "id": message.get("id")}))
+                    continue
+                if message_type == "PONG":
+                    continue
+                if not game.update(message):
+                    # Lost track of the position; catch up from the full board
+                    writer.write(encode_message({"type": "RESYNC_REQUEST", "game_id": game.game_id}))
+                    continue
+                if message_type == "RESYNC":
+                    message = game.board_update()
+                self.broadcast(game, message)
+        except (OSError, asyncio.TimeoutError, ValueError) as e:
+            error = {"type": "ERROR", "message": f"Game unavailable: {e}"}
+            print(f"Upstream of {game.game_id} failed: {e}")
+        finally:
+            if not game.ready.done():
+                game.ready.set_result(error or {"type": "ERROR", "message": "Game unavailable"})
+            if self.games.get(game.game_id) is game:
+                del self.games[game.game_id]
+            if game.upstream:
+                game.upstream.close()
+            for writer in list(game.subscribers):
+                writer.close()
+            print(f"Stopped relaying {game.game_id}")
+
+    async def open_upstream(self, game):
+        """Connect upstream and SPECTATE, following REDIRECTs; the connection once SPECTATE_START is in"""
+        address = self.upstream
+        request = {"type": "SPECTATE", "player_name": "relay", "player_id": f"relay-{uuid.uuid4().hex[:8]}",
+                   "game_id": game.game_id, "delta_updates": True, "relay": True}
+        for _ in range(MAX_REDIRECTS + 1):
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(*address), UPSTREAM_TIMEOUT)
+            try:
+                writer.write(encode_message({"type": "HELLO", "encodings": list(WIRE_ENCODINGS)}))
+                writer.write(encode_message(request))
+                while True:
+                    reply = await asyncio.wait_for(read_message_async(reader), UPSTREAM_TIMEOUT)
+                    if reply is None:
+                        raise ValueError("upstream closed the connection")
+                    if reply.get("type") != "HELLO":
+                        break
+            except BaseException:
+                writer.close()
+                raise
+            if reply.get("type") == "SPECTATE_START":
+                game.update(reply)
+                return reader, writer
+            writer.close()
+            if reply.get("type") != "REDIRECT":
+                raise ValueError(reply.get("message", f"unexpected {reply.get('type')}"))
+            address = (reply.get("host") or address[0], reply["port"])
+        raise ValueError("too many redirects")
+
+
+def parse_address(text):
+    host, _, port = text.rpartition(":")
+    return (host or "127.0.0.1", int(port))
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    upstream = None
+    children = []
+    port = PORT
+    try:
+        while args:
+            option = args.pop(0)
+            if option == "--upstream":
+                upstream = parse_address(args.pop(0))
+            elif option == "--child":
+                children.append(parse_address(args.pop(0)))
+            elif option == "--port":
+                port = int(args.pop(0))
+            else:
+                raise ValueError(option)
+    except (IndexError, ValueError):
+        print("Usage: python relay.py [--port PORT] [--upstream HOST:PORT] [--child HOST:PORT]...")
+        sys.exit(1)
+    Relay(upstream, children, port=port).start()
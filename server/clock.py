@@ -0,0 +1,161 @@
+import re
+import time
+
+# Most of a move's measured time a player's round-trip time may excuse
+MAX_LAG_COMPENSATION = 1.0
+# Longest base time a time control may ask for, in seconds
+MAX_BASE_TIME = 24 * 60 * 60
+
+COLORS = ("white", "black")
+
+
+class TimeControl:
+    """Base time per player plus an optional Fischer increment or delay, in seconds.
+
+    The increment is added to a player's clock after each of their moves.
+    The delay is a grace period at the start of every turn that is not
+    charged (US/simple delay). A game uses one or the other, or neither.
+    """
+
+    def __init__(self, base, increment=0.0, delay=0.0):
+        if not 0 < base <= MAX_BASE_TIME:
+            raise ValueError(f"Base time must be between 0 and {MAX_BASE_TIME} seconds, got {base}")
+        if increment < 0 or delay < 0:
+            raise ValueError("Increment and delay cannot be negative")
+        if increment and delay:
+            raise ValueError("A time control has an increment or a delay, not both")
+        self.base = base
+        self.increment = increment
+        self.delay = delay
+
+    @staticmethod
+    def parse(spec):
+        """Build a TimeControl from what clients send as time_limit.
+
+        Accepts seconds as a number (the original time_limit), a dict with
+        "base" and optional "increment" or "delay" seconds, or the usual
+        notation as a string: "5+3" is 5 minutes plus 3 seconds a move and
+        "5d2" 5 minutes with a 2 second delay. Raises ValueError otherwise.
+        """
+        if isinstance(spec, TimeControl):
+            return spec
+        if isinstance(spec, bool):
+            raise ValueError(f"Not a time control: {spec!r}")
+        if isinstance(spec, (int, float)):
+            return TimeControl(float(spec))
+        if isinstance(spec, dict):
+            try:
+                return TimeControl(float(spec["base"]), float(spec.get("increment", 0)),
+                                   float(spec.get("delay", 0)))
+            except (KeyError, TypeError) as e:
+                raise ValueError(f"Not a time control: {spec!r} ({e})")
+        if isinstance(spec, str):
+            match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*(?:([+d])\s*(\d+(?:\.\d+)?))?\s*", spec)
+            if match:
+                minutes, kind, seconds = match.groups()
+                extra = float(seconds) if seconds else 0.0
+                return TimeControl(float(minutes) * 60, extra if kind == "+" else 0.0,
+                                   extra if kind == "d" else 0.0)
+        raise ValueError(f"Not a time control: {spec!r}")
+
+    def to_dict(self):
+        return {"base": self.base, "increment": self.increment, "delay": self.delay}
+
+    def __str__(self):
+        minutes = f"{self.base / 60:g}"
+        if self.increment:
+            return f"{minutes}+{self.increment:g}"
+        if self.delay:
+            return f"{minutes}d{self.delay:g}"
+        return minutes
+
+
+class GameClock:
+    """Server-authoritative chess clock for both players.
+
+    Time is measured with time.monotonic(), so wall-clock adjustments on
+    the server never add or remove time. The clock runs for one color at a
+    time; press() ends that player's turn, charges the time used minus any
+    delay and lag allowance, adds the increment and starts the opponent's
+    turn. The charged think time of every ply is kept in `think_times`.
+
+    Not thread safe; callers hold the game's lock.
+    """
+
+    def __init__(self, time_control, remaining=None):
+        self.time_control = time_control
+        self.remaining = dict(remaining) if remaining else {color: time_control.base for color in COLORS}
+        self.running = None  # Color whose time is running, None while stopped
+        self.turn_started = None  # time.monotonic() when the running turn started
+        self.think_times = []  # Seconds charged for each ply, in order
+
+    @staticmethod
+    def now():
+        return time.monotonic()
+
+    def start(self, color, now=None):
+        """Start (or restart) the clock of `color`'s turn"""
+        self.running = color
+        self.turn_started = self.now() if now is None else now
+
+    def stop(self, now=None):
+        """Charge the running turn so far and stop the clock"""
+        if self.running is not None:
+            self.remaining[self.running] = self.time_left(self.running, now)
+        self.running = None
+        self.turn_started = None
+
+    def elapsed(self, now=None):
+        """Seconds the running turn has lasted, before any delay"""
+        if self.running is None:
+            return 0.0
+        return max(0.0, (self.now() if now is None else now) - self.turn_started)
+
+    def time_left(self, color, now=None):
+        """Remaining time of `color` at this moment, not below zero"""
+        remaining = self.remaining[color]
+        if color == self.running:
+            remaining -= max(0.0, self.elapsed(now) - self.time_control.delay)
+        return max(0.0, remaining)
+
+    def flagged(self, now=None, lag=0.0):
+        """True if the player on move has run out of time, after any lag allowance"""
+        if self.running is None:
+            return False
+        return self.remaining[self.running] - self.charge(self.elapsed(now), lag) <= 0
+
+    def time_to_flag(self, now=None):
+        """Seconds until the running player flags, or None while stopped"""
+        if self.running is None:
+            return None
+        return self.time_left(self.running, now) + max(0.0, self.time_control.delay - self.elapsed(now))
+
+    def charge(self, elapsed, lag=0.0):
+        """Seconds charged for a turn of `elapsed` seconds, excusing up to `lag`"""
+        return max(0.0, self.compensate(elapsed, lag) - self.time_control.delay)
+
+    @staticmethod
+    def compensate(elapsed, lag):
+        return max(0.0, elapsed - min(max(0.0, lag), MAX_LAG_COMPENSATION))
+
+    def press(self, lag=0.0, now=None):
+        """End the running player's turn and start the opponent's.
+
+        `lag` is the network round-trip time to the mover: their move and
+        the opponent's previous move each spent about half of it in transit,
+        time the player never saw on their own clock. Up to
+        MAX_LAG_COMPENSATION of it is not charged, but never more than the
+        move took. Returns the think time charged for the ply.
+        """
+        now = self.now() if now is None else now
+        color = self.running
+        elapsed = self.elapsed(now)
+        compensated = self.compensate(elapsed, lag)
+        self.remaining[color] = max(0.0, self.remaining[color] - self.charge(elapsed, lag)) + self.time_control.increment
+        self.think_times.append(round(compensated, 3))
+        self.start("black" if color == "white" else "white", now)
+        return compensated
+
+    def snapshot(self, now=None):
+        """{color: seconds left} at this moment"""
+        return {color: self.time_left(color, now) for color in COLORS}
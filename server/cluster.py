@@ -0,0 +1,110 @@
+import multiprocessing
+import signal
+import socket
+import sys
+import zlib
+
+from common.framing import FrameReader, encode_message
+
+# Cluster mode for simple_server.SimpleServer.
+#
+# N worker processes all listen on the public PORT with SO_REUSEPORT, so the
+# kernel spreads new connections across them, and each also listens on its
+# own direct port, PORT + 1 + index. Every game belongs to one shard, picked
+# from its ID by shard_for(); a worker only creates games whose IDs fall in
+# its own shard, so a game lives, is journaled and is recovered in exactly
+# one process. A JOIN_GAME, SPECTATE, REJOIN_GAME or RESUME that lands on
+# the wrong worker is answered with REDIRECT, naming the owner's direct
+# port, and the client repeats the request there. GET_GAMES is answered
+# with the games of every worker.
+
+DIRECT_PORT_OFFSET = 1  # Worker i's direct port is PORT + DIRECT_PORT_OFFSET + i
+PEER_HOST = "127.0.0.1"  # Where workers reach each other's direct ports
+PEER_TIMEOUT = 1.0  # Seconds to wait for a peer's game list
+ROUTED_TYPES = {"JOIN_GAME", "SPECTATE", "REJOIN_GAME", "RESUME"}
+
+
+def shard_for(game_id, shards):
+    """The shard a game belongs to. Stable across processes and restarts."""
+    return zlib.crc32(game_id.encode("utf-8")) % shards
+
+
+class Shard:
+    """One worker's place in the cluster"""
+
+    def __init__(self, index, shards, port, redirect_host=None):
+        if not 0 <= index < shards:
+            raise ValueError(f"Shard {index} out of range for {shards} shards")
+        self.index = index
+        self.shards = shards
+        self.port = port
+        # Host put in REDIRECT; None means the one the client already uses
+        self.redirect_host = redirect_host
+
+    def direct_port(self, index=None):
+        return self.port + DIRECT_PORT_OFFSET + (self.index if index is None else index)
+
+    def owns(self, game_id):
+        return shard_for(game_id, self.shards) == self.index
+
+    def redirect_for(self, message):
+        """REDIRECT for a request about another shard's game, or None if this one should handle it"""
+        game_id = message.get("game_id")
+        if message.get("type") not in ROUTED_TYPES or not isinstance(game_id, str) or self.owns(game_id):
+            return None
+        redirect = {
+            "type": "REDIRECT",
+            "game_id": game_id,
+            "port": self.direct_port(shard_for(game_id, self.shards))
+        }
+        if self.redirect_host:
+            redirect["host"] = self.redirect_host
+        return redirect
+
+    def peer_games(self):
+        """The active games of every other worker, skipping any that do not answer"""
+        games = []
+        for index in range(self.shards):
+            if index == self.index:
+                continue
+            try:
+                games.extend(fetch_games(PEER_HOST, self.direct_port(index)))
+            except (OSError, ValueError) as e:
+                print(f"Could not list the games of worker {index}: {e}")
+        return games
+
+
+def fetch_games(host, port, timeout=PEER_TIMEOUT):
+    """Ask one worker for its own games (GET_GAMES with scope "local")"""
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        sock.sendall(encode_message({"type": "GET_GAMES", "scope": "local"}))
+        reply = FrameReader(sock).read_message()
+    if not reply or reply.get("type") != "GAME_LIST":
+        raise ValueError(f"Unexpected reply to GET_GAMES: {reply}")
+    return reply.get("games", [])
+
+
+def run_workers(workers, target, *args):
+    """Run target(index, workers, *args) in `workers` processes until they all exit.
+
+    Workers are spawned rather than forked, so none inherits the parent's
+    threads or sockets; target must be importable by name. Stopping the
+    parent with Ctrl-C or SIGTERM stops every worker.
+    """
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=target, args=(index, workers) + args, name=f"worker-{index}")
+                 for index in range(workers)]
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        print("Stopping workers")
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join()
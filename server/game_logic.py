@@ -2,18 +2,20 @@ import chess
 import time
 import threading
 from common.message import Message
-from enhanced_chess_pieces import EnhancedChessPiece
-from server.utils import save_game_state, remove_game
+from server.clock import GameClock, TimeControl
+from server.enhanced_chess_pieces import EnhancedChessPiece
+from server.utils import record_move, finish_game
 
 class ChessGame:
-    def __init__(self, game_id, time_limit):
+    def __init__(self, game_id, time_control):
         self.game_id = game_id
         self.board = chess.Board()
         self.players = {}  # {player_id: socket}
         self.player_colors = {}  # {player_id: color}
         self.spectators = []
-        self.time_limit = time_limit
-        self.current_turn_start = None
+        # Both players' clocks; time_control is a TimeControl or anything TimeControl.parse accepts
+        self.clock = GameClock(TimeControl.parse(time_control))
+        self.turn_timeout = None  # Scheduler handle for the current turn's timeout
         self.current_player_id = None
         self.winner = None
         self.lock = threading.Lock()
@@ -57,6 +59,8 @@ class ChessGame:
                     del self.enhanced_pieces[chess_move.to_square]
 
                 self.board.push(chess_move)
+                if self.clock.running is not None:
+                    self.clock.press()
                 self.current_player_id = list(self.players.keys())[0 if self.current_player_id == list(self.players.keys())[1] else 1]
 
                 # Update enhanced pieces after the move
@@ -64,48 +68,71 @@ class ChessGame:
                 if piece:
                     self.enhanced_pieces[chess_move.to_square] = EnhancedChessPiece(piece)
 
-                # Save game state
-                state = {
-                    "board": self.board.fen(),
-                    "current_player": self.current_player(),
-                    "players": self.player_colors,
-                    "game_over": self.board.is_game_over()
-                }
-                save_game_state(self.game_id, state)
+                # Queue the move for the persistence worker; nothing is
+                # written to disk while the game lock is held
+                record_move(self.game_id, chess_move.uci(), self.persisted_state())
 
                 if self.board.is_game_over():
                     self.end_game(self.determine_winner())
                 return True
             except Exception:
                 return False
+
+    def persisted_state(self):
+        """The part of the game that survives a server restart."""
+        return {
+            "server": "chess_server",
+            "board": self.board.fen(),
+            "current_player": self.current_player(),
+            "players": dict(self.player_colors),
+            "game_over": self.board.is_game_over(),
+            "time_control": self.clock.time_control.to_dict(),
+            "clocks": self.clock.snapshot()
+        }
+
+    def restore(self, state, board):
+        """Take over a persisted game; players are seated without a socket until they rejoin."""
+        self.board = board
+        if state.get("time_control"):
+            self.clock = GameClock(TimeControl.parse(state["time_control"]), state.get("clocks"))
+        self.enhanced_pieces = {}
+        self.enhance_board_pieces()
+        # White first, make_move relies on the order of self.players
+        for color in ("white", "black"):
+            for player_id, player_color in state["players"].items():
+                if player_color == color:
+                    self.add_player(player_id, color, None)
+        self.current_player_id = state["current_player"]
+
     def start_turn_timer(self):
-        """Start or reset the turn timer."""
-        self.current_turn_start = time.time()
-        print(f"Turn timer started for {self.current_player_id}")
+        """Run the clock of the player on move; after a move press() has already started it."""
+        color = self.player_colors.get(self.current_player_id)
+        if self.clock.running != color:
+            self.clock.start(color)
+        print(f"Clock running for {self.current_player_id}: {self.clock.time_left(color):.1f}s left")
 
     def has_timed_out(self):
-        """Check if the current player has timed out."""
-        if self.current_turn_start is None:
-            return False
-        elapsed = time.time() - self.current_turn_start
+        """Check if the current player has run out of time."""
         # Add debug logging
-        print(f"Time check: elapsed={elapsed}, limit={self.time_limit}")
-        return elapsed > self.time_limit
+        print(f"Time check: {self.clock.time_to_flag()}s to flag")
+        return self.clock.flagged()
 
     def is_game_over(self):
         return self.board.is_game_over() or self.winner is not None
 
     def end_game(self, winner):
         self.winner = winner
-        # Clean up game state
-        remove_game(self.game_id)
+        self.clock.stop()
+        # Queue the result for the persistence worker
+        finish_game(self.game_id, winner)
 
     def determine_winner(self):
         if self.board.is_checkmate():
             return list(self.players.keys())[0 if self.current_player_id == list(self.players.keys())[1] else 1]
         return "Draw"
 
-    def broadcast_chat(self, message, timestamp=None):
+    def broadcast_chat(self, message, timestamp=None, send=None):
+        """Send a CHAT to players and spectators; send(socket, message) overrides writing the frame."""
         # If the message contains a timestamp, use it
         if isinstance(message, dict) and "message" in message and "timestamp" in message:
             print(f"Server: Broadcasting chat with timestamp from client: {message['timestamp']}")
@@ -124,9 +151,11 @@ class ChessGame:
                 "timestamp": timestamp if timestamp else current_time
             })
 
-        for player_id, socket in self.players.items():
-            if socket:
-                socket.send(chat_message.to_json().encode())
-        for spectator_socket in self.spectators:
-            if spectator_socket:
-                spectator_socket.send(chat_message.to_json().encode())
\ No newline at end of file
+        frame = chat_message.to_frame()
+        for socket in list(self.players.values()) + list(self.spectators):
+            if not socket:
+                continue
+            if send:
+                send(socket, chat_message)
+            else:
+                socket.sendall(frame)
\ No newline at end of file
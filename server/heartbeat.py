@@ -0,0 +1,106 @@
+import itertools
+import threading
+
+from server.metrics import metrics as default_metrics
+
+HEARTBEAT_INTERVAL = 10.0  # Seconds a peer may stay silent before it is sent a PING
+HEARTBEAT_TIMEOUT = 5.0  # Seconds a pinged peer has to show any sign of life
+RTT_SMOOTHING = 0.125  # Weight of a new sample in the smoothed round-trip time
+
+
+class Heartbeat:
+    """PING/PONG liveness check for one connection, run on a shared scheduler.
+
+    Any message from the peer proves it is alive; touch() only records the
+    time, as with IdleTimeout, and the reader thread never wakes up on its
+    own. Once the peer has been silent for `interval` seconds it is sent a
+    PING, and if nothing at all arrives within `timeout` seconds after that
+    on_dead is called, so a dead peer is reaped within interval + timeout
+    seconds while a quiet one costs a PING per interval.
+
+    Each PONG is a round-trip sample: `rtt` is the latest in seconds and
+    `srtt` a smoothed average, None until the first PONG. A busy peer is
+    never silent long enough to be pinged, so when RTT matters (for lag
+    compensation) call sample_every() and it is also pinged that often
+    while active.
+    """
+
+    def __init__(self, scheduler, send_ping, on_dead, interval=HEARTBEAT_INTERVAL,
+                 timeout=HEARTBEAT_TIMEOUT, metrics=None):
+        self.scheduler = scheduler
+        self.send_ping = send_ping  # send_ping(ping_id) sends the PING
+        self.on_dead = on_dead
+        self.interval = interval
+        self.timeout = timeout
+        self.metrics = metrics or default_metrics
+        self.ids = itertools.count(1)
+        self.last_activity = scheduler.time()
+        self.ping_id = None  # Last PING sent, until its PONG arrives
+        self.ping_time = None
+        self.awaiting = False  # A PING is out and the peer has been silent since
+        self.rtt = None
+        self.srtt = None
+        self.sample_interval = None
+        # check() runs on the scheduler thread while cancel() may run on any
+        # other; the lock keeps check() from re-arming a cancelled heartbeat
+        self.lock = threading.Lock()
+        self.cancelled = False
+        self.handle = scheduler.call_later(interval, self.check)
+
+    def touch(self):
+        self.last_activity = self.scheduler.time()
+
+    def pong(self, ping_id):
+        """Record the PONG answering ping_id"""
+        self.touch()
+        if ping_id is None or ping_id != self.ping_id:
+            return
+        self.rtt = self.scheduler.time() - self.ping_time
+        self.srtt = self.rtt if self.srtt is None else self.srtt + RTT_SMOOTHING * (self.rtt - self.srtt)
+        self.ping_id = None
+
+    def sample_every(self, seconds):
+        """Also ping every `seconds` to sample the RTT. Call on the scheduler's thread."""
+        with self.lock:
+            self.sample_interval = seconds
+            if self.cancelled or self.awaiting:
+                return
+            handle, self.handle = self.handle, self.scheduler.call_later(0, self.check)
+        if handle is not None:
+            handle.cancel()
+
+    def check(self):
+        with self.lock:
+            if self.cancelled:
+                return
+            now = self.scheduler.time()
+            dead = self.awaiting and self.last_activity < self.ping_time
+            if dead:
+                self.cancelled = True
+                self.handle = None
+            else:
+                self.awaiting = False
+                deadline = self.last_activity + self.interval
+                if self.sample_interval is not None:
+                    last_ping = self.ping_time if self.ping_time is not None else float("-inf")
+                    deadline = min(deadline, last_ping + self.sample_interval)
+                if now < deadline:
+                    self.handle = self.scheduler.call_at(deadline, self.check)
+                    return
+                ping_id = self.ping_id = next(self.ids)
+                self.ping_time = now
+                self.awaiting = True
+                self.handle = self.scheduler.call_at(now + self.timeout, self.check)
+        if dead:
+            self.metrics.incr("heartbeat.dead")
+            self.on_dead()
+            return
+        self.metrics.incr("heartbeat.pings")
+        self.send_ping(ping_id)
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            handle, self.handle = self.handle, None
+        if handle is not None:
+            handle.cancel()
@@ -0,0 +1,322 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import chess
+
+from server.persistence import DATA_DIR, BatchWriteError
+
+JOURNAL_DIR = os.path.join(DATA_DIR, "game_journal")
+
+# When appended records are forced to disk:
+#   "always"   - fsync after every record; nothing is lost on a crash
+#   "interval" - fsync at most once every FSYNC_INTERVAL seconds
+#   "never"    - leave it to the operating system
+FSYNC_POLICY = "interval"
+FSYNC_INTERVAL = 1.0
+SNAPSHOT_EVERY = 32  # Plies between snapshots; the journal is truncated after each one
+# Journal files a store keeps open. Beyond this the least recently written
+# is closed and reopened on its next move, so live games don't use up fds.
+MAX_OPEN_JOURNALS = 128
+
+FSYNC_POLICIES = ("always", "interval", "never")
+
+
+class GameJournal:
+    """Append-only log of one game's moves plus its latest snapshot.
+
+    <game_id>.log holds one compact JSON line per ply. <game_id>.snap holds
+    the full game state as of some ply and is replaced atomically, after
+    which the log only needs the plies that came later.
+    """
+
+    def __init__(self, directory, game_id, fsync_policy=FSYNC_POLICY, fsync_interval=FSYNC_INTERVAL):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy {fsync_policy!r}, expected one of {FSYNC_POLICIES}")
+        self.game_id = game_id
+        self.log_path = os.path.join(directory, f"{game_id}.log")
+        self.snapshot_path = os.path.join(directory, f"{game_id}.snap")
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.last_fsync = time.monotonic()
+        self.file = None
+        self.ply = None  # Last ply written, read from disk on first use
+        self.snapshot_ply = None
+        self.has_snapshot = False
+
+    def open(self):
+        if self.file is None:
+            if self.ply is None:
+                state, records = self.read()
+                self.has_snapshot = state is not None
+                self.snapshot_ply = state.get("ply", 0) if state else 0
+                self.ply = records[-1]["ply"] if records else self.snapshot_ply
+            self.file = open(self.log_path, "a", encoding="utf-8")
+        return self.file
+
+    def append(self, record, sync=True):
+        """Write one record as a single line.
+
+        With sync=False the record stays in the file buffer until sync().
+        """
+        file = self.open()
+        file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        if sync:
+            self.sync()
+
+    def sync(self):
+        """Flush buffered records and apply the fsync policy."""
+        if self.file is None:
+            return
+        self.file.flush()
+        if self.fsync_policy == "always":
+            os.fsync(self.file.fileno())
+        elif self.fsync_policy == "interval":
+            now = time.monotonic()
+            if now - self.last_fsync >= self.fsync_interval:
+                os.fsync(self.file.fileno())
+                self.last_fsync = now
+
+    def record_move(self, move, state, sync=True):
+        """Append the record for the next ply. Returns the ply number."""
+        self.open()
+        ply = self.ply + 1
+        record = {
+            "ply": ply,
+            "move": move,
+            "next": state.get("current_player"),
+            "over": state.get("game_over", False),
+        }
+        if "board" in state:
+            # Lets recovery start from the position instead of replaying
+            record["fen"] = state["board"]
+        if "clocks" in state:
+            record["clocks"] = state["clocks"]
+        if state.get("think_times"):
+            # Only the new ply's think time; the snapshot holds the earlier ones
+            record["think"] = state["think_times"][-1]
+        self.append(record, sync)
+        # Only once the record is written, so a failed append can be retried
+        self.ply = ply
+        return ply
+
+    def write_snapshot(self, state):
+        """Atomically replace the snapshot, then start a fresh log."""
+        self.open()
+        state = dict(state, ply=self.ply)
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, separators=(",", ":"))
+            f.flush()
+            if self.fsync_policy != "never":
+                os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        self.snapshot_ply = self.ply
+        self.has_snapshot = True
+
+        # Every logged ply is now covered by the snapshot. If we crash before
+        # the truncation the old records are skipped on load by their ply.
+        self.file.close()
+        self.file = open(self.log_path, "w", encoding="utf-8")
+
+    def read(self):
+        """Return (snapshot state or None, log records newer than the snapshot)."""
+        state = None
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        snapshot_ply = state.get("ply", 0) if state else 0
+
+        try:
+            with open(self.log_path, encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            lines = []
+        try:
+            # One parse for the whole log; recovery reads every live game's
+            records = json.loads("[" + ",".join(lines) + "]")
+        except json.JSONDecodeError:
+            records = []
+            for line in lines:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-append
+                    break
+        return state, [record for record in records if record["ply"] > snapshot_ply]
+
+    def load(self):
+        """Rebuild the latest game state from the snapshot and the log."""
+        state, board = self.load_game()
+        if state is not None:
+            state["board"] = board.fen()
+        return state
+
+    def load_game(self, replay=True):
+        """Return (latest state, chess.Board) or (None, None) for an unknown game.
+
+        The board is the snapshot's position with the logged moves replayed
+        on it, so it carries their move stack. With replay=False it is set
+        up from the last record's position instead, with an empty move
+        stack, which is much cheaper when every live game is loaded at once.
+        """
+        state, records = self.read()
+        if state is None:
+            return None, None
+        if records and not replay and "fen" in records[-1]:
+            board = chess.Board(records[-1]["fen"])
+        else:
+            board = chess.Board(state["board"])
+            for record in records:
+                # Only legal moves are ever logged, so skip the legality check
+                board.push(chess.Move.from_uci(record["move"]))
+        if records:
+            last = records[-1]
+            state["current_player"] = last["next"]
+            state["game_over"] = last["over"]
+            state["ply"] = last["ply"]
+            if "clocks" in last:
+                state["clocks"] = last["clocks"]
+            think_times = [record["think"] for record in records if "think" in record]
+            if think_times:
+                state["think_times"] = state.get("think_times", []) + think_times
+        return state, board
+
+    def close(self):
+        if self.file is not None:
+            # Records still buffered are written out under the fsync policy
+            self.sync()
+            self.file.close()
+            self.file = None
+
+    def remove(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        for path in (self.log_path, self.snapshot_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class JournalStore:
+    """Game store keeping a GameJournal per game.
+
+    A move costs one small append no matter how many games are live, and
+    games never touch each other's files. At most max_open journal files
+    are open at once; writes come from the PersistenceWorker's one thread,
+    which is also the one closing them.
+    """
+
+    def __init__(self, directory=JOURNAL_DIR, fsync_policy=FSYNC_POLICY,
+                 fsync_interval=FSYNC_INTERVAL, snapshot_every=SNAPSHOT_EVERY,
+                 max_open=MAX_OPEN_JOURNALS):
+        self.directory = directory
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+        self.max_open = max_open
+        self.journals = {}
+        self.open_journals = OrderedDict()  # game_id -> journal with an open file, least recently written first
+        self.lock = threading.Lock()  # Guards the journals dicts, not the files
+        os.makedirs(directory, exist_ok=True)
+
+    def journal(self, game_id):
+        with self.lock:
+            journal = self.journals.get(game_id)
+            if journal is None:
+                journal = GameJournal(self.directory, game_id, self.fsync_policy, self.fsync_interval)
+                self.journals[game_id] = journal
+            return journal
+
+    def written(self, journal):
+        """Note a write to a journal, closing the least recently written files beyond max_open."""
+        with self.lock:
+            self.open_journals[journal.game_id] = journal
+            self.open_journals.move_to_end(journal.game_id)
+            idle = []
+            while len(self.open_journals) > self.max_open:
+                idle.append(self.open_journals.popitem(last=False)[1])
+        for journal in idle:
+            journal.close()
+
+    def save_state(self, game_id, state):
+        """Store the complete state of a game as its new snapshot."""
+        journal = self.journal(game_id)
+        journal.write_snapshot(state)
+        self.written(journal)
+
+    def record_move(self, game_id, move, state, sync=True):
+        """Append one ply; state is the game state after the move."""
+        journal = self.journal(game_id)
+        ply = journal.record_move(move, state, sync)
+        self.written(journal)
+        # Without a snapshot the log would have no base to replay from
+        if not journal.has_snapshot or ply - journal.snapshot_ply >= self.snapshot_every:
+            try:
+                journal.write_snapshot(state)
+            except OSError as e:
+                # The move is in the log; the snapshot is tried again on the next one
+                print(f"Error writing snapshot of game {game_id}: {e}")
+
+    def write_batch(self, events):
+        """Apply a batch of (kind, game_id, args) events with one sync per game.
+
+        This is the group commit used by server.persistence.PersistenceWorker:
+        however many plies a game got in the batch, its log is flushed and
+        fsynced once.
+        """
+        touched = {}
+        written = 0
+        try:
+            for kind, game_id, args in events:
+                if kind == "move":
+                    self.record_move(game_id, *args, sync=False)
+                    touched[game_id] = self.journal(game_id)
+                elif kind == "state":
+                    self.save_state(game_id, *args)
+                elif kind in ("finish", "remove"):
+                    touched.pop(game_id, None)
+                    self.remove(game_id)
+                else:
+                    raise ValueError(f"Unknown persistence event {kind!r}")
+                written += 1
+            for journal in touched.values():
+                journal.sync()
+        except Exception as e:
+            # Events already applied must not be appended again on a retry
+            raise BatchWriteError(written, e) from e
+
+    def load_state(self, game_id):
+        return self.journal(game_id).load()
+
+    def load_game(self, game_id, replay=True):
+        """Return (latest state, chess.Board) or (None, None) for an unknown game."""
+        # Recovery loads every game once; don't keep a journal object for each
+        with self.lock:
+            journal = self.journals.get(game_id)
+        if journal is None:
+            journal = GameJournal(self.directory, game_id)
+        return journal.load_game(replay)
+
+    def active_game_ids(self):
+        """Every game with a snapshot; finished games have been removed."""
+        return [entry.name[:-len(".snap")] for entry in os.scandir(self.directory)
+                if entry.name.endswith(".snap")]
+
+    def finish(self, game_id, winner, reason=None):
+        """Journals only cover live games, so a finished game is removed."""
+        self.remove(game_id)
+
+    def remove(self, game_id):
+        with self.lock:
+            journal = self.journals.pop(game_id, None)
+            self.open_journals.pop(game_id, None)
+        if journal is None:
+            journal = GameJournal(self.directory, game_id)
+        journal.remove()
@@ -1,32 +1,54 @@
 import uuid
+from server.matchmaking import DEFAULT_RATING, Matchmaker
 
 class Lobby:
     def __init__(self):
         self.waiting_players = {}  # player_id: socket
-        self.games = {}  # game_id: {player_id: socket}
+        self.games = {}  # game_id: {player_id: socket}, white first
+        self.time_controls = {}  # game_id: time control key the players were matched on
+        # Waiting players by time control and rating; see server.matchmaking
+        self.matchmaker = Matchmaker()
 
-    def add_player(self, player_id, socket):
+    def add_player(self, player_id, socket, rating=DEFAULT_RATING, time_control=None):
         print(f"Adding player {player_id}")
         if player_id in self.waiting_players:
             print(f"Player {player_id} already in waiting list")
             return None
 
-        if not self.waiting_players:
-            print(f"No waiting players, adding {player_id} to waiting list")
+        ticket = self.matchmaker.enqueue(player_id, rating, time_control, data=socket)
+        opponent = self.matchmaker.find_opponent(ticket)
+        if opponent is None:
+            print(f"No opponent near {rating} yet, adding {player_id} to waiting list")
             self.waiting_players[player_id] = socket
             return None
 
         # Pair with a waiting player
-        opponent_id, opponent_socket = next(iter(self.waiting_players.items()))
-        print(f"Pairing {player_id} with {opponent_id}")
-        del self.waiting_players[opponent_id]
+        print(f"Pairing {player_id} with {opponent.player_id}")
+        return self.create_game(opponent, ticket)
 
+    def match_waiting(self):
+        """Pair waiting players whose rating windows have widened enough; returns the new game IDs"""
+        return [self.create_game(first, second) for first, second in self.matchmaker.match()]
+
+    def remove_player(self, player_id):
+        """Forget a waiting player, e.g. one who disconnected before being paired"""
+        if self.waiting_players.pop(player_id, None) is not None:
+            self.matchmaker.cancel(player_id)
+            print(f"Removed {player_id} from waiting list")
+
+    def create_game(self, first, second):
+        """A game for two matched tickets. `first` plays white: from add_player()
+        that is the one who was already waiting, from match() the lower rated.
+        """
+        self.waiting_players.pop(first.player_id, None)
+        self.waiting_players.pop(second.player_id, None)
         game_id = str(uuid.uuid4())
         self.games[game_id] = {
-            opponent_id: opponent_socket,
-            player_id: socket
+            first.player_id: first.data,
+            second.player_id: second.data
         }
-        print(f"Game {game_id} created with players {opponent_id} and {player_id}")
+        self.time_controls[game_id] = first.time_control
+        print(f"Game {game_id} created with players {first.player_id} and {second.player_id}")
         return game_id
 
     def add_spectator(self, game_id, socket):
@@ -39,4 +61,4 @@ class Lobby:
 
     def get_game_players(self, game_id):
         print(f"Getting players for game {game_id}")
-        return self.games.get(game_id, {})
\ No newline at end of file
+        return self.games.get(game_id, {})
@@ -0,0 +1,198 @@
+import bisect
+import itertools
+import threading
+
+# Lobby index for GET_GAMES.
+#
+# The server publishes every change to a listed game (created, joined,
+# spectators coming and going, finished) as that game's lobby entry, so
+# GET_GAMES is answered from here without touching the games themselves.
+# Entries are kept sorted per status and order, so a page is a bisect and
+# a slice whatever the number of games. Every change bumps `version`.
+#
+# Subscribers get LOBBY_DIFF messages instead of polling. Changes are
+# collected for DIFF_INTERVAL and sent together, one entry per changed game,
+# so a busy game costs its watchers at most one diff entry per interval.
+
+LISTED_STATUSES = ("waiting", "playing")
+ORDERS = ("newest", "popular")
+PAGE_SIZE = 20  # Games per page when the request does not say
+MAX_PAGE_SIZE = 100
+DIFF_INTERVAL = 0.5  # Seconds changes are collected before subscribers are sent a LOBBY_DIFF
+PAGE_FIELDS = ("status", "order", "cursor", "limit", "subscribe")
+
+
+def wants_page(message):
+    """True if a GET_GAMES asks for a page rather than the whole list"""
+    return any(field in message for field in PAGE_FIELDS)
+
+
+def sort_key(entry, order):
+    """Position of an entry in an order; also what a cursor holds"""
+    if order == "popular":
+        return (-entry["spectator_count"], -entry["created_at"], entry["game_id"])
+    return (-entry["created_at"], entry["game_id"])
+
+
+def merge_pages(pages, order="newest", limit=PAGE_SIZE):
+    """One GAME_LIST from the GAME_LIST pages several servers sent for the same request.
+
+    A cursor is a position in the order, not a game, so every server pages
+    from the same one and the first `limit` of their games together are
+    exactly the next page of all of them. Totals and versions are summed.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    games = sorted((game for page in pages for game in page.get("games", [])),
+                   key=lambda game: sort_key(game, order))
+    more = len(games) > limit or any(page.get("cursor") is not None for page in pages)
+    games = games[:limit]
+    return {
+        "type": "GAME_LIST",
+        "games": games,
+        "cursor": list(sort_key(games[-1], order)) if more and games else None,
+        "total": sum(page.get("total", 0) for page in pages),
+        "version": sum(page.get("version", 0) for page in pages)
+    }
+
+
+class LobbyIndex:
+    """Listed games, sorted for paging, with a change feed.
+
+    `call_later(delay, callback)` is the server's scheduler; diffs are sent
+    from its callbacks. Safe to use from any thread.
+    """
+
+    def __init__(self, call_later, interval=DIFF_INTERVAL):
+        self.call_later = call_later
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.version = 0
+        self.entries = {}  # game_id -> entry
+        # (status or None for all, order) -> sorted keys
+        self.sorted = {(status, order): [] for status in LISTED_STATUSES + (None,) for order in ORDERS}
+        self.published = {}  # game_id -> entry as subscribers last saw it
+        self.pending = set()  # game_ids changed since the last diff
+        self.flush_timer = None
+        self.subscribers = {}  # id -> (send, status)
+        self.subscriber_ids = itertools.count(1)
+
+    def update(self, entry):
+        """Add or change a game's entry; one that is no longer listed is removed"""
+        if entry["status"] not in LISTED_STATUSES:
+            self.remove(entry["game_id"])
+            return
+        with self.lock:
+            old = self.entries.get(entry["game_id"])
+            if old == entry:
+                return
+            if old:
+                self._unindex(old)
+            self.entries[entry["game_id"]] = entry
+            self._index(entry)
+            self._changed(entry["game_id"])
+
+    def remove(self, game_id):
+        with self.lock:
+            old = self.entries.pop(game_id, None)
+            if old is None:
+                return
+            self._unindex(old)
+            self._changed(game_id)
+
+    def _buckets(self, entry):
+        for status in (entry["status"], None):
+            for order in ORDERS:
+                yield self.sorted[(status, order)], sort_key(entry, order)
+
+    def _index(self, entry):
+        for keys, key in self._buckets(entry):
+            bisect.insort(keys, key)
+
+    def _unindex(self, entry):
+        for keys, key in self._buckets(entry):
+            index = bisect.bisect_left(keys, key)
+            if index < len(keys) and keys[index] == key:
+                del keys[index]
+
+    def _changed(self, game_id):
+        self.version += 1
+        if not self.subscribers:
+            # Nobody to tell; subscribers start from a page of current entries
+            self.published.pop(game_id, None)
+            return
+        self.pending.add(game_id)
+        if self.flush_timer is None:
+            self.flush_timer = self.call_later(self.interval, self.flush)
+
+    def all(self):
+        """Every listed game, newest first"""
+        with self.lock:
+            return [self.entries[key[-1]] for key in self.sorted[(None, "newest")]]
+
+    def page(self, status=None, order="newest", cursor=None, limit=PAGE_SIZE):
+        """A page of games after `cursor`, as (games, next cursor or None, total, version).
+
+        Raises ValueError for an unknown status or order or a malformed cursor.
+        """
+        if status is not None and status not in LISTED_STATUSES:
+            raise ValueError(f"Unknown status {status!r}")
+        if order not in ORDERS:
+            raise ValueError(f"Unknown order {order!r}")
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        with self.lock:
+            keys = self.sorted[(status, order)]
+            start = 0
+            if cursor is not None:
+                if not isinstance(cursor, list) or len(cursor) != (3 if order == "popular" else 2):
+                    raise ValueError("Malformed cursor")
+                # Keys are unique, so this starts right after the last game sent
+                start = bisect.bisect_right(keys, tuple(cursor))
+            selected = keys[start:start + limit]
+            games = [self.entries[key[-1]] for key in selected]
+            more = start + limit < len(keys)
+            return games, list(selected[-1]) if more else None, len(keys), self.version
+
+    # Change feed
+
+    def subscribe(self, send, status=None):
+        """Have send(message) called with a LOBBY_DIFF whenever games matching `status` change.
+
+        Returns an ID for unsubscribe().
+        """
+        with self.lock:
+            subscriber_id = next(self.subscriber_ids)
+            if not self.subscribers:
+                # Diffs are against what the new subscriber's first page shows
+                self.published = dict(self.entries)
+            self.subscribers[subscriber_id] = (send, status)
+            return subscriber_id
+
+    def unsubscribe(self, subscriber_id):
+        with self.lock:
+            self.subscribers.pop(subscriber_id, None)
+
+    def flush(self):
+        """Send every subscriber the changes of the last interval that concern it"""
+        with self.lock:
+            self.flush_timer = None
+            changes = []
+            for game_id in self.pending:
+                changes.append((game_id, self.published.get(game_id), self.entries.get(game_id)))
+                if game_id in self.entries:
+                    self.published[game_id] = self.entries[game_id]
+                else:
+                    self.published.pop(game_id, None)
+            self.pending.clear()
+            subscribers = list(self.subscribers.values())
+            version = self.version
+        for send, status in subscribers:
+            diff = {"type": "LOBBY_DIFF", "version": version, "added": [], "changed": [], "removed": []}
+            for game_id, old, new in changes:
+                was = old is not None and status in (None, old["status"])
+                now = new is not None and status in (None, new["status"])
+                if now:
+                    diff["changed" if was else "added"].append(new)
+                elif was:
+                    diff["removed"].append(game_id)
+            if diff["added"] or diff["changed"] or diff["removed"]:
+                send(diff)
@@ -1,10 +1,11 @@
 import socket
 import threading
 import json
-import time
 from server.lobby import Lobby
 from server.game_logic import ChessGame
+from server.scheduler import Scheduler
 from common.message import Message
+from common.framing import FrameReader
 from common.constants import (
     HOST, PORT, CHAT_PORT, TIME_LIMIT_SECONDS
 )
@@ -16,8 +17,11 @@ class ChessServer:
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.chat_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.lock = threading.Lock()
+        # Turn timeouts of every game run on this one thread
+        self.scheduler = Scheduler()
 
     def start(self):
+        self.scheduler.start()
         self.server_socket.bind((HOST, PORT))
         self.server_socket.listen(10)
         self.chat_socket.bind((HOST, CHAT_PORT))
@@ -42,15 +46,15 @@ class ChessServer:
     def handle_client(self, client_socket, addr):
         try:
             # Receive initial message to determine client type
-            data = client_socket.recv(1024).decode()
-            message = Message.from_json(data)
+            reader = FrameReader(client_socket)
+            message = Message.from_dict(reader.read_message())
 
             if message.type == "JOIN_LOBBY":
                 player_id = message.data.get("player_id", f"Player_{addr[1]}")
                 with self.lock:
                     game_id = self.lobby.add_player(player_id, client_socket)
                     if game_id:
-                        self.start_game(game_id, client_socket, player_id)
+                        self.start_game(game_id, client_socket, reader, player_id)
                     else:
                         # Player is in lobby waiting for opponent
                         self.send_message(client_socket, Message("WAITING", {"message": "Waiting for opponent..."}))
@@ -60,7 +64,7 @@ class ChessServer:
         finally:
             client_socket.close()
 
-    def start_game(self, game_id, client_socket, player_id):
+    def start_game(self, game_id, client_socket, reader, player_id):
         with self.lock:
             if game_id not in self.games:
                 self.games[game_id] = ChessGame(game_id, TIME_LIMIT_SECONDS)
@@ -84,22 +88,24 @@ class ChessServer:
                     }))
 
                 # Start turn management
-                threading.Thread(target=self.manage_turns, args=(game,), daemon=True).start()
+                self.start_turn(game)
 
             # Handle game moves
-            self.handle_game_moves(game, client_socket, player_id)
+            self.handle_game_moves(game, client_socket, reader, player_id)
 
-    def handle_game_moves(self, game, client_socket, player_id):
+    def handle_game_moves(self, game, client_socket, reader, player_id):
         while True:
             try:
-                data = client_socket.recv(1024).decode()
+                data = reader.read_message()
                 if not data:
                     break
 
-                message = Message.from_json(data)
+                message = Message.from_dict(data)
                 if message.type == "MOVE":
                     move = message.data["move"]
                     if game.make_move(player_id, move):
+                        # The opponent's turn timer starts now
+                        self.start_turn(game)
                         # Broadcast updated board to all players and spectators
                         self.broadcast_game_state(game)
                     else:
@@ -109,45 +115,40 @@ class ChessServer:
                 print(f"Error handling moves for {player_id}: {e}")
                 break
 
-    def manage_turns(self, game):
-        """Manage the turns and time control for a game."""
-        print(f"Turn management started for game {game.game_id}")
-        try:
-            while not game.is_game_over():
-                current_player = game.current_player()
-                game.start_turn_timer()
-
-                # Wait for the turn to complete or timeout
-                wait_start = time.time()
-                while game.current_player() == current_player and not game.is_game_over():
-                    # Check for timeout every second
-                    if game.has_timed_out():
-                        print(f"Player {current_player} timed out")
-                        game.end_game(f"{current_player} timed out")
-                        self.broadcast_game_state(game)
-                        break
-
-                    # Prevent infinite loop by adding a maximum wait time
-                    if time.time() - wait_start > 300:  # 5 minutes max wait
-                        print(f"Maximum wait time exceeded for {current_player}")
-                        break
-
-                    # Sleep briefly to avoid high CPU usage
-                    threading.Event().wait(1)
-
-                print(f"Turn ended for {current_player}")
-        except Exception as e:
-            print(f"Error in manage_turns: {e}")
-            import traceback
-            traceback.print_exc()
+    def start_turn(self, game):
+        """Start the turn timer of the player on move and schedule their timeout."""
+        if game.turn_timeout:
+            game.turn_timeout.cancel()
+            game.turn_timeout = None
+        if game.is_game_over():
+            return
+        game.start_turn_timer()
+        game.turn_timeout = self.scheduler.call_later(
+            game.clock.time_to_flag(), self.check_turn_timeout, game, game.current_player())
+
+    def check_turn_timeout(self, game, player_id):
+        """Scheduler callback: end the game if player_id is still on move."""
+        if game.is_game_over() or game.current_player() != player_id:
+            return
+        if not game.has_timed_out():
+            # Fired a little early; check again once the flag falls
+            remaining = game.clock.time_to_flag()
+            game.turn_timeout = self.scheduler.call_later(
+                max(remaining, 0.01), self.check_turn_timeout, game, player_id)
+            return
+        print(f"Player {player_id} timed out")
+        game.turn_timeout = None
+        game.end_game(f"{player_id} timed out")
+        self.broadcast_game_state(game)
 
     def handle_chat(self, chat_socket, addr):
         try:
+            reader = FrameReader(chat_socket)
             while True:
-                message = chat_socket.recv(1024).decode()
+                message = reader.read_message()
                 if not message:
                     break
-                chat_msg = Message.from_json(message)
+                chat_msg = Message.from_dict(message)
                 if chat_msg.type == "CHAT":
                     game_id = chat_msg.data["game_id"]
                     print(f"Server received chat message for game {game_id}: {chat_msg.data}")
@@ -176,7 +177,7 @@ class ChessServer:
 
     def send_message(self, socket, message):
         try:
-            socket.send(message.to_json().encode())
+            socket.sendall(message.to_frame())
         except Exception as e:
             print(f"Error sending message: {e}")
 
@@ -0,0 +1,168 @@
+import bisect
+import time
+
+# Matchmaking queue for JOIN_LOBBY.
+#
+# Waiting players are kept per time control and, within one, in rating
+# buckets of BUCKET_WIDTH points. A bucket is a dict in arrival order, so
+# joining the queue, leaving it and being taken out of it by a match are
+# dict operations plus a bisect in the short sorted list of buckets in use.
+# That list is bounded by the rating range, not by the number of players.
+#
+# A player accepts opponents within a rating window that starts at
+# BASE_WINDOW and widens by WIDEN_RATE points per second of waiting, up to
+# MAX_WINDOW. Two players are paired only when each is within the other's
+# window. find_opponent() pairs a newcomer straight away when someone
+# suitable is already waiting; match() is the periodic pass that walks each
+# queue in rating order and pairs neighbours as their windows widen.
+
+BUCKET_WIDTH = 50  # Rating points per bucket
+BASE_WINDOW = 50  # Rating difference accepted on joining the queue
+WIDEN_RATE = 10  # Rating points the window widens by per second of waiting
+MAX_WINDOW = 400
+MATCH_INTERVAL = 1.0  # Seconds between matching passes
+DEFAULT_RATING = 1500
+MIN_RATING = 0
+MAX_RATING = 4000
+
+
+def parse_rating(value):
+    """Rating from a JOIN_LOBBY, DEFAULT_RATING if not given. Raises ValueError if unusable."""
+    if value is None:
+        return DEFAULT_RATING
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"Rating must be a number, got {value!r}")
+    if not MIN_RATING <= value <= MAX_RATING:
+        raise ValueError(f"Rating must be between {MIN_RATING} and {MAX_RATING}, got {value}")
+    return int(value)
+
+
+class Ticket:
+    """A player's place in the queue. `data` is whatever the server needs to seat them."""
+
+    def __init__(self, player_id, rating, time_control, queued_at, data=None):
+        self.player_id = player_id
+        self.rating = rating
+        self.time_control = time_control
+        self.queued_at = queued_at
+        self.data = data
+
+    def window(self, now):
+        """Rating difference this player accepts after waiting until `now`"""
+        return min(MAX_WINDOW, BASE_WINDOW + WIDEN_RATE * max(0.0, now - self.queued_at))
+
+    def accepts(self, other, now):
+        difference = abs(self.rating - other.rating)
+        return difference <= self.window(now) and difference <= other.window(now)
+
+
+class Matchmaker:
+    """Players waiting for an opponent of similar rating on the same time control.
+
+    `time_control` is any hashable key; only players with equal keys meet.
+    Not thread-safe: the servers call it under their own lock.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.queues = {}  # time_control -> {bucket: {player_id: Ticket}}
+        self.buckets = {}  # time_control -> sorted buckets in use
+        self.tickets = {}  # player_id -> Ticket
+
+    def __len__(self):
+        return len(self.tickets)
+
+    def __contains__(self, player_id):
+        return player_id in self.tickets
+
+    def get(self, player_id):
+        return self.tickets.get(player_id)
+
+    def enqueue(self, player_id, rating, time_control=None, data=None, now=None):
+        """Queue a player, replacing any ticket they already hold; returns the new ticket"""
+        self.cancel(player_id)
+        ticket = Ticket(player_id, rating, time_control, self.clock() if now is None else now, data)
+        bucket = rating // BUCKET_WIDTH
+        queue = self.queues.setdefault(time_control, {})
+        if bucket not in queue:
+            queue[bucket] = {}
+            bisect.insort(self.buckets.setdefault(time_control, []), bucket)
+        queue[bucket][player_id] = ticket
+        self.tickets[player_id] = ticket
+        return ticket
+
+    def cancel(self, player_id, ticket=None):
+        """Take a player out of the queue. With `ticket`, only if that is still their ticket.
+
+        Returns the removed ticket, or None if there was nothing to remove
+        (never queued, already matched or queued again since).
+        """
+        queued = self.tickets.get(player_id)
+        if queued is None or (ticket is not None and queued is not ticket):
+            return None
+        self.dequeue(queued)
+        return queued
+
+    def dequeue(self, ticket):
+        del self.tickets[ticket.player_id]
+        bucket = ticket.rating // BUCKET_WIDTH
+        queue = self.queues[ticket.time_control]
+        del queue[bucket][ticket.player_id]
+        if not queue[bucket]:
+            del queue[bucket]
+            buckets = self.buckets[ticket.time_control]
+            del buckets[bisect.bisect_left(buckets, bucket)]
+            if not buckets:
+                del self.buckets[ticket.time_control]
+                del self.queues[ticket.time_control]
+
+    def find_opponent(self, ticket, now=None):
+        """Pair a queued player with the closest acceptable opponent, if any.
+
+        Only buckets within the player's window are looked at, and in each
+        only up to the longest-waiting acceptable player. Both are taken out
+        of the queue; returns the opponent's ticket or None.
+        """
+        now = self.clock() if now is None else now
+        queue = self.queues.get(ticket.time_control, {})
+        buckets = self.buckets.get(ticket.time_control, [])
+        window = ticket.window(now)
+        low = bisect.bisect_left(buckets, (ticket.rating - window) // BUCKET_WIDTH)
+        high = bisect.bisect_right(buckets, (ticket.rating + window) // BUCKET_WIDTH)
+        best = None
+        for bucket in buckets[low:high]:
+            for other in queue[bucket].values():
+                if other is not ticket and ticket.accepts(other, now):
+                    if best is None or abs(other.rating - ticket.rating) < abs(best.rating - ticket.rating):
+                        best = other
+                    break
+        if best is not None:
+            self.dequeue(ticket)
+            self.dequeue(best)
+        return best
+
+    def match(self, now=None):
+        """The periodic pass: pair players in rating order; returns (ticket, ticket) pairs.
+
+        Each queue is walked once from the lowest rating up, holding at most
+        one unpaired player. When the next player is not acceptable the one
+        whose window reaches higher is kept, since everyone after is rated
+        higher still. Paired players are taken out of the queue.
+        """
+        now = self.clock() if now is None else now
+        pairs = []
+        for time_control, queue in self.queues.items():
+            pending = None
+            for bucket in self.buckets[time_control]:
+                for ticket in sorted(queue[bucket].values(), key=lambda ticket: ticket.rating):
+                    if pending is None:
+                        pending = ticket
+                    elif pending.accepts(ticket, now):
+                        pairs.append((pending, ticket))
+                        pending = None
+                    elif ticket.rating + ticket.window(now) >= pending.rating + pending.window(now):
+                        pending = ticket
+        for first, second in pairs:
+            self.dequeue(first)
+            self.dequeue(second)
+        return pairs
@@ -0,0 +1,27 @@
+import threading
+
+
+class Metrics:
+    """Thread-safe named counters and gauges for server instrumentation."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+
+    def incr(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def snapshot(self):
+        """Return a copy of all counters and gauges."""
+        with self.lock:
+            return {"counters": dict(self.counters), "gauges": dict(self.gauges)}
+
+
+# Shared instance used by the servers unless they are given their own
+metrics = Metrics()
@@ -0,0 +1,349 @@
+import socket
+import threading
+import time
+from collections import deque
+
+from common.mux import CHANNEL_LANES, channel_for, encode_channel_frame
+from server.metrics import metrics as default_metrics
+
+# Maximum number of frames that may wait for a single client before new
+# frames are refused. Keeps one slow reader from growing server memory.
+OUTBOUND_QUEUE_LIMIT = 256
+
+# Slow-consumer policy defaults
+COALESCE_DEPTH = 4  # Queued frames before superseded state updates are coalesced
+DOWNGRADE_BYTES = 64 * 1024  # Queued bytes before a spectator stops getting low-value traffic
+EVICT_BYTES = 512 * 1024  # Queued bytes before a spectator is disconnected
+STALL_TIMEOUT = 15.0  # Seconds without a completed write before a spectator is disconnected
+
+# Message types where only the newest queued copy matters. BOARD_DELTA is
+# not one of them: each delta applies on top of the one before it.
+COALESCE_KINDS = {"BOARD_UPDATE", "TIME_UPDATE"}
+# Message types a downgraded connection no longer receives
+DOWNGRADE_DROP_KINDS = {"TIME_UPDATE", "CHAT", "SPECTATOR_JOINED", "SPECTATOR_LEFT"}
+
+# Priority lanes of a client's outbound queue, written in this order. Moves
+# and game state go first so the update a player is waiting for is not stuck
+# behind chat or clock ticks.
+STATE_LANE = 0
+CONTROL_LANE = 1
+CHAT_LANE = 2
+CLOCK_LANE = 3
+LANES = 4
+# Everything else is a control message. Messages a client reads as steps of
+# the same game (waiting, opponent joined, game start, moves, errors) share
+# STATE_LANE, so none of them overtakes an earlier one.
+MESSAGE_LANES = {
+    "BOARD_DELTA": STATE_LANE,
+    "BOARD_UPDATE": STATE_LANE,
+    "ERROR": STATE_LANE,
+    "GAME_CREATED": STATE_LANE,
+    "GAME_JOINED": STATE_LANE,
+    "GAME_REJOINED": STATE_LANE,
+    "GAME_START": STATE_LANE,
+    "MATCH_FOUND": STATE_LANE,
+    "GAME_OVER": STATE_LANE,
+    "OPPONENT_DISCONNECTED": STATE_LANE,
+    "OPPONENT_JOINED": STATE_LANE,
+    "OPPONENT_RECONNECTED": STATE_LANE,
+    "RESUME_REJECTED": STATE_LANE,
+    "RESYNC": STATE_LANE,
+    "SPECTATE_START": STATE_LANE,
+    "WAITING": STATE_LANE,
+    "CHAT": CHAT_LANE,
+    "TIME_UPDATE": CLOCK_LANE,
+}
+# Queued frames a new frame makes stale. Board updates carry the clocks
+# too, and dropping the older ticks also keeps one from being written after
+# the board update that overtook it.
+SUPERSEDES = {
+    "TIME_UPDATE": ("TIME_UPDATE",),
+    "BOARD_DELTA": ("TIME_UPDATE",),
+    "BOARD_UPDATE": ("TIME_UPDATE",),
+}
+
+# Bytes a connection writes per sendall before looking for frames in a
+# higher-priority lane, which bounds how long a move waits behind a backlog
+WRITE_BATCH_BYTES = 16 * 1024
+# Multiplexed ChessServer channels are written in the lanes of common.mux;
+# False writes them in one FIFO (bench_mux compares the two)
+CHANNEL_PRIORITY = True
+
+QUEUE = "queue"
+DROP = "drop"
+EVICT = "evict"
+
+
+class OutboundQueue:
+    """Bounded queue of encoded frames waiting to be written to one client.
+
+    Frames are kept in one FIFO per lane. Lane 0 is written first, so with
+    several lanes a frame pushed to a lower lane overtakes everything still
+    queued in the higher ones; with the default single lane it is a plain
+    FIFO. The queue itself is not thread safe; the connection that owns it
+    provides the locking (or runs on a single event loop).
+    """
+
+    def __init__(self, limit=OUTBOUND_QUEUE_LIMIT, lanes=1):
+        self.limit = limit
+        self.lanes = [deque() for _ in range(lanes)]  # (kind, data) pairs per lane
+        self.queued_frames = 0
+        self.queued_bytes = 0
+        self.in_flight_bytes = 0  # Taken by the writer but not yet fully written
+        self.last_drain = time.monotonic()
+        self.dropped = 0
+        self.superseded = 0
+        self.downgraded = False
+
+    def __len__(self):
+        return self.queued_frames
+
+    def backlog_bytes(self):
+        return self.queued_bytes + self.in_flight_bytes
+
+    def is_idle(self):
+        return not self.queued_frames and not self.in_flight_bytes
+
+    def push(self, data, kind=None, lane=0):
+        """Queue a frame, dropping queued frames it supersedes. Returns False if the queue is full."""
+        for stale_kind in SUPERSEDES.get(kind, ()):
+            self.superseded += self.coalesce(stale_kind)
+        if self.queued_frames >= self.limit:
+            self.dropped += 1
+            return False
+        if self.is_idle():
+            # An idle queue counts as fully drained
+            self.last_drain = time.monotonic()
+        self.lanes[lane].append((kind, data))
+        self.queued_frames += 1
+        self.queued_bytes += len(data)
+        return True
+
+    def coalesce(self, kind):
+        """Drop queued frames of the given kind. Returns how many were removed."""
+        removed = 0
+        for number, frames in enumerate(self.lanes):
+            if not frames:
+                continue
+            kept = deque()
+            for queued_kind, data in frames:
+                if queued_kind == kind:
+                    self.queued_bytes -= len(data)
+                    removed += 1
+                else:
+                    kept.append((queued_kind, data))
+            self.lanes[number] = kept
+        self.queued_frames -= removed
+        return removed
+
+    def pop_all(self, max_bytes=None):
+        """Take queued frames, lane by lane and oldest first, and count them as in flight.
+
+        With max_bytes the writer only takes about that much (always at least
+        one frame), so frames queued meanwhile in a lower lane go out next.
+        """
+        frames = []
+        taken = 0
+        for lane in self.lanes:
+            while lane and (max_bytes is None or not frames or taken + len(lane[0][1]) <= max_bytes):
+                data = lane.popleft()[1]
+                frames.append(data)
+                taken += len(data)
+            if lane:
+                break
+        self.queued_frames -= len(frames)
+        self.queued_bytes -= taken
+        self.in_flight_bytes += taken
+        return frames
+
+    def mark_drained(self):
+        self.in_flight_bytes = 0
+        self.last_drain = time.monotonic()
+
+
+class SlowConsumerPolicy:
+    """Decides what happens to a frame sent to a client that is falling behind.
+
+    As the backlog grows the policy first coalesces superseded state updates
+    (only the newest BOARD_UPDATE/TIME_UPDATE is kept), then downgrades the
+    connection so it stops receiving clock ticks and chatter, and finally
+    evicts it if it is allowed to. Every action is counted in the metrics.
+    """
+
+    def __init__(self, name, coalesce_depth=COALESCE_DEPTH, downgrade_bytes=DOWNGRADE_BYTES,
+                 evict_bytes=EVICT_BYTES, stall_timeout=STALL_TIMEOUT,
+                 downgrade=True, evict=True, metrics=None):
+        self.name = name
+        self.coalesce_depth = coalesce_depth
+        self.downgrade_bytes = downgrade_bytes
+        self.evict_bytes = evict_bytes
+        self.stall_timeout = stall_timeout
+        self.downgrade = downgrade
+        self.evict = evict
+        self.metrics = metrics or default_metrics
+
+    def admit(self, connection, queue, data, kind):
+        """Apply the policy to a frame about to be queued.
+
+        Returns QUEUE, DROP or EVICT. Called with the connection's lock held.
+        """
+        backlog = queue.backlog_bytes()
+        if self.evict and not queue.is_idle():
+            stalled = time.monotonic() - queue.last_drain > self.stall_timeout
+            if stalled or backlog + len(data) > self.evict_bytes:
+                self.record("evicted", connection, "stalled" if stalled else f"{backlog} bytes queued")
+                return EVICT
+
+        if self.downgrade:
+            if queue.downgraded and backlog < self.downgrade_bytes // 2:
+                queue.downgraded = False
+                self.record("restored", connection)
+            elif not queue.downgraded and backlog > self.downgrade_bytes:
+                queue.downgraded = True
+                self.record("downgraded", connection, f"{backlog} bytes queued")
+            if queue.downgraded and kind in DOWNGRADE_DROP_KINDS:
+                self.metrics.incr(f"outbound.{self.name}.downgrade_dropped")
+                return DROP
+
+        if kind in COALESCE_KINDS and len(queue) >= self.coalesce_depth:
+            removed = queue.coalesce(kind)
+            if removed:
+                self.metrics.incr(f"outbound.{self.name}.coalesced", removed)
+
+        return QUEUE
+
+    def record(self, action, connection, detail=""):
+        self.metrics.incr(f"outbound.{self.name}.{action}")
+        print(f"Slow consumer {connection.addr} ({self.name}) {action}" + (f": {detail}" if detail else ""))
+
+
+def message_lane(kind):
+    """The outbound lane for a message type"""
+    return MESSAGE_LANES.get(kind, CONTROL_LANE)
+
+
+# Players are never disconnected for being slow, they only lose superseded updates
+PLAYER_POLICY = SlowConsumerPolicy("player", downgrade=False, evict=False)
+SPECTATOR_POLICY = SlowConsumerPolicy("spectator")
+# A relay's spectators all lose what it loses, so it is never downgraded or evicted either
+RELAY_POLICY = SlowConsumerPolicy("relay", downgrade=False, evict=False)
+
+
+class Connection:
+    """A client socket whose writes go through a bounded queue.
+
+    send() only appends to the queue and returns immediately, so it is safe to
+    call while holding server locks; a dedicated writer thread performs the
+    blocking socket writes. Frames that pile up while the client is slow are
+    written together, up to WRITE_BATCH_BYTES per sendall, in lane order (see
+    MESSAGE_LANES).
+    """
+
+    def __init__(self, sock, addr=None, limit=OUTBOUND_QUEUE_LIMIT, policy=None):
+        self.sock = sock
+        self.addr = addr
+        self.outbound = OutboundQueue(limit, LANES)
+        self.policy = policy
+        self.binary = False  # Set once the client negotiates the binary encoding in HELLO
+        self.heartbeat = None  # server.heartbeat.Heartbeat, if the client agreed to heartbeats
+        self.condition = threading.Condition()
+        self.closed = False
+        self.writer = threading.Thread(target=self.run_writer, daemon=True)
+        self.writer.start()
+
+    def send(self, data, kind=None, lane=None):
+        """Queue an encoded frame, in the lane of its kind unless given. Returns False if it was not accepted."""
+        with self.condition:
+            if self.closed:
+                return False
+            action = self.policy.admit(self, self.outbound, data, kind) if self.policy else QUEUE
+            if action == EVICT:
+                self.abort_locked()
+                return False
+            if lane is None:
+                lane = message_lane(kind)
+            if action == DROP or not self.outbound.push(data, kind, lane):
+                return False
+            self.condition.notify()
+        return True
+
+    def abort(self):
+        """Drop the connection at once, discarding anything still queued"""
+        with self.condition:
+            self.abort_locked()
+
+    def abort_locked(self):
+        # Discard the backlog and shut the socket down right away; the reader
+        # thread sees the connection drop and runs the normal disconnect path
+        self.closed = True
+        self.outbound.pop_all()
+        self.condition.notify()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def run_writer(self):
+        try:
+            while True:
+                with self.condition:
+                    while not self.outbound and not self.closed:
+                        self.condition.wait()
+                    frames = self.outbound.pop_all(WRITE_BATCH_BYTES)
+                    if not frames and self.closed:
+                        break
+
+                self.sock.sendall(b"".join(frames))
+                with self.condition:
+                    self.outbound.mark_drained()
+        except OSError as e:
+            print(f"Error writing to {self.addr}: {e}")
+            with self.condition:
+                self.closed = True
+                self.outbound.pop_all()
+        finally:
+            self.shutdown_socket()
+
+    def close(self):
+        """Stop accepting frames; the writer flushes what is queued and closes the socket."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+    def shutdown_socket(self):
+        try:
+            # Wakes up a reader thread blocked in recv on the same socket
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class MessageConnection(Connection):
+    """A ChessServer client socket: Messages are queued and written by the writer thread.
+
+    send_message() never blocks, so the scheduler thread may send PINGs and
+    timeouts, and several threads may write to the same client, without a
+    slow peer holding any of them up or frames interleaving. Frames go out
+    in the order they were sent until multiplex() switches the connection
+    to common.mux framing, after which each channel has its lane.
+    """
+
+    def __init__(self, sock, addr=None, limit=OUTBOUND_QUEUE_LIMIT):
+        super().__init__(sock, addr, limit)
+        self.multiplexed = False
+
+    def multiplex(self):
+        """The client carries game, control and chat on this connection (see common.mux)"""
+        self.multiplexed = True
+
+    def send_message(self, message):
+        """Queue a Message. Returns False if it was not accepted."""
+        if self.multiplexed:
+            channel = channel_for(message.type)
+            lane = CHANNEL_LANES[channel] if CHANNEL_PRIORITY else STATE_LANE
+            return self.send(encode_channel_frame(message, channel), message.type, lane)
+        return self.send(message.to_frame(), message.type, STATE_LANE)
@@ -0,0 +1,175 @@
+import os
+import threading
+import time
+from collections import deque
+
+from server.metrics import metrics as default_metrics
+
+# Where the built-in stores keep their files unless given a path: outside
+# the source tree, in $XDG_STATE_HOME/chess-server (~/.local/state/chess-server
+# if unset). CHESS_DATA_DIR overrides it.
+DATA_DIR = os.environ.get("CHESS_DATA_DIR") or os.path.join(
+    os.environ.get("XDG_STATE_HOME") or os.path.join(os.path.expanduser("~"), ".local", "state"), "chess-server")
+
+# Group commit: a batch is written once it holds BATCH_SIZE events or its
+# oldest event has waited BATCH_INTERVAL seconds, whichever comes first
+BATCH_INTERVAL = 0.05
+BATCH_SIZE = 256
+# A batch that fails to write is retried after RETRY_DELAY seconds, doubling
+# up to RETRY_MAX_DELAY, for as long as it takes; events are never dropped
+RETRY_DELAY = 0.1
+RETRY_MAX_DELAY = 5.0
+
+MOVE = "move"
+STATE = "state"
+FINISH = "finish"
+REMOVE = "remove"
+KINDS = (MOVE, STATE, FINISH, REMOVE)
+
+
+class BatchWriteError(Exception):
+    """Raised by a store's write_batch when only the first `written` events were applied"""
+
+    def __init__(self, written, error):
+        super().__init__(f"{error} (after {written} events)")
+        self.written = written
+        self.error = error
+
+
+class PersistenceWorker:
+    """Writes game events to a store from a background thread.
+
+    Game code only appends an event to an in-memory queue, so no disk I/O
+    happens while a game's lock is held and move latency does not depend
+    on the disk. Events are handed to store.write_batch in batches, which
+    lets the store sync once per batch instead of once per move. Queue
+    depth and lag (age of the oldest event when its batch is written) are
+    reported as metrics.
+
+    A batch the store fails to write goes back to the front of the queue
+    and is retried with backoff, so a full disk or a locked database
+    delays persistence rather than losing moves. A store whose write_batch
+    is not atomic raises BatchWriteError to say how much was applied, and
+    only the rest is retried.
+    """
+
+    def __init__(self, store, batch_interval=BATCH_INTERVAL, batch_size=BATCH_SIZE, metrics=None,
+                 retry_delay=RETRY_DELAY, retry_max_delay=RETRY_MAX_DELAY):
+        self.store = store
+        self.batch_interval = batch_interval
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        self.retry_max_delay = retry_max_delay
+        self.metrics = metrics or default_metrics
+        self.events = deque()  # (enqueued_at, kind, game_id, args)
+        self.in_flight = 0
+        self.flush_waiters = 0
+        self.condition = threading.Condition()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="persistence", daemon=True)
+        self.thread.start()
+
+    def submit(self, kind, game_id, *args):
+        """Queue an event; never blocks on I/O."""
+        if kind not in KINDS:
+            raise ValueError(f"Unknown persistence event {kind!r}")
+        with self.condition:
+            if not self.running:
+                raise RuntimeError("Persistence worker has been stopped")
+            self.events.append((time.monotonic(), kind, game_id, args))
+            depth = len(self.events)
+            if depth == 1 or depth >= self.batch_size:
+                self.condition.notify_all()
+        self.metrics.set_gauge("persistence.queue_depth", depth)
+
+    def record_move(self, game_id, move, state):
+        self.submit(MOVE, game_id, move, state)
+
+    def save_state(self, game_id, state):
+        self.submit(STATE, game_id, state)
+
+    def finish(self, game_id, winner, reason=None):
+        self.submit(FINISH, game_id, winner, reason)
+
+    def remove(self, game_id):
+        self.submit(REMOVE, game_id)
+
+    def lag(self):
+        """Seconds the oldest queued event has been waiting."""
+        with self.condition:
+            return time.monotonic() - self.events[0][0] if self.events else 0.0
+
+    def run(self):
+        delay = self.retry_delay
+        while True:
+            with self.condition:
+                while not self.events and self.running:
+                    self.condition.wait()
+                if not self.events:
+                    return
+
+                # Give the batch time to fill up unless someone is waiting on it
+                deadline = self.events[0][0] + self.batch_interval
+                while len(self.events) < self.batch_size and self.running and not self.flush_waiters:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+
+                count = min(len(self.events), self.batch_size)
+                batch = [self.events.popleft() for _ in range(count)]
+                self.in_flight = count
+                depth = len(self.events)
+
+            lag = time.monotonic() - batch[0][0]
+            failed = None
+            try:
+                self.store.write_batch([(kind, game_id, args) for _, kind, game_id, args in batch])
+                self.metrics.incr("persistence.events", count)
+                self.metrics.incr("persistence.batches")
+            except Exception as e:
+                written = e.written if isinstance(e, BatchWriteError) else 0
+                failed = batch[written:]
+                print(f"Error writing {count} game events, retrying {len(failed)} in {delay:g}s: {e}")
+                self.metrics.incr("persistence.events", written)
+                self.metrics.incr("persistence.failed", len(failed))
+            self.metrics.set_gauge("persistence.lag_ms", lag * 1000)
+            self.metrics.set_gauge("persistence.queue_depth", depth)
+
+            with self.condition:
+                self.in_flight = 0
+                if failed:
+                    # Back to the front, in order, ahead of anything queued since
+                    self.events.extendleft(reversed(failed))
+                self.condition.notify_all()
+                if failed:
+                    self.condition.wait(delay)
+                    delay = min(delay * 2, self.retry_max_delay)
+                else:
+                    delay = self.retry_delay
+
+    def flush(self, timeout=None):
+        """Block until every event submitted so far has been written.
+
+        Returns False if the timeout expired first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            self.flush_waiters += 1
+            self.condition.notify_all()
+            try:
+                while self.events or self.in_flight:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self.condition.wait(remaining)
+                return True
+            finally:
+                self.flush_waiters -= 1
+
+    def stop(self, timeout=None):
+        """Write what is queued, then stop the thread."""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.thread.join(timeout)
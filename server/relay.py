@@ -0,0 +1,27 @@
+import zlib
+
+# Assigning the spectators of busy games to relays (see relay.py).
+#
+# SimpleServer, and a relay with child relays, serve a game's spectators
+# themselves up to a threshold and REDIRECT the rest to one of their relays.
+# The relay is picked from the game ID, so a game always goes to the same
+# one and is subscribed once per relay rather than once per spectator.
+# Relays say "relay" in their own SPECTATE and are never redirected.
+
+
+def relay_for(game_id, relays):
+    """The relay of `relays` that takes a game's extra spectators. Stable across processes and restarts."""
+    return relays[zlib.crc32(game_id.encode("utf-8")) % len(relays)]
+
+
+def is_relay(message):
+    """True if a SPECTATE comes from a relay subscribing for its own spectators"""
+    return bool(message.get("relay"))
+
+
+def redirect_for(game_id, relays, spectators, message, threshold):
+    """REDIRECT to one of `relays` for a new spectator of a game that has `spectators`, or None"""
+    if not relays or spectators < threshold or is_relay(message):
+        return None
+    host, port = relay_for(game_id, relays)
+    return {"type": "REDIRECT", "game_id": game_id, "host": host, "port": port}
@@ -0,0 +1,203 @@
+import heapq
+import itertools
+import threading
+import time
+
+# Compact the heap once more than this share of its entries are cancelled
+COMPACT_RATIO = 0.5
+
+
+class TimerHandle:
+    """A callback scheduled to run at a deadline (time.monotonic() seconds)."""
+
+    def __init__(self, when, callback, args, scheduler=None):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.scheduler = scheduler
+        self.cancelled = False
+
+    def cancel(self):
+        scheduler = self.scheduler
+        if scheduler:
+            # The scheduler may be popping this handle right now
+            scheduler.cancel_timer(self)
+        else:
+            self.cancelled = True
+
+    def run(self):
+        try:
+            self.callback(*self.args)
+        except Exception as e:
+            print(f"Error in scheduled callback {getattr(self.callback, '__name__', self.callback)}: {e}")
+
+
+class Scheduler:
+    """Runs every timer of the server on one thread.
+
+    Deadlines are kept in a binary heap, so scheduling and firing cost
+    O(log n) no matter how many games are running, and the thread sleeps
+    until the earliest deadline instead of polling. Cancelled timers are left
+    in the heap and skipped when they come up; the heap is rebuilt when they
+    start to dominate it. Callbacks run on the scheduler thread and must not
+    block.
+    """
+
+    def __init__(self, name="scheduler"):
+        self.name = name
+        self.heap = []
+        self.counter = itertools.count()  # Keeps equal deadlines in FIFO order
+        self.cancelled = 0
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+
+    def __len__(self):
+        with self.condition:
+            return len(self.heap) - self.cancelled
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    def time(self):
+        return time.monotonic()
+
+    def call_at(self, when, callback, *args):
+        """Run callback(*args) at the monotonic time `when`. Returns a cancellable handle."""
+        handle = TimerHandle(when, callback, args, self)
+        with self.condition:
+            heapq.heappush(self.heap, (when, next(self.counter), handle))
+            # Only wake the thread if its current sleep is now too long
+            if self.heap[0][2] is handle:
+                self.condition.notify()
+        return handle
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self.time() + delay, callback, *args)
+
+    def cancel_timer(self, handle):
+        """Cancel a pending handle, counting it once however many threads cancel it"""
+        with self.condition:
+            if handle.cancelled:
+                return
+            handle.cancelled = True
+            self.cancelled += 1
+            if self.cancelled > len(self.heap) * COMPACT_RATIO:
+                self.heap = [entry for entry in self.heap if not entry[2].cancelled]
+                heapq.heapify(self.heap)
+                self.cancelled = 0
+
+    def run(self):
+        while True:
+            with self.condition:
+                handle = None
+                while self.running and handle is None:
+                    if not self.heap:
+                        self.condition.wait()
+                        continue
+                    when, _, first = self.heap[0]
+                    if first.cancelled:
+                        heapq.heappop(self.heap)
+                        self.cancelled -= 1
+                        continue
+                    delay = when - self.time()
+                    if delay > 0:
+                        self.condition.wait(delay)
+                        continue
+                    heapq.heappop(self.heap)
+                    handle = first
+                if not self.running:
+                    return
+                # Firing a timer uses it up; a later cancel() is a no-op
+                handle.cancelled = True
+                handle.scheduler = None
+
+            handle.run()
+
+
+class LoopScheduler:
+    """The Scheduler interface on top of an asyncio event loop.
+
+    asyncio already keeps its timers in a heap, so the asyncio engine hands
+    its deadlines to the loop and every callback runs on the loop thread.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def time(self):
+        return time.monotonic()
+
+    def call_at(self, when, callback, *args):
+        # Deadlines are in time.monotonic() seconds; translate them to loop time
+        return self.loop.call_at(self.loop.time() + (when - self.time()), callback, *args)
+
+    def call_later(self, delay, callback, *args):
+        return self.loop.call_later(delay, callback, *args)
+
+
+class IdleTimeout:
+    """Calls on_expire once a connection has been idle for `timeout` seconds.
+
+    touch() only records the time of the latest activity; the timer is not
+    moved on every message. When it fires early it re-arms itself for the
+    remaining time, so a busy connection costs one timer per timeout period.
+    """
+
+    def __init__(self, scheduler, timeout, on_expire):
+        self.scheduler = scheduler
+        self.timeout = timeout
+        self.on_expire = on_expire
+        self.last_activity = scheduler.time()
+        # check() runs on the scheduler thread while cancel() may run on any
+        # other; the lock keeps check() from re-arming a cancelled timeout
+        self.lock = threading.Lock()
+        self.cancelled = False
+        self.handle = scheduler.call_later(timeout, self.check)
+
+    def touch(self):
+        self.last_activity = self.scheduler.time()
+
+    def reset(self, timeout):
+        """Start a new idle period with a different timeout"""
+        self.cancel()
+        with self.lock:
+            self.timeout = timeout
+            self.touch()
+            self.cancelled = False
+            self.handle = self.scheduler.call_later(timeout, self.check)
+
+    def check(self):
+        with self.lock:
+            if self.cancelled:
+                return
+            deadline = self.last_activity + self.timeout
+            if self.scheduler.time() < deadline:
+                self.handle = self.scheduler.call_at(deadline, self.check)
+                return
+            self.cancelled = True
+            self.handle = None
+        self.on_expire()
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            handle, self.handle = self.handle, None
+        if handle is not None:
+            handle.cancel()
@@ -1,30 +1,66 @@
 import socket
 import threading
-import json
 import time
+from server.clock import TimeControl
 from server.lobby import Lobby
+from server.matchmaking import MATCH_INTERVAL, parse_rating
 from server.game_logic import ChessGame
+from server.heartbeat import Heartbeat
+from server.outbound import MessageConnection
+from server.scheduler import Scheduler
+from server.utils import get_store, save_game_state
 from common.message import Message
+from common.framing import FrameReader
+from common.mux import CHAT, decode_channel_payload, is_channel_payload
 from common.constants import HOST, PORT, CHAT_PORT, TIME_LIMIT_SECONDS
 
 class ChessServer:
-    def __init__(self):
+    """Lobby and game server.
+
+    Clients either open two connections, one to PORT for the game and one
+    to CHAT_PORT for chat, or a single multiplexed connection to PORT that
+    carries both (see common.mux). Every connection is kept alive by
+    PING/PONG heartbeats on the shared scheduler instead of read timeouts,
+    so a player may think as long as their clock allows.
+    """
+
+    def __init__(self, host="0.0.0.0", port=PORT, chat_port=CHAT_PORT):
+        self.host = host
+        self.port = port
+        self.chat_port = chat_port
         self.lobby = Lobby()
         self.games = {}
+        self.player_games = {}  # player_id -> ChessGame
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.chat_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.lock = threading.Lock()
+        # Turn timeouts and heartbeats of every connection run on this one thread
+        self.scheduler = Scheduler()
 
     def start(self):
-        self.server_socket.bind(("0.0.0.0", PORT))
+        self.bind()
+        self.serve()
+
+    def bind(self):
+        """Open both listening sockets. Port 0 picks a free port, stored back in port/chat_port."""
+        # A restarted server must not wait out the old connections' TIME_WAIT
+        for listener in (self.server_socket, self.chat_socket):
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind((self.host, self.port))
         self.server_socket.listen(10)
-        self.chat_socket.bind(("0.0.0.0", CHAT_PORT))
+        self.chat_socket.bind((self.host, self.chat_port))
         self.chat_socket.listen(10)
         self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
         self.chat_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-        print(f"Server started on 0.0.0.0:{PORT}")
-        print(f"Chat server started on 0.0.0.0:{CHAT_PORT}")
+        self.port = self.server_socket.getsockname()[1]
+        self.chat_port = self.chat_socket.getsockname()[1]
+        print(f"Server started on {self.host}:{self.port}")
+        print(f"Chat server started on {self.host}:{self.chat_port}")
 
+    def serve(self):
+        self.scheduler.start()
+        self.recover_games()
+        self.scheduler.call_later(MATCH_INTERVAL, self.run_matchmaking)
         threading.Thread(target=self.accept_chat_connections, daemon=True).start()
         self.accept_connections()
 
@@ -33,6 +69,7 @@ class ChessServer:
             client_socket, addr = self.server_socket.accept()
             print(f"New connection from {addr}")
             client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             threading.Thread(target=self.handle_client, args=(client_socket, addr), daemon=True).start()
 
     def accept_chat_connections(self):
@@ -42,37 +79,69 @@ class ChessServer:
             chat_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
             threading.Thread(target=self.handle_chat, args=(chat_socket, addr), daemon=True).start()
 
-    def handle_client(self, client_socket, addr):
+    def handle_client(self, raw_socket, addr):
         connected = True
+        reader = FrameReader(raw_socket)
+        # Reads happen on this thread; every write, including the scheduler's
+        # PINGs, is queued and done by the connection's writer thread
+        client_socket = MessageConnection(raw_socket, addr)
+        player_id = None
+        heartbeat = Heartbeat(
+            self.scheduler,
+            lambda ping_id: self.send_message(client_socket, Message("PING", {"id": ping_id})),
+            lambda: self.reap_connection(client_socket, addr))
         while connected:
             try:
-                client_socket.settimeout(30.0)
                 print(f"Waiting for data from {addr}...")
-                data = client_socket.recv(1024).decode('utf-8')
-                if not data:
+                payload = reader.read_payload()
+                if payload is None:
                     print(f"No data received from {addr}, closing connection")
                     connected = False
                     break
-                print(f"Raw data received from {addr}: {data}")
+                print(f"Raw data received from {addr}: {payload}")
+                if is_channel_payload(payload) and not client_socket.multiplexed:
+                    # A multiplexed client; everything sent to it from now on is queued by channel
+                    print(f"{addr} is multiplexing game and chat on one connection")
+                    client_socket.multiplex()
                 try:
-                    message = Message.from_json(data)
+                    channel, message = self.decode_client_payload(client_socket, payload)
                     print(f"Received message from {addr}: {message.type}")
-                except json.JSONDecodeError as e:
+                except ValueError as e:
                     print(f"Error decoding JSON from {addr}: {e}")
                     self.send_message(client_socket, Message("ERROR", {"message": "Invalid message format"}))
                     continue
 
-                if message.type == "JOIN_LOBBY":
+                if self.handle_heartbeat(client_socket, heartbeat, message):
+                    continue
+                if channel == CHAT:
+                    self.handle_chat_message(message)
+                elif message.type == "JOIN_LOBBY":
                     player_id = message.data.get("player_id", f"Player_{addr[1]}")
                     print(f"Received JOIN_LOBBY from {player_id}")
+                    game = self.player_games.get(player_id)
+                    if game is not None and game.players.get(player_id) is None and not game.is_game_over():
+                        # Back in a game recovered after a restart
+                        self.rejoin_game(game, client_socket, reader, player_id, heartbeat)
+                        break
+                    try:
+                        rating = parse_rating(message.data.get("rating"))
+                        time_control = TimeControl.parse(message.data.get("time_limit", TIME_LIMIT_SECONDS))
+                    except ValueError as e:
+                        self.send_message(client_socket, Message("ERROR", {"message": str(e)}))
+                        continue
+                    # Players only meet others on the same time control
+                    key = (time_control.base, time_control.increment, time_control.delay)
                     with self.lock:
-                        game_id = self.lobby.add_player(player_id, client_socket)
-                        if game_id:
-                            print(f"Starting game {game_id} for {player_id}")
-                            self.start_game(game_id, client_socket, player_id)
-                        else:
-                            print(f"{player_id} is waiting for an opponent")
-                            self.send_message(client_socket, Message("WAITING", {"message": "Waiting for opponent..."}))
+                        game_id = self.lobby.add_player(player_id, client_socket, rating, key)
+                    if game_id:
+                        print(f"Starting game {game_id} for {player_id}")
+                        self.start_game(game_id, client_socket, reader, player_id, heartbeat)
+                    else:
+                        print(f"{player_id} is waiting for an opponent")
+                        self.send_message(client_socket, Message("WAITING", {"message": "Waiting for opponent..."}))
+                elif message.type == "MOVE" and player_id in self.player_games:
+                    # The player who waited in the lobby keeps playing on this loop
+                    self.handle_move(self.player_games[player_id], client_socket, player_id, message)
                 elif message.type == "SPECTATE":
                     game_id = message.data.get("game_id")
                     print(f"Received SPECTATE request for game {game_id}")
@@ -94,24 +163,33 @@ class ChessServer:
                     print(f"Unknown message type from {addr}: {message.type}")
                     self.send_message(client_socket, Message("ERROR", {"message": "Unknown message type"}))
 
-            except socket.timeout:
-                print(f"Timeout waiting for data from {addr}")
-                connected = False
-                break
             except Exception as e:
                 print(f"Error handling client {addr}: {e}")
                 connected = False
                 break
+        heartbeat.cancel()
+        if player_id is not None and player_id not in self.player_games:
+            with self.lock:
+                self.lobby.remove_player(player_id)
         try:
             client_socket.close()
             print(f"Closed connection with {addr}")
         except:
             pass
 
-    def start_game(self, game_id, client_socket, player_id):
+    def start_game(self, game_id, client_socket, reader, player_id, heartbeat):
+        game = self.begin_game(game_id)
+        # Moves are read outside the server lock so other games keep going
+        self.handle_game_moves(game, client_socket, reader, player_id, heartbeat)
+
+    def begin_game(self, game_id):
+        """Seat a paired game's players, send them GAME_START and start the clock"""
         with self.lock:
             if game_id not in self.games:
-                self.games[game_id] = ChessGame(game_id, TIME_LIMIT_SECONDS)
+                # The time control both players were matched on
+                time_control = self.lobby.time_controls.get(game_id)
+                self.games[game_id] = ChessGame(
+                    game_id, TimeControl(*time_control) if time_control else TIME_LIMIT_SECONDS)
             
             game = self.games[game_id]
             players = self.lobby.get_game_players(game_id)
@@ -120,6 +198,8 @@ class ChessServer:
             if len(players) == 2:
                 game.add_player(list(players.keys())[0], "white", players[list(players.keys())[0]])
                 game.add_player(list(players.keys())[1], "black", players[list(players.keys())[1]])
+                for pid in players:
+                    self.player_games[pid] = game
                 
                 for pid, socket in players.items():
                     color = "white" if pid == list(players.keys())[0] else "black"
@@ -128,98 +208,229 @@ class ChessServer:
                         "game_id": game_id,
                         "color": color,
                         "opponent": list(players.keys())[0] if pid == list(players.keys())[1] else list(players.keys())[1],
-                        "board": game.board.fen()
+                        "board": game.board.fen(),
+                        "time_control": game.clock.time_control.to_dict()
                     }))
                 
-                threading.Thread(target=self.manage_turns, args=(game,), daemon=True).start()
-            
-            self.handle_game_moves(game, client_socket, player_id)
+                self.start_turn(game)
+                save_game_state(game_id, game.persisted_state())
+        return game
 
-    def handle_game_moves(self, game, client_socket, player_id):
+    def run_matchmaking(self):
+        """Periodic pass pairing waiting players as their rating windows widen.
+
+        Both players of a game started here are still on their handle_client
+        loops, which serve their moves through player_games.
+        """
+        try:
+            with self.lock:
+                game_ids = self.lobby.match_waiting()
+            for game_id in game_ids:
+                print(f"Matchmaking started game {game_id}")
+                self.begin_game(game_id)
+        except Exception as e:
+            print(f"Error in matchmaking pass: {e}")
+        finally:
+            self.scheduler.call_later(MATCH_INTERVAL, self.run_matchmaking)
+
+    def rejoin_game(self, game, client_socket, reader, player_id, heartbeat):
+        """Give a player back their seat in a recovered game and serve their moves."""
+        with self.lock:
+            game.players[player_id] = client_socket
+            self.lobby.games[game.game_id][player_id] = client_socket
+        color = game.player_colors[player_id]
+        opponent = next((pid for pid in game.players if pid != player_id), None)
+        print(f"{player_id} rejoined game {game.game_id} as {color}")
+        self.send_message(client_socket, Message("GAME_START", {
+            "game_id": game.game_id,
+            "color": color,
+            "opponent": opponent,
+            "board": game.board.fen(),
+            "current_player": game.current_player(),
+            "time_control": game.clock.time_control.to_dict(),
+            "clocks": game.clock.snapshot()
+        }))
+        self.handle_game_moves(game, client_socket, reader, player_id, heartbeat)
+
+    def recover_games(self, store=None):
+        """Rebuild the games that were in progress when the server last stopped.
+
+        Boards come from the store's latest snapshot plus journal replay.
+        Players get their seat back by sending JOIN_LOBBY with the same
+        player_id; turn timers restart now, so a player who never comes back
+        times out. Returns the number of games recovered.
+        """
+        store = store or get_store()
+        started = time.monotonic()
+        recovered = 0
+        for game_id in store.active_game_ids():
+            try:
+                state, board = store.load_game(game_id)
+            except Exception as e:
+                print(f"Error recovering game {game_id}: {e}")
+                continue
+            if state is None or state.get("server") != "chess_server" or state.get("game_over"):
+                continue
+
+            # restore() brings back the game's own time control and clocks
+            game = ChessGame(game_id, TIME_LIMIT_SECONDS)
+            game.restore(state, board)
+            with self.lock:
+                self.games[game_id] = game
+                self.lobby.games[game_id] = dict(game.players)
+                for pid in game.players:
+                    self.player_games[pid] = game
+            self.start_turn(game)
+            recovered += 1
+
+        if recovered:
+            print(f"Recovered {recovered} games in {time.monotonic() - started:.2f}s")
+        return recovered
+
+    def handle_game_moves(self, game, client_socket, reader, player_id, heartbeat):
         try:
-            client_socket.settimeout(30.0)
             while True:
-                data = client_socket.recv(1024).decode('utf-8')
-                if not data:
+                payload = reader.read_payload()
+                if payload is None:
                     print(f"No move data received from {player_id}")
                     break
 
-                message = Message.from_json(data)
+                channel, message = self.decode_client_payload(client_socket, payload)
                 print(f"Received {message.type} from {player_id}")
-                if message.type == "MOVE":
-                    move = message.data["move"]
-                    if game.make_move(player_id, move):
-                        self.broadcast_game_state(game)
-                    else:
-                        self.send_message(client_socket, Message("INVALID_MOVE", {"message": "Invalid move"}))
+                if self.handle_heartbeat(client_socket, heartbeat, message):
+                    continue
+                if channel == CHAT:
+                    self.handle_chat_message(message)
+                elif message.type == "MOVE":
+                    self.handle_move(game, client_socket, player_id, message)
 
-        except socket.timeout:
-            print(f"Timeout waiting for moves from {player_id}")
         except Exception as e:
             print(f"Error handling moves for {player_id}: {e}")
 
-    def manage_turns(self, game):
-        while not game.is_game_over():
-            current_player = game.current_player()
-            game.start_turn_timer()
-            
-            while game.current_player() == current_player and not game.is_game_over():
-                if game.has_timed_out():
-                    game.end_game(f"{current_player} timed out")
-                    self.broadcast_game_state(game)
-                    break
-                threading.Event().wait(1)
+    def handle_heartbeat(self, client_socket, heartbeat, message):
+        """Note that the client is alive and answer PING/PONG. Returns True if the message was one."""
+        heartbeat.touch()
+        if message.type == "PING":
+            self.send_message(client_socket, Message("PONG", {"id": message.data.get("id")}))
+            return True
+        if message.type == "PONG":
+            heartbeat.pong(message.data.get("id"))
+            return True
+        return False
+
+    def reap_connection(self, client_socket, addr):
+        """Heartbeat callback: shut down a connection that stopped answering.
 
-    def handle_chat(self, chat_socket, addr):
+        The thread reading it sees the connection end and cleans up.
+        """
+        print(f"No heartbeat from {addr}, dropping the connection")
+        client_socket.abort()
+
+    def decode_client_payload(self, client_socket, payload):
+        """Return (channel, Message); the channel is None on a plain connection.
+
+        Raises ValueError for a payload that is not a valid message.
+        """
+        if client_socket.multiplexed:
+            return decode_channel_payload(payload)
+        try:
+            return None, Message.from_json(payload)
+        except (UnicodeDecodeError, KeyError, TypeError) as e:
+            raise ValueError(f"Malformed message: {e}")
+
+    def handle_move(self, game, client_socket, player_id, message):
+        """Apply a MOVE and acknowledge it with the sequence number the client sent."""
+        seq = message.data.get("seq")
+        if game.make_move(player_id, message.data["move"]):
+            self.start_turn(game)
+            self.broadcast_game_state(game, player_id, seq)
+        else:
+            self.send_message(client_socket, Message("INVALID_MOVE", {"message": "Invalid move", "seq": seq}))
+
+    def start_turn(self, game):
+        """Start the turn timer of the player on move and schedule their timeout."""
+        if game.turn_timeout:
+            game.turn_timeout.cancel()
+            game.turn_timeout = None
+        if game.is_game_over():
+            return
+        game.start_turn_timer()
+        game.turn_timeout = self.scheduler.call_later(
+            game.clock.time_to_flag(), self.check_turn_timeout, game, game.current_player())
+
+    def check_turn_timeout(self, game, player_id):
+        """Scheduler callback: end the game if player_id is still on move."""
+        if game.is_game_over() or game.current_player() != player_id:
+            return
+        if not game.has_timed_out():
+            # Fired a little early; check again once the flag falls
+            remaining = game.clock.time_to_flag()
+            game.turn_timeout = self.scheduler.call_later(
+                max(remaining, 0.01), self.check_turn_timeout, game, player_id)
+            return
+        print(f"Player {player_id} timed out")
+        game.turn_timeout = None
+        game.end_game(f"{player_id} timed out")
+        self.broadcast_game_state(game)
+
+    def handle_chat(self, raw_socket, addr):
+        reader = FrameReader(raw_socket)
+        chat_socket = MessageConnection(raw_socket, addr)
+        heartbeat = Heartbeat(
+            self.scheduler,
+            lambda ping_id: self.send_message(chat_socket, Message("PING", {"id": ping_id})),
+            lambda: self.reap_connection(chat_socket, addr))
         try:
-            chat_socket.settimeout(30.0)
             while True:
-                message = chat_socket.recv(1024).decode('utf-8')
+                message = reader.read_message()
                 if not message:
                     print(f"No chat data received from {addr}")
                     break
-                chat_msg = Message.from_json(message)
+                chat_msg = Message.from_dict(message)
                 print(f"Received chat message from {addr}: {chat_msg.type}")
-                if chat_msg.type == "CHAT":
-                    game_id = chat_msg.data["game_id"]
-                    if game_id in self.games:
-                        self.games[game_id].broadcast_chat(chat_msg.data["message"])
-        except socket.timeout:
-            print(f"Timeout waiting for chat from {addr}")
+                if not self.handle_heartbeat(chat_socket, heartbeat, chat_msg):
+                    self.handle_chat_message(chat_msg)
         except Exception as e:
             print(f"Error handling chat for {addr}: {e}")
         finally:
+            heartbeat.cancel()
             chat_socket.close()
 
-    def broadcast_game_state(self, game):
+    def handle_chat_message(self, chat_msg):
+        """Relay a CHAT from either the chat port or a multiplexed connection."""
+        if chat_msg.type == "CHAT":
+            game_id = chat_msg.data["game_id"]
+            if game_id in self.games:
+                self.games[game_id].broadcast_chat(chat_msg.data["message"], send=self.send_message)
+
+    def broadcast_game_state(self, game, mover=None, seq=None):
+        """Send the board to everyone; the mover's copy acknowledges their move's seq."""
         state = {
             "board": game.board.fen(),
             "current_player": game.current_player(),
             "game_over": game.is_game_over(),
-            "winner": game.winner
+            "winner": game.winner,
+            "clocks": game.clock.snapshot()
         }
         message = Message("GAME_UPDATE", state)
         
         for player_id, socket in game.players.items():
             if socket:
                 print(f"Broadcasting game state to {player_id}")
-                self.send_message(socket, message)
+                if player_id == mover and seq is not None:
+                    self.send_message(socket, Message("GAME_UPDATE", dict(state, ack=seq)))
+                else:
+                    self.send_message(socket, message)
         for spectator_socket in game.spectators:
             if spectator_socket:
                 self.send_message(spectator_socket, message)
 
     def send_message(self, socket, message):
+        # Frames are self-delimiting, so back-to-back sends need no pause
+        # between them for the client to tell the messages apart. Only queued
+        # here, so this is safe on the scheduler thread and under self.lock.
         try:
-            print(f"Sending message to {socket.getpeername()}: {message.type}")
-            json_data = message.to_json()
-            # Add validation to ensure the JSON is valid
-            json.loads(json_data)  # Test if the JSON is valid
-            socket.send(json_data.encode('utf-8'))
-            time.sleep(0.2)  # Increased delay to ensure client receives the message
-        except json.JSONDecodeError as e:
-            print(f"Invalid JSON message: {e}")
-            # Send a simplified error message instead
-            error_msg = {"type": "ERROR", "data": {"message": "Server error"}}
-            socket.send(json.dumps(error_msg).encode('utf-8'))
+            print(f"Sending message to {socket.addr}: {message.type}")
+            socket.send_message(message)
         except Exception as e:
             print(f"Error sending message: {e}")
@@ -0,0 +1,248 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import chess
+
+from server.persistence import DATA_DIR
+
+DB_PATH = os.path.join(DATA_DIR, "chess_games.db")
+BUSY_TIMEOUT_MS = 5000  # How long a writer waits for another process's transaction
+SYNCHRONOUS = "NORMAL"  # WAL with NORMAL survives process crashes; FULL also survives power loss
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    game_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    board TEXT NOT NULL,
+    current_player TEXT,
+    game_over INTEGER NOT NULL DEFAULT 0,
+    ply INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS games_status ON games (status, updated_at);
+
+CREATE TABLE IF NOT EXISTS game_players (
+    game_id TEXT NOT NULL,
+    player_id TEXT NOT NULL,
+    color TEXT,
+    PRIMARY KEY (game_id, player_id)
+);
+CREATE INDEX IF NOT EXISTS game_players_player ON game_players (player_id);
+
+CREATE TABLE IF NOT EXISTS moves (
+    game_id TEXT NOT NULL,
+    ply INTEGER NOT NULL,
+    move TEXT NOT NULL,
+    played_at REAL NOT NULL,
+    PRIMARY KEY (game_id, ply)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS results (
+    game_id TEXT PRIMARY KEY,
+    winner TEXT,
+    reason TEXT,
+    ended_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_ended_at ON results (ended_at);
+"""
+
+
+class SQLiteGameStore:
+    """Game store backed by a SQLite database in WAL mode.
+
+    Implements the same interface as server.journal.JournalStore, so it can
+    be passed to server.utils.configure_store. Every lookup goes through an
+    index, and since SQLite arbitrates between writers several server
+    processes can share one database file. Each thread gets its own
+    connection; a write batch is a single transaction.
+    """
+
+    def __init__(self, path=DB_PATH, synchronous=SYNCHRONOUS):
+        self.path = path
+        self.synchronous = synchronous
+        self.local = threading.local()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection().executescript(SCHEMA)
+
+    def connection(self):
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(f"PRAGMA synchronous={self.synchronous}")
+            self.local.db = db
+        return db
+
+    def transaction(self):
+        return _Transaction(self.connection())
+
+    def write_batch(self, events):
+        """Apply a batch of (kind, game_id, args) events in one transaction."""
+        handlers = {
+            "move": self._record_move,
+            "state": self._save_state,
+            "finish": self._finish,
+            "remove": self._remove,
+        }
+        with self.transaction() as db:
+            for kind, game_id, args in events:
+                handler = handlers.get(kind)
+                if handler is None:
+                    raise ValueError(f"Unknown persistence event {kind!r}")
+                handler(db, game_id, *args)
+
+    def save_state(self, game_id, state):
+        """Store the complete state of a game."""
+        with self.transaction() as db:
+            self._save_state(db, game_id, state)
+
+    def record_move(self, game_id, move, state):
+        """Append one ply; state is the game state after the move."""
+        with self.transaction() as db:
+            self._record_move(db, game_id, move, state)
+
+    def finish(self, game_id, winner, reason=None):
+        """Record the result; the game and its moves are kept."""
+        with self.transaction() as db:
+            self._finish(db, game_id, winner, reason)
+
+    def remove(self, game_id):
+        """Delete everything stored for a game."""
+        with self.transaction() as db:
+            self._remove(db, game_id)
+
+    def load_state(self, game_id):
+        row = self.connection().execute(
+            "SELECT state, board, current_player, game_over, ply FROM games WHERE game_id = ?",
+            (game_id,)).fetchone()
+        if row is None:
+            return None
+        state = json.loads(row[0])
+        state.update(board=row[1], current_player=row[2], game_over=bool(row[3]), ply=row[4])
+        return state
+
+    def load_game(self, game_id, replay=True):
+        """Return (latest state, chess.Board) or (None, None) for an unknown game.
+
+        The games row holds the position after the last move, so nothing
+        needs replaying and `replay` makes no difference.
+        """
+        state = self.load_state(game_id)
+        if state is None:
+            return None, None
+        return state, chess.Board(state["board"])
+
+    def load_moves(self, game_id, after_ply=0):
+        """Moves of a game in order, optionally only those after a ply."""
+        rows = self.connection().execute(
+            "SELECT move FROM moves WHERE game_id = ? AND ply > ? ORDER BY ply",
+            (game_id, after_ply)).fetchall()
+        return [move for (move,) in rows]
+
+    def active_game_ids(self):
+        rows = self.connection().execute(
+            "SELECT game_id FROM games WHERE status = 'active' ORDER BY updated_at").fetchall()
+        return [game_id for (game_id,) in rows]
+
+    def games_for_player(self, player_id):
+        rows = self.connection().execute(
+            "SELECT g.game_id, g.status FROM game_players p JOIN games g ON g.game_id = p.game_id "
+            "WHERE p.player_id = ? ORDER BY g.updated_at DESC", (player_id,)).fetchall()
+        return [{"game_id": game_id, "status": status} for game_id, status in rows]
+
+    def finished_games(self, since=0, limit=100):
+        """Results of games that ended after `since`, newest first."""
+        rows = self.connection().execute(
+            "SELECT game_id, winner, reason, ended_at FROM results WHERE ended_at > ? "
+            "ORDER BY ended_at DESC LIMIT ?", (since, limit)).fetchall()
+        return [{"game_id": game_id, "winner": winner, "reason": reason, "ended_at": ended_at}
+                for game_id, winner, reason, ended_at in rows]
+
+    def close(self):
+        db = getattr(self.local, "db", None)
+        if db is not None:
+            db.close()
+            self.local.db = None
+
+    def _save_state(self, db, game_id, state):
+        now = time.time()
+        db.execute(
+            "INSERT INTO games (game_id, status, board, current_player, game_over, state, created_at, updated_at) "
+            "VALUES (?, 'active', ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (game_id) DO UPDATE SET board = excluded.board, "
+            "current_player = excluded.current_player, game_over = excluded.game_over, "
+            "state = excluded.state, updated_at = excluded.updated_at",
+            (game_id, state.get("board", ""), state.get("current_player"),
+             int(bool(state.get("game_over"))), json.dumps(state), now, now))
+        players = state.get("players")
+        if isinstance(players, dict):
+            db.executemany(
+                "INSERT OR REPLACE INTO game_players (game_id, player_id, color) VALUES (?, ?, ?)",
+                [(game_id, *_player_row(key, value)) for key, value in players.items()])
+
+    def _record_move(self, db, game_id, move, state):
+        row = db.execute("SELECT ply FROM games WHERE game_id = ?", (game_id,)).fetchone()
+        if row is None:
+            # First we hear of this game; its state after the move is the base row
+            self._save_state(db, game_id, state)
+            ply = 1
+        else:
+            ply = row[0] + 1
+        now = time.time()
+        db.execute("INSERT OR REPLACE INTO moves (game_id, ply, move, played_at) VALUES (?, ?, ?, ?)",
+                   (game_id, ply, move, now))
+        db.execute(
+            "UPDATE games SET ply = ?, board = ?, current_player = ?, game_over = ?, state = ?, "
+            "updated_at = ? WHERE game_id = ?",
+            (ply, state.get("board", ""), state.get("current_player"),
+             int(bool(state.get("game_over"))), json.dumps(state), now, game_id))
+
+    def _finish(self, db, game_id, winner, reason=None):
+        now = time.time()
+        db.execute("UPDATE games SET status = 'finished', game_over = 1, updated_at = ? WHERE game_id = ?",
+                   (now, game_id))
+        db.execute("INSERT OR REPLACE INTO results (game_id, winner, reason, ended_at) VALUES (?, ?, ?, ?)",
+                   (game_id, winner, reason, now))
+
+    def _remove(self, db, game_id):
+        for table in ("moves", "game_players", "results", "games"):
+            db.execute(f"DELETE FROM {table} WHERE game_id = ?", (game_id,))
+
+
+def _player_row(key, value):
+    """(player_id, color) from either players layout.
+
+    server.game_logic keeps {player_id: color}; simple_server keeps
+    {color: {"name", "id"}}.
+    """
+    if isinstance(value, dict):
+        return str(value.get("id")), key
+    return str(key), value
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT, rolled back if the block raises.
+
+    IMMEDIATE takes the write lock up front, so two processes never both
+    read, then fail to upgrade to a write.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.db.execute("COMMIT")
+        else:
+            self.db.execute("ROLLBACK")
+        return False
@@ -1,44 +1,82 @@
-import json
-import os
+import threading
+
+from server.journal import JournalStore
+from server.persistence import PersistenceWorker
+from server.sqlite_store import SQLiteGameStore
+
+# Games are persisted through a pluggable store, "journal" (an append-only
+# journal per game) or "sqlite" (one indexed database that several server
+# processes can share); configure_store can install any other store.
+# Writes go through a background PersistenceWorker so callers never wait
+# on the disk.
+GAME_STORE = "journal"
+_store = None
+_worker = None
+_store_lock = threading.Lock()
+
+
+def configure_store(store, **worker_options):
+    """Persist all games in `store`; worker_options are passed to PersistenceWorker."""
+    global _store, _worker
+    with _store_lock:
+        old_worker = _worker
+        _store = store
+        _worker = PersistenceWorker(store, **worker_options)
+    if old_worker is not None:
+        # Events queued for the previous store still go to it
+        old_worker.stop()
+
+
+def create_store(kind, path=None):
+    """Build one of the built-in stores; path defaults to the store's own location."""
+    if kind == "journal":
+        return JournalStore(path) if path else JournalStore()
+    if kind == "sqlite":
+        return SQLiteGameStore(path) if path else SQLiteGameStore()
+    raise ValueError(f"Unknown game store {kind!r}, expected 'journal' or 'sqlite'")
+
+
+def get_store():
+    return _get_worker().store
+
+
+def _get_worker():
+    global _store, _worker
+    with _store_lock:
+        if _worker is None:
+            _store = create_store(GAME_STORE)
+            _worker = PersistenceWorker(_store)
+        return _worker
+
 
 def save_game_state(game_id, state):
-    """Save the game state to chess_games_list.json."""
-    file_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "chess_games_list.json")
-    try:
-        with open(file_path, "r") as f:
-            data = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        data = {"games": []}
-
-    # Update or add the game state
-    game_entry = {"game_id": game_id, "state": state}
-    existing_game = next((game for game in data["games"] if game["game_id"] == game_id), None)
-    if existing_game:
-        data["games"].remove(existing_game)
-    data["games"].append(game_entry)
-
-    with open(file_path, "w") as f:
-        json.dump(data, f, indent=4)
+    """Queue the complete game state to be saved as a snapshot."""
+    _get_worker().save_state(game_id, state)
+
+
+def record_move(game_id, move, state):
+    """Queue one move for the game's journal; state is the game state after it."""
+    _get_worker().record_move(game_id, move, state)
+
 
 def load_game_state(game_id):
-    """Load the game state from chess_games_list.json."""
-    file_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "chess_games_list.json")
-    try:
-        with open(file_path, "r") as f:
-            data = json.load(f)
-        game_entry = next((game for game in data["games"] if game["game_id"] == game_id), None)
-        return game_entry["state"] if game_entry else None
-    except (FileNotFoundError, json.JSONDecodeError):
-        return None
+    """Load the latest game state, or None if the game is unknown."""
+    worker = _get_worker()
+    # Make sure queued writes for this game are visible
+    worker.flush()
+    return worker.store.load_state(game_id)
+
+
+def finish_game(game_id, winner, reason=None):
+    """Queue the game's result. Stores that keep history record it; others drop the game."""
+    _get_worker().finish(game_id, winner, reason)
+
 
 def remove_game(game_id):
-    """Remove a game from chess_games_list.json."""
-    file_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "chess_games_list.json")
-    try:
-        with open(file_path, "r") as f:
-            data = json.load(f)
-        data["games"] = [game for game in data["games"] if game["game_id"] != game_id]
-        with open(file_path, "w") as f:
-            json.dump(data, f, indent=4)
-    except (FileNotFoundError, json.JSONDecodeError):
-        pass
+    """Queue removal of everything stored for a game."""
+    _get_worker().remove(game_id)
+
+
+def flush_writes(timeout=None):
+    """Wait until every queued write has reached the store."""
+    return _get_worker().flush(timeout)
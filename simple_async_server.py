@@ -0,0 +1,306 @@
+import asyncio
+
+from common.framing import read_message_async
+from server.lobby_index import wants_page
+from server.outbound import (OutboundQueue, OUTBOUND_QUEUE_LIMIT, LANES, WRITE_BATCH_BYTES, QUEUE, DROP,
+                             EVICT, message_lane)
+from server.scheduler import LoopScheduler, IdleTimeout
+from simple_server import SimpleServer, HANDSHAKE_TIMEOUT, LOBBY_IDLE_TIMEOUT
+
+
+class AsyncConnection:
+    """Event-loop counterpart of server.outbound.Connection.
+
+    Frames are queued by send() and written by a writer task that waits for
+    the transport to drain, so the queue bound applies to slow clients here
+    exactly as it does in the threaded engine.
+    """
+
+    def __init__(self, writer, limit=OUTBOUND_QUEUE_LIMIT, policy=None):
+        self.writer = writer
+        self.addr = writer.get_extra_info("peername")
+        self.outbound = OutboundQueue(limit, LANES)
+        self.policy = policy
+        self.binary = False  # Set once the client negotiates the binary encoding in HELLO
+        self.heartbeat = None  # server.heartbeat.Heartbeat, if the client agreed to heartbeats
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.task = asyncio.create_task(self.run_writer())
+
+    def send(self, data, kind=None):
+        """Queue an encoded frame. Returns False if it was not accepted."""
+        if self.closed:
+            return False
+        action = self.policy.admit(self, self.outbound, data, kind) if self.policy else QUEUE
+        if action == EVICT:
+            self.abort()
+            return False
+        if action == DROP or not self.outbound.push(data, kind, message_lane(kind)):
+            return False
+        self.ready.set()
+        return True
+
+    def abort(self):
+        # Discard the backlog and drop the connection; the reader sees the
+        # stream end and runs the normal disconnect path
+        self.closed = True
+        self.outbound.pop_all()
+        self.writer.transport.abort()
+        self.ready.set()
+
+    async def run_writer(self):
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+                frames = self.outbound.pop_all(WRITE_BATCH_BYTES)
+                if frames:
+                    self.writer.writelines(frames)
+                    await self.writer.drain()
+                    self.outbound.mark_drained()
+                    if self.outbound:
+                        # More than one batch was queued
+                        self.ready.set()
+                if self.closed and not self.outbound:
+                    break
+        except (ConnectionError, OSError) as e:
+            print(f"Error writing to {self.addr}: {e}")
+            self.closed = True
+            self.outbound.pop_all()
+        finally:
+            self.writer.close()
+
+    def close(self):
+        """Stop accepting frames; the writer task flushes the queue and closes the stream."""
+        self.closed = True
+        self.ready.set()
+
+
+class AsyncSimpleServer(SimpleServer):
+    """SimpleServer running every connection, timer and broadcast on one event loop.
+
+    The protocol handlers are shared with the threaded server; only the socket
+    plumbing differs. Players and spectators are stored with an AsyncConnection
+    in place of a threaded Connection, and their frames are written by writer
+    tasks instead of writer threads.
+    """
+
+    def start(self):
+        self.bind_server_socket()
+        print("Waiting for connections (asyncio engine)...")
+
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            print("Server stopped")
+
+    async def serve(self):
+        # Clock deadlines and idle timeouts become event loop timers
+        self.scheduler = LoopScheduler(asyncio.get_running_loop())
+        self.recover_games()
+        if self.direct_socket:
+            await asyncio.start_server(self.handle_connection, sock=self.direct_socket)
+        server = await asyncio.start_server(self.handle_connection, sock=self.server_socket)
+        async with server:
+            await server.serve_forever()
+
+    async def handle_connection(self, reader, stream_writer):
+        writer = AsyncConnection(stream_writer)
+        addr = writer.addr
+        print(f"New connection from {addr}")
+        try:
+            # Drop connections that never identify themselves
+            handshake = IdleTimeout(self.scheduler, HANDSHAKE_TIMEOUT, writer.abort)
+
+            # Receive initial message
+            message = await read_message_async(reader)
+            if message and message.get("type") == "HELLO":
+                self.handle_hello(writer, message)
+                message = await self.read_message_async(writer, reader)
+            handshake.cancel()
+            if not message:
+                print(f"No data received from {addr}, closing connection")
+                return
+            if self.redirect(writer, message):
+                return
+
+            message_type = message.get("type")
+
+            if message_type == "CREATE_GAME":
+                game_id = self.handle_create_game(writer, message)
+                if game_id:
+                    await self.serve_player(reader, writer, game_id, "white")
+            elif message_type == "JOIN_GAME":
+                game_id = self.handle_join_game(writer, message)
+                if game_id:
+                    self.start_game(game_id)
+                    await self.serve_player(reader, writer, game_id, "black")
+            elif message_type == "REJOIN_GAME":
+                color = self.handle_rejoin_game(writer, message)
+                if color:
+                    await self.serve_player(reader, writer, message.get("game_id"), color)
+            elif message_type == "RESUME":
+                color = self.handle_resume(writer, message)
+                if color:
+                    await self.serve_player(reader, writer, message.get("game_id"), color)
+            elif message_type == "SPECTATE":
+                spectator_id = self.handle_spectate_game(writer, message)
+                if spectator_id:
+                    await self.serve_spectator(reader, writer, message.get("game_id"), spectator_id)
+            elif message_type == "JOIN_LOBBY":
+                await self.serve_lobby(reader, writer, message)
+            elif message_type == "GET_GAMES" and message.get("subscribe"):
+                await self.serve_lobby_watcher(reader, writer, message)
+            elif message_type == "GET_GAMES":
+                self.handle_get_games(writer, message, await self.peer_games(message))
+            else:
+                print(f"Unknown message type: {message_type}")
+                self.send_message(writer, {"type": "ERROR", "message": "Unknown message type"})
+
+        except Exception as e:
+            print(f"Error handling client {addr}: {e}")
+        finally:
+            if writer.heartbeat:
+                writer.heartbeat.cancel()
+            writer.close()
+
+    async def peer_games(self, message):
+        """The other workers' games for a GET_GAMES, fetched off the event loop"""
+        if not self.shard or message.get("scope") == "local" or wants_page(message):
+            return []
+        return await asyncio.get_running_loop().run_in_executor(None, self.shard.peer_games)
+
+    async def read_message_async(self, writer, reader):
+        """Next message from a client, or None once it disconnects. Heartbeats are handled here."""
+        while True:
+            message = await read_message_async(reader)
+            if not message or not self.handle_heartbeat(writer, message):
+                return message
+
+    async def serve_player(self, reader, writer, game_id, color):
+        try:
+            while True:
+                game = self.get_game(game_id)
+                if game is None:
+                    # Game was deleted
+                    return
+
+                with game["lock"]:
+                    status = game["status"]
+                if status == "finished":
+                    # Game is over
+                    return
+
+                message = await self.read_message_async(writer, reader)
+                if not message:
+                    if status == "waiting":
+                        print(f"Client disconnected while waiting for opponent")
+                        self.remove_player_from_game(writer, game_id)
+                    else:
+                        print(f"Client disconnected during game")
+                        self.handle_player_disconnect(writer, game_id, color)
+                    return
+
+                if status == "waiting":
+                    if message.get("type") == "CANCEL_GAME":
+                        self.remove_player_from_game(writer, game_id)
+                        return
+
+                    # The opponent may have joined while we were waiting for data
+                    if not self.is_started(game_id):
+                        continue
+
+                self.dispatch_game_message(writer, game_id, color, message)
+
+        except Exception as e:
+            print(f"Error handling game: {e}")
+            self.handle_player_disconnect(writer, game_id, color)
+
+    async def serve_spectator(self, reader, writer, game_id, spectator_id):
+        try:
+            while True:
+                if self.is_finished(game_id):
+                    return
+
+                # Wait for messages (only chat from spectators)
+                message = await self.read_message_async(writer, reader)
+                if not message:
+                    print(f"Spectator disconnected")
+                    self.handle_spectator_disconnect(writer, game_id, spectator_id)
+                    return
+
+                if message.get("type") == "CHAT":
+                    self.handle_spectator_chat(writer, game_id, spectator_id, message)
+                elif message.get("type") == "RESYNC_REQUEST":
+                    self.handle_resync_request(writer, game_id, None, message)
+
+        except Exception as e:
+            print(f"Error handling spectator: {e}")
+            self.handle_spectator_disconnect(writer, game_id, spectator_id)
+
+    async def serve_lobby(self, reader, writer, message):
+        player_id = message.get("player_id")
+        idle = None if writer.heartbeat else IdleTimeout(self.scheduler, LOBBY_IDLE_TIMEOUT, writer.abort)
+        ticket = None
+        try:
+            ticket = self.join_queue(writer, message, idle)
+            if ticket is None:
+                return
+            while True:
+                match = ticket.data["match"]
+                if match:
+                    await self.serve_player(reader, writer, *match)
+                    return
+
+                message = await self.read_message_async(writer, reader)
+                if not message:
+                    match = self.leave_queue(ticket)
+                    if match:
+                        print(f"Client {player_id} disconnected before its game started")
+                        self.handle_player_disconnect(writer, *match)
+                    else:
+                        print(f"Client {player_id} disconnected from lobby")
+                    return
+                if idle:
+                    idle.touch()
+
+                # The player may have been matched while we were waiting for data
+                match = ticket.data["match"]
+                if match:
+                    self.dispatch_game_message(writer, *match, message)
+                elif message.get("type") in ("CANCEL_GAME", "LEAVE_LOBBY"):
+                    print(f"Player {player_id} left the lobby")
+                    return
+                else:
+                    self.handle_lobby_message(writer, message)
+        except Exception as e:
+            print(f"Error in lobby for player {player_id}: {e}")
+        finally:
+            if idle:
+                idle.cancel()
+            if ticket:
+                self.leave_queue(ticket)
+
+    async def serve_lobby_watcher(self, reader, writer, message):
+        """The asyncio version of watch_lobby"""
+        subscriber_id = self.subscribe_lobby(writer, message)
+        idle = None if writer.heartbeat else IdleTimeout(self.scheduler, LOBBY_IDLE_TIMEOUT, writer.abort)
+        try:
+            while True:
+                message = await self.read_message_async(writer, reader)
+                if not message:
+                    print("Lobby watcher disconnected")
+                    return
+                if idle:
+                    idle.touch()
+                if message.get("type") == "GET_GAMES":
+                    self.handle_get_games(writer, dict(message, subscribe=False))
+        finally:
+            self.lobby.unsubscribe(subscriber_id)
+            if idle:
+                idle.cancel()
+
+
+if __name__ == "__main__":
+    server = AsyncSimpleServer()
+    server.start()
@@ -7,11 +7,17 @@ import chess
 import time
 import os
 import datetime
+from common.countdown import Countdown
+from common.framing import FrameReader, encode_message
+from common.position import position_hash
 from MULTIPLAYER_CHESS.client.game_list_screen import GameListScreen
 
 # Constants
 HOST = "localhost"
 PORT = 50004
+CONNECT_ATTEMPTS = 6  # Retries back off 0.5, 1, 2, 4, 8 seconds, inside the server's 30 s grace window
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
 WINDOW_WIDTH = 700
 WINDOW_HEIGHT = 700
 BOARD_SIZE = 560
@@ -97,11 +103,20 @@ class ChessClient:
     def __init__(self, mode):
         self.mode = mode
         self.socket = None
+        self.reader = None
+        self.server_address = (HOST, PORT)  # A cluster worker's direct port after a REDIRECT
+        self.binary = False  # Whether HELLO settled on the compact binary encoding
+        self.heartbeat = None  # (interval, timeout) agreed in HELLO, or None
+        self.ping_id = 0
+        self.ping_time = None  # When our unanswered PING went out
+        self.rtt = None  # Latest round-trip time to the server in seconds
+        self.send_lock = threading.Lock()  # The UI and receiver threads both send
         self.connected = False
         self.running = True
         self.player_name = None
         self.player_id = None
         self.game_id = None
+        self.session_token = None  # Lets us resume the game after a dropped connection
         self.color = None
         self.opponent = None
         self.board = chess.Board()
@@ -120,10 +135,10 @@ class ChessClient:
         self.last_message_check = time.time()  # For checking expired messages
 
         # Time control
-        self.white_time = 300  # 5 minutes in seconds
-        self.black_time = 300
-        self.time_limit = 300
-        self.last_time_update = time.time()
+        self.time_limit = 300  # 5 minutes in seconds
+        # The server's last clock reading; the player on move is counted
+        # down locally from there (see clock_time)
+        self.clocks = Countdown(self.time_limit)
 
         # Initialize pygame with minimum size constraint
         pygame.init()
@@ -219,34 +234,154 @@ class ChessClient:
         return surface
 
     def connect_to_server(self):
-        max_attempts = 3
-        for attempt in range(max_attempts):
+        """Connect, retrying with exponential backoff.
+
+        If we hold a session token the game is resumed on the new connection;
+        the server answers with a RESYNC, handled by receive_messages.
+        """
+        delay = RETRY_BASE_DELAY
+        for attempt in range(CONNECT_ATTEMPTS):
             try:
-                print(f"Connection attempt {attempt+1}/{max_attempts}...")
+                print(f"Connection attempt {attempt+1}/{CONNECT_ATTEMPTS}...")
                 self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
                 self.socket.settimeout(5.0)
-                self.socket.connect((HOST, PORT))
-                self.socket.settimeout(None)
+                self.socket.connect(self.server_address)
+                self.reader = FrameReader(self.socket)
+                self.negotiate_encoding()
+                # With heartbeats a silent server is pinged, so reads time out
+                self.socket.settimeout(self.heartbeat[0] if self.heartbeat else None)
                 self.connected = True
+                if self.session_token and not self.send_message({
+                    "type": "RESUME",
+                    "game_id": self.game_id,
+                    "token": self.session_token,
+                    "last_ply": self.board.ply(),
+                    "delta_updates": True
+                }):
+                    raise ConnectionError("could not send RESUME")
                 print("Connected to server")
                 return True
             except Exception as e:
                 print(f"Error connecting to server (attempt {attempt+1}): {e}")
-                if attempt < max_attempts - 1:
-                    print("Retrying in 2 seconds...")
-                    time.sleep(2.0)
+                if attempt < CONNECT_ATTEMPTS - 1:
+                    print(f"Retrying in {delay:.1f} seconds...")
+                    time.sleep(delay)
+                    delay = min(delay * 2, RETRY_MAX_DELAY)
                 else:
                     self.status_message = f"Connection error: {e}"
                     return False
         return False
 
+    def follow_redirect(self, redirect, message):
+        """Reconnect to the cluster worker a REDIRECT names and send the request again"""
+        self.server_address = (redirect.get("host") or self.server_address[0], redirect["port"])
+        print(f"Redirected to {self.server_address[0]}:{self.server_address[1]}")
+        self.connected = False
+        try:
+            self.socket.close()
+        except Exception:
+            pass
+        return self.connect_to_server() and self.send_message(message)
+
+    def negotiate_encoding(self):
+        """HELLO exchange: offer binary and heartbeats, fall back to JSON if the server declines"""
+        self.binary = False
+        self.heartbeat = None
+        self.ping_time = None
+        self.socket.sendall(encode_message({"type": "HELLO", "encodings": ["binary", "json"], "heartbeat": True}))
+        reply = self.reader.read_message()
+        if not reply or reply.get("type") != "HELLO":
+            raise ConnectionError(f"Unexpected reply to HELLO: {reply}")
+        self.binary = reply.get("encoding") == "binary"
+        if reply.get("heartbeat"):
+            self.heartbeat = (reply["heartbeat"]["interval"], reply["heartbeat"]["timeout"])
+        print(f"Using {reply.get('encoding')} encoding")
+
+    def can_resume(self):
+        return bool(self.session_token) and not self.game_over and self.running
+
+    def resume_session(self):
+        """Reconnect after the connection dropped mid-game"""
+        self.status_message = "Connection lost, reconnecting..."
+        try:
+            self.socket.close()
+        except Exception:
+            pass
+        if not self.connect_to_server():
+            # The grace window is over; stop trying
+            self.session_token = None
+            self.status_message = "Could not reconnect to the game"
+
+    def apply_delta(self, message):
+        """Push the move from a BOARD_DELTA onto our board.
+
+        If the result does not match the server's ply and position hash we
+        have missed or misapplied something, so we ask for the full position.
+        """
+        ply = message.get("ply")
+        if self.board.ply() == ply - 1:
+            try:
+                self.board.push_uci(message["move"])
+            except ValueError:
+                pass
+        if self.board.ply() != ply or position_hash(self.board) != message.get("hash"):
+            print(f"Board out of sync at ply {ply}, requesting the full position")
+            self.send_message({"type": "RESYNC_REQUEST", "last_ply": None})
+
+        self.current_player = message.get("current_player", self.current_player)
+        self.clocks.update(message)
+        self.game_over = message.get("game_over", False)
+        self.winner = message.get("winner")
+        self.update_turn_status()
+
+    def clock_time(self, color):
+        """Time left on a player's clock now, counting down the player on move locally"""
+        return self.clocks.time_left(color, None if self.game_over else self.current_player)
+
+    def update_turn_status(self):
+        if self.game_over:
+            if self.winner == "draw":
+                self.status_message = "Game over! It's a draw."
+            elif self.winner == self.color:
+                self.status_message = "Game over! You won!"
+            else:
+                self.status_message = "Game over! You lost."
+        else:
+            if self.is_spectator:
+                self.status_message = f"Current turn: {self.current_player}"
+            elif self.current_player == self.color:
+                self.status_message = "Your turn"
+            else:
+                self.status_message = "Opponent's turn"
+
+    def apply_resync(self, message):
+        """Catch up after RESYNC: replay the missed moves, or take the FEN if we can't"""
+        board_fen = message.get("board", chess.STARTING_FEN)
+        moves = message.get("moves")
+        board = self.board.copy()
+        try:
+            for move in moves or []:
+                board.push_uci(move)
+        except ValueError:
+            moves = None
+        if moves is None or board.fen() != board_fen:
+            board = chess.Board(board_fen)
+        self.board = board
+        self.color = message.get("color", self.color)
+        self.opponent = message.get("opponent", self.opponent)
+        self.current_player = message.get("current_player", "white")
+        self.clocks.update(message)
+        self.game_over = message.get("game_over", False)
+        self.winner = message.get("winner")
+        self.update_turn_status()
+
     def send_message(self, message):
         if not self.connected:
             print("Not connected to server")
             return False
         try:
-            data = json.dumps(message).encode('utf-8')
-            self.socket.send(data)
+            with self.send_lock:
+                self.socket.sendall(encode_message(message, self.binary))
             return True
         except Exception as e:
             print(f"Error sending message: {e}")
@@ -257,17 +392,55 @@ class ChessClient:
         if not self.connected:
             return None
         try:
-            data = self.socket.recv(1024).decode('utf-8')
-            if not data:
-                print("Server closed connection")
-                self.connected = False
-                return None
-            return json.loads(data)
+            while True:
+                try:
+                    message = self.reader.read_message()
+                except socket.timeout:
+                    if not self.check_heartbeat():
+                        return None
+                    continue
+                if not message:
+                    print("Server closed connection")
+                    self.connected = False
+                    return None
+                if not self.handle_heartbeat(message):
+                    return message
         except Exception as e:
             print(f"Error receiving message: {e}")
             self.connected = False
             return None
 
+    def check_heartbeat(self):
+        """The server has been silent for a read timeout: ping it, or give up on it.
+
+        Returns False once the connection is considered dead.
+        """
+        if self.ping_time is not None:
+            print("Server stopped answering heartbeats")
+            self.connected = False
+            return False
+        self.ping_id += 1
+        self.ping_time = time.monotonic()
+        # The PONG (or anything else) has to arrive within the heartbeat timeout
+        self.socket.settimeout(self.heartbeat[1])
+        return self.send_message({"type": "PING", "id": self.ping_id})
+
+    def handle_heartbeat(self, message):
+        """Any message shows the server is alive; answer PING and time PONG.
+
+        Returns True if the message was heartbeat traffic.
+        """
+        message_type = message.get("type")
+        if self.ping_time is not None:
+            if message_type == "PONG" and message.get("id") == self.ping_id:
+                self.rtt = time.monotonic() - self.ping_time
+            self.ping_time = None
+            self.socket.settimeout(self.heartbeat[0])
+        if message_type == "PING":
+            self.send_message({"type": "PONG", "id": message.get("id")})
+            return True
+        return message_type == "PONG"
+
     def create_game(self, player_name, player_id):
         self.player_name = player_name
         self.player_id = player_id
@@ -284,7 +457,8 @@ class ChessClient:
             "type": "CREATE_GAME",
             "player_name": player_name,
             "player_id": player_id,
-            "time_limit": self.time_limit
+            "time_limit": self.time_limit,
+            "delta_updates": True
         }
         if not self.send_message(message):
             self.status_message = "Failed to send game creation request."
@@ -299,10 +473,10 @@ class ChessClient:
             if response:
                 if response.get("type") == "GAME_CREATED":
                     self.game_id = response.get("game_id")
+                    self.session_token = response.get("session_token")
                     self.color = response.get("color")
                     self.time_limit = response.get("time_limit", 300)
-                    self.white_time = self.time_limit
-                    self.black_time = self.time_limit
+                    self.clocks.reset(self.time_limit)
                     self.status_message = f"Game created! ID: {self.game_id}. Waiting for opponent..."
                     print(f"Game created with ID: {self.game_id}")
                     return True
@@ -326,7 +500,8 @@ class ChessClient:
         self.status_message = "Joining game..."
         self.draw_game()
         pygame.display.flip()
-        message = {"type": "JOIN_GAME", "player_name": player_name, "player_id": player_id, "game_id": game_id}
+        message = {"type": "JOIN_GAME", "player_name": player_name, "player_id": player_id, "game_id": game_id,
+                   "delta_updates": True}
         if not self.send_message(message):
             self.status_message = "Failed to send join request."
             return False
@@ -338,12 +513,17 @@ class ChessClient:
         while time.time() - start_time < timeout:
             response = self.receive_message()
             if response:
-                if response.get("type") == "GAME_JOINED":
+                if response.get("type") == "REDIRECT":
+                    if not self.follow_redirect(response, message):
+                        self.status_message = "Failed to reach the game's server."
+                        return False
+                    start_time = time.time()
+                elif response.get("type") == "GAME_JOINED":
+                    self.session_token = response.get("session_token")
                     self.color = response.get("color")
                     self.opponent = response.get("opponent")
                     self.time_limit = response.get("time_limit", 300)
-                    self.white_time = self.time_limit
-                    self.black_time = self.time_limit
+                    self.clocks.reset(self.time_limit)
                     self.status_message = f"Joined game! Opponent: {self.opponent}"
                     print(f"Joined game {game_id} against {self.opponent}")
                     return True
@@ -369,7 +549,8 @@ class ChessClient:
         self.status_message = "Joining game as spectator..."
         self.draw_game()
         pygame.display.flip()
-        message = {"type": "SPECTATE", "player_name": player_name, "player_id": player_id, "game_id": game_id}
+        message = {"type": "SPECTATE", "player_name": player_name, "player_id": player_id, "game_id": game_id,
+                   "delta_updates": True}
         if not self.send_message(message):
             self.status_message = "Failed to send spectate request."
             return False
@@ -381,11 +562,15 @@ class ChessClient:
         while time.time() - start_time < timeout:
             response = self.receive_message()
             if response:
-                if response.get("type") == "SPECTATE_START":
+                if response.get("type") == "REDIRECT":
+                    if not self.follow_redirect(response, message):
+                        self.status_message = "Failed to reach the game's server."
+                        return False
+                    start_time = time.time()
+                elif response.get("type") == "SPECTATE_START":
                     self.board = chess.Board(response.get("board", chess.STARTING_FEN))
-                    self.white_time = response.get("white_time", 300)
-                    self.black_time = response.get("black_time", 300)
                     self.current_player = response.get("current_player", "white")
+                    self.clocks.update(response)
                     self.status_message = f"Spectating game {game_id}"
                     print(f"Spectating game {game_id}")
                     return True
@@ -603,10 +788,17 @@ class ChessClient:
         while self.running:
             try:
                 if not self.connected:
-                    time.sleep(0.1)
+                    if self.can_resume():
+                        self.resume_session()
+                    else:
+                        time.sleep(0.1)
                     continue
 
                 message = self.receive_message()
+                if not message and self.can_resume():
+                    # Dropped mid-game; the next pass reconnects and resumes
+                    self.connected = False
+                    continue
                 if not message:
                     print("No message received or connection lost")
                     consecutive_errors += 1
@@ -633,8 +825,7 @@ class ChessClient:
                         print(f"Received board FEN: {board_fen}")
                         self.board = chess.Board(board_fen)
                         self.current_player = message.get("current_player", "white")
-                        self.white_time = message.get("white_time", 300)
-                        self.black_time = message.get("black_time", 300)
+                        self.clocks.update(message)
                         self.status_message = "Game started!"
                         print("Game started!")
                     except Exception as e:
@@ -645,31 +836,37 @@ class ChessClient:
                         print(f"Received board update: {board_fen}")
                         self.board = chess.Board(board_fen)
                         self.current_player = message.get("current_player", "white")
-                        self.white_time = message.get("white_time", self.white_time)
-                        self.black_time = message.get("black_time", self.black_time)
+                        self.clocks.update(message)
                         self.game_over = message.get("game_over", False)
                         self.winner = message.get("winner")
-                        if self.game_over:
-                            if self.winner == "draw":
-                                self.status_message = "Game over! It's a draw."
-                            elif self.winner == self.color:
-                                self.status_message = "Game over! You won!"
-                            else:
-                                self.status_message = "Game over! You lost."
-                        else:
-                            if self.is_spectator:
-                                self.status_message = f"Current turn: {self.current_player}"
-                            elif self.current_player == self.color:
-                                self.status_message = "Your turn"
-                            else:
-                                self.status_message = "Opponent's turn"
+                        self.update_turn_status()
                     except Exception as e:
                         print(f"Error processing BOARD_UPDATE message: {e}")
+                elif message_type == "BOARD_DELTA":
+                    try:
+                        self.apply_delta(message)
+                    except Exception as e:
+                        print(f"Error processing BOARD_DELTA message: {e}")
+                elif message_type == "RESYNC":
+                    self.apply_resync(message)
+                    print(f"Resynced game {self.game_id} at ply {message.get('ply')}")
+                elif message_type == "REDIRECT":
+                    # Our game lives on another cluster worker; reconnecting resumes it there
+                    self.server_address = (message.get("host") or self.server_address[0], message["port"])
+                    self.connected = False
+                elif message_type == "RESUME_REJECTED":
+                    self.session_token = None
+                    self.status_message = f"Could not resume: {message.get('message', 'Unknown error')}"
+                elif message_type == "OPPONENT_DISCONNECTED":
+                    self.status_message = f"Opponent disconnected, waiting up to {message.get('grace', 0):.0f}s for them"
+                elif message_type == "OPPONENT_RECONNECTED":
+                    self.status_message = f"{message.get('opponent', 'Opponent')} reconnected"
                 elif message_type == "TIME_UPDATE":
-                    self.white_time = message.get("white_time", self.white_time)
-                    self.black_time = message.get("black_time", self.black_time)
                     self.current_player = message.get("current_player", self.current_player)
+                    self.clocks.update(message)
                 elif message_type == "GAME_OVER":
+                    # Stop the local countdown where it is
+                    self.clocks.stop(None if self.game_over else self.current_player)
                     self.game_over = True
                     self.winner = message.get("winner")
                     reason = message.get("reason", "")
@@ -882,8 +1079,8 @@ class ChessClient:
         self.exit_button.draw(self.screen)
 
         # Draw timers
-        white_timer = self.format_time(self.white_time)
-        black_timer = self.format_time(self.black_time)
+        white_timer = self.format_time(self.clock_time("white"))
+        black_timer = self.format_time(self.clock_time("black"))
 
         # White timer at the top
         white_timer_text = self.font.render(f"White: {white_timer}", True,
@@ -1,203 +1,478 @@
 import socket
 import threading
 import json
+import sys
 import time
 import uuid
 import chess
+from common.framing import FrameReader, encode_message
+from common.position import position_hash
+from server.clock import GameClock, TimeControl
+from server.cluster import Shard, run_workers
+from server.heartbeat import Heartbeat, HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT
+from server.lobby_index import LobbyIndex, PAGE_SIZE, wants_page
+from server.matchmaking import MATCH_INTERVAL, Matchmaker, parse_rating
+from server.journal import JournalStore
+from server.outbound import Connection, PLAYER_POLICY, RELAY_POLICY, SPECTATOR_POLICY
+from server.relay import is_relay, redirect_for
+from server.scheduler import Scheduler, IdleTimeout
+from server import utils as game_store
 
 # Constants
 HOST = "localhost"
 PORT = 50004
 DEFAULT_TIME_LIMIT = 300  # 5 minutes per player in seconds
+LAG_COMPENSATION = True  # Excuse a mover's round-trip time, as measured by heartbeats
+RTT_SAMPLE_INTERVAL = 5.0  # Seconds between round-trip samples of a seated player
+LISTEN_BACKLOG = 128
+HANDSHAKE_TIMEOUT = 60.0  # Seconds a new connection has to send its first message
+LOBBY_IDLE_TIMEOUT = 60.0  # Seconds a lobby connection without heartbeats may stay silent
+CLOCK_SYNC_INTERVAL = 15.0  # Seconds between TIME_UPDATE corrections; clients count down locally
+FINISHED_GAME_LINGER = 60.0  # Seconds a finished game keeps its connections open
+RECOVERY_GRACE = 120.0  # Seconds the players of a recovered game have to rejoin it
+RECONNECT_GRACE = 30.0  # Seconds a disconnected player has to resume before forfeiting
+WIRE_ENCODINGS = ("binary", "json")  # Encodings offered in HELLO, most preferred first
+SERVER_ENGINE = "threads"  # "threads" or "asyncio", can be overridden on the command line
+MAX_GAME_ID_LENGTH = 16  # Longest game ID a client may choose in CREATE_GAME
+CLUSTER_WORKERS = 1  # Worker processes sharing PORT; more than one is cluster mode (see server.cluster)
+SPECTATOR_RELAYS = []  # (host, port) of relay.py nodes that take the extra spectators of busy games
+RELAY_THRESHOLD = 100  # Spectators a game serves itself before new ones are sent to a relay
 
 # Game state
-games = {}  # game_id -> {board, players, current_player}
+games = {}  # game_id -> {board, players, current_player, lock}
 
 class SimpleServer:
-    def __init__(self):
+    def __init__(self, shard=None, port=None, relays=None):
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.lock = threading.Lock()
+        self.port = port or PORT
+        self.relays = SPECTATOR_RELAYS if relays is None else relays
+        # In cluster mode, this worker's server.cluster.Shard and the socket
+        # on its direct port, where other workers redirect its games' clients
+        self.shard = shard
+        self.direct_socket = None
+        # Only guards adding, removing and looking up entries in `games`;
+        # each game's state is guarded by its own lock, so moves in
+        # different games never wait on each other
+        self.games_lock = threading.Lock()
+        # One thread owns every clock deadline and idle timeout
+        self.scheduler = Scheduler()
+        # What GET_GAMES lists, kept up to date by publish_game()
+        self.lobby = LobbyIndex(lambda delay, callback: self.scheduler.call_later(delay, callback))
+        # Players in JOIN_LOBBY waiting for an opponent, and the timer of the
+        # next matching pass while any are; both guarded by match_lock
+        self.matchmaker = Matchmaker()
+        self.match_lock = threading.Lock()
+        self.match_timer = None
+
+    def get_game(self, game_id):
+        """Return the game with this ID, or None if it does not exist.
+
+        Callers take game["lock"] before reading or changing the game.
+        """
+        with self.games_lock:
+            return games.get(game_id)
+
+    def list_games(self):
+        """Return a snapshot of (game_id, game) pairs"""
+        with self.games_lock:
+            return list(games.items())
 
     def start(self):
+        self.bind_server_socket()
+        self.scheduler.start()
+        self.recover_games()
+        print("Waiting for connections...")
+
+        if self.direct_socket:
+            threading.Thread(target=self.accept_connections, args=(self.direct_socket,), daemon=True).start()
+        self.accept_connections()
+
+    def bind_server_socket(self):
         # Make sure we can bind to the port
         self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.shard:
+            # Every worker listens on PORT and the kernel spreads connections across them
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
 
         try:
             # Try to bind to all interfaces to make it more robust
-            self.server_socket.bind(("0.0.0.0", PORT))
-            self.server_socket.listen(10)
-            print(f"Server started on 0.0.0.0:{PORT}")
+            self.server_socket.bind(("0.0.0.0", self.port))
+            self.server_socket.listen(LISTEN_BACKLOG)
+            print(f"Server started on 0.0.0.0:{self.port}")
         except:
             # Fall back to localhost if that fails
             self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.server_socket.bind((HOST, PORT))
-            self.server_socket.listen(10)
-            print(f"Server started on {HOST}:{PORT}")
-
-        print("Waiting for connections...")
-
-        self.accept_connections()
-
-    def accept_connections(self):
+            if self.shard:
+                self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            self.server_socket.bind((HOST, self.port))
+            self.server_socket.listen(LISTEN_BACKLOG)
+            print(f"Server started on {HOST}:{self.port}")
+
+        if self.shard:
+            self.direct_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.direct_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.direct_socket.bind(("0.0.0.0", self.shard.direct_port()))
+            self.direct_socket.listen(LISTEN_BACKLOG)
+            print(f"Worker {self.shard.index}/{self.shard.shards} direct port {self.shard.direct_port()}")
+
+    def accept_connections(self, server_socket=None):
+        server_socket = server_socket or self.server_socket
         while True:
             try:
-                client_socket, addr = self.server_socket.accept()
+                client_socket, addr = server_socket.accept()
                 print(f"New connection from {addr}")
                 threading.Thread(target=self.handle_client, args=(client_socket, addr), daemon=True).start()
             except Exception as e:
                 print(f"Error accepting connection: {e}")
                 break
 
-    def handle_client(self, client_socket, addr):
+    def handle_client(self, raw_socket, addr):
+        # Reads happen on this thread; all writes go through the connection's
+        # outbound queue so a slow client never blocks the thread sending to it
+        client_socket = Connection(raw_socket, addr)
         try:
-            # Set a timeout for receiving data
-            client_socket.settimeout(60.0)
+            # Drop connections that never identify themselves
+            handshake = IdleTimeout(self.scheduler, HANDSHAKE_TIMEOUT, client_socket.abort)
 
             # Receive initial message
-            data = client_socket.recv(1024).decode('utf-8')
-            if not data:
+            reader = FrameReader(raw_socket)
+            message = reader.read_message()
+            if message and message.get("type") == "HELLO":
+                self.handle_hello(client_socket, message)
+                message = self.read_message(client_socket, reader)
+            handshake.cancel()
+            if not message:
                 print(f"No data received from {addr}, closing connection")
-                client_socket.close()
+                return
+            if self.redirect(client_socket, message):
                 return
 
-            # Parse message
-            message = json.loads(data)
             message_type = message.get("type")
 
             if message_type == "CREATE_GAME":
-                self.handle_create_game(client_socket, message)
+                game_id = self.handle_create_game(client_socket, message)
+                if game_id:
+                    # Wait for opponent
+                    self.wait_for_opponent(client_socket, reader, game_id)
             elif message_type == "JOIN_GAME":
-                self.handle_join_game(client_socket, message)
+                game_id = self.handle_join_game(client_socket, message)
+                if game_id:
+                    # Start the game and handle the black player on this thread
+                    self.start_game(game_id)
+                    self.handle_game(client_socket, reader, game_id, "black")
+            elif message_type == "REJOIN_GAME":
+                color = self.handle_rejoin_game(client_socket, message)
+                if color:
+                    self.handle_game(client_socket, reader, message.get("game_id"), color)
+            elif message_type == "RESUME":
+                color = self.handle_resume(client_socket, message)
+                if color:
+                    self.handle_game(client_socket, reader, message.get("game_id"), color)
             elif message_type == "SPECTATE":
-                self.handle_spectate_game(client_socket, message)
+                spectator_id = self.handle_spectate_game(client_socket, message)
+                if spectator_id:
+                    self.handle_spectator(client_socket, reader, message.get("game_id"), spectator_id)
             elif message_type == "JOIN_LOBBY":
-                self.handle_join_lobby(client_socket, message)
+                self.handle_join_lobby(client_socket, reader, message)
+            elif message_type == "GET_GAMES" and message.get("subscribe"):
+                self.watch_lobby(client_socket, reader, message)
             elif message_type == "GET_GAMES":
                 self.handle_get_games(client_socket, message)
             else:
                 print(f"Unknown message type: {message_type}")
                 self.send_message(client_socket, {"type": "ERROR", "message": "Unknown message type"})
-                client_socket.close()
 
         except Exception as e:
             print(f"Error handling client {addr}: {e}")
+        finally:
+            if client_socket.heartbeat:
+                client_socket.heartbeat.cancel()
+            # Flushes anything still queued before the socket is closed
             client_socket.close()
 
-    def handle_get_games(self, client_socket, message):
-        """Handle a request for the list of active games"""
+    def handle_hello(self, client_socket, message):
+        """Agree on the wire encoding from the ones the client lists, and on heartbeats"""
+        offered = message.get("encodings") or ["json"]
+        encoding = next((name for name in WIRE_ENCODINGS if name in offered), "json")
+        client_socket.binary = encoding == "binary"
+        reply = {"type": "HELLO", "encoding": encoding}
+        if message.get("heartbeat"):
+            # Clients that answer PING are reaped if they stop answering;
+            # older clients keep a connection for as long as TCP does
+            client_socket.heartbeat = Heartbeat(
+                self.scheduler,
+                lambda ping_id: self.send_message(client_socket, {"type": "PING", "id": ping_id}),
+                lambda: self.reap_connection(client_socket),
+                HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT)
+            reply["heartbeat"] = {"interval": HEARTBEAT_INTERVAL, "timeout": HEARTBEAT_TIMEOUT}
+        self.send_message(client_socket, reply)
+
+    def read_message(self, client_socket, reader):
+        """Next message from a client, or None once it disconnects. Heartbeats are handled here."""
+        while True:
+            message = reader.read_message()
+            if not message or not self.handle_heartbeat(client_socket, message):
+                return message
+
+    def handle_heartbeat(self, client_socket, message):
+        """Note that the client is alive and answer PING/PONG. Returns True if the message was one."""
+        heartbeat = client_socket.heartbeat
+        if heartbeat:
+            heartbeat.touch()
+        message_type = message.get("type")
+        if message_type == "PING":
+            self.send_message(client_socket, {"type": "PONG", "id": message.get("id")})
+            return True
+        if message_type == "PONG":
+            if heartbeat:
+                heartbeat.pong(message.get("id"))
+            return True
+        return False
+
+    def reap_connection(self, client_socket):
+        """Heartbeat callback: drop a client that stopped answering.
+
+        Its reader sees the connection close and runs the usual disconnect
+        handling, so a player still gets RECONNECT_GRACE to resume.
+        """
+        print(f"No heartbeat from {client_socket.addr}, dropping the connection")
+        client_socket.abort()
+
+    def redirect(self, client_socket, message):
+        """In cluster mode, send a request about another worker's game there. Returns True if redirected."""
+        if not self.shard:
+            return False
+        redirect = self.shard.redirect_for(message)
+        if redirect is None:
+            return False
+        print(f"Redirecting {message.get('type')} for game {redirect['game_id']} to port {redirect['port']}")
+        self.send_message(client_socket, redirect)
+        return True
+
+    def handle_get_games(self, client_socket, message, peer_games=None):
+        """Handle a request for the list of active games, from the lobby index.
+
+        A request with status, order, cursor or limit gets one page, with
+        the cursor of the next page (None on the last), the number of
+        matching games and the index version. Otherwise it gets every game,
+        in cluster mode with the other workers' games unless the request has
+        scope "local" (the other workers asking for ours); `peer_games` is
+        their list when the caller has already fetched it. Pages only cover
+        this worker's games.
+        """
         print("Handling GET_GAMES request")
-        
-        with self.lock:
-            # Create a list of game information
-            game_list = []
-            for game_id, game in games.items():
-                # Only include games that are active (waiting or playing)
-                if game["status"] in ["waiting", "playing"]:
-                    game_info = {
-                        "game_id": game_id,
-                        "status": game["status"],
-                        "spectator_count": len(game.get("spectators", [])),
-                        "players": {}
-                    }
-                    
-                    # Add player information
-                    for color, player_data in game["players"].items():
-                        if isinstance(player_data, dict) and "name" in player_data:
-                            game_info["players"][color] = player_data["name"]
-                    
-                    game_list.append(game_info)
-            
-            # Send the game list to the client
+
+        if wants_page(message):
+            try:
+                game_list, cursor, total, version = self.lobby.page(
+                    message.get("status"), message.get("order", "newest"), message.get("cursor"),
+                    message.get("limit", PAGE_SIZE))
+            except (TypeError, ValueError) as e:
+                self.send_message(client_socket, {"type": "ERROR", "message": f"Bad GET_GAMES: {e}"})
+                return
             self.send_message(client_socket, {
                 "type": "GAME_LIST",
-                "games": game_list
+                "games": game_list,
+                "cursor": cursor,
+                "total": total,
+                "version": version
             })
-            print(f"Sent list of {len(game_list)} games")
+            print(f"Sent page of {len(game_list)} of {total} games")
+            return
+
+        game_list = self.lobby.all()
+        if peer_games is None and self.shard and message.get("scope") != "local":
+            peer_games = self.shard.peer_games()
+        game_list.extend(peer_games or [])
+
+        # Send the game list to the client
+        self.send_message(client_socket, {
+            "type": "GAME_LIST",
+            "games": game_list
+        })
+        print(f"Sent list of {len(game_list)} games")
+
+    def watch_lobby(self, client_socket, reader, message):
+        """Serve a GET_GAMES with subscribe: the first page, then LOBBY_DIFF as games change.
+
+        Further pages can be asked for on the same connection until the
+        client disconnects.
+        """
+        subscriber_id = self.subscribe_lobby(client_socket, message)
+        idle = None if client_socket.heartbeat else IdleTimeout(self.scheduler, LOBBY_IDLE_TIMEOUT, client_socket.abort)
+        try:
+            while True:
+                message = self.read_message(client_socket, reader)
+                if not message:
+                    print("Lobby watcher disconnected")
+                    return
+                if idle:
+                    idle.touch()
+                if message.get("type") == "GET_GAMES":
+                    self.handle_get_games(client_socket, dict(message, subscribe=False))
+        finally:
+            self.lobby.unsubscribe(subscriber_id)
+            if idle:
+                idle.cancel()
+
+    def subscribe_lobby(self, client_socket, message):
+        """Subscribe a client to lobby changes and send its first page. Returns the subscriber ID."""
+        # Subscribed before the page is read, so no change falls in between
+        subscriber_id = self.lobby.subscribe(lambda diff: self.send_message(client_socket, diff),
+                                             message.get("status"))
+        self.handle_get_games(client_socket, message)
+        return subscriber_id
+
+    def lobby_entry(self, game_id, game):
+        """A game as GET_GAMES lists it. Called with the game's lock held."""
+        return {
+            "game_id": game_id,
+            "status": game["status"],
+            "spectator_count": len(game.get("spectators", [])),
+            "players": {color: player_data["name"] for color, player_data in game["players"].items()
+                        if isinstance(player_data, dict) and "name" in player_data},
+            "created_at": game["created_at"]
+        }
+
+    def publish_game(self, game_id, game):
+        """Bring the lobby index up to date with a change to a game. Called with the game's lock held."""
+        self.lobby.update(self.lobby_entry(game_id, game))
 
     def handle_create_game(self, client_socket, message):
         player_name = message.get("player_name")
         player_id = message.get("player_id")
-        time_limit = message.get("time_limit", DEFAULT_TIME_LIMIT)  # Get time limit or use default
 
         if not player_name or not player_id:
             self.send_message(client_socket, {"type": "ERROR", "message": "Missing player information"})
-            return
+            return None
 
-        # Create a new game with a shorter, more readable ID
-        # Use a combination of letters and numbers for easier sharing
-        import random
-        letters = 'ABCDEFGHJKLMNPQRSTUVWXYZ'  # Removed similar looking characters
-        numbers = '23456789'  # Removed 0/1 to avoid confusion with O/I
+        # time_limit is seconds, or a time control spec with an increment or delay
+        try:
+            time_control = TimeControl.parse(message.get("time_limit", DEFAULT_TIME_LIMIT))
+        except ValueError as e:
+            self.send_message(client_socket, {"type": "ERROR", "message": f"Invalid time control: {e}"})
+            return None
+        time_limit = time_control.base
 
-        # Create a 6-character game ID (3 letters + 3 numbers)
-        game_id = ''.join(random.choice(letters) for _ in range(3)) + \
-                 ''.join(random.choice(numbers) for _ in range(3))
-
-        with self.lock:
-            games[game_id] = {
-                "board": chess.Board(),
-                "players": {
-                    "white": {"name": player_name, "id": player_id, "socket": client_socket, 
-                             "time_remaining": time_limit}
-                },
-                "current_player": "white",
-                "status": "waiting",
-                "spectators": [],
-                "created_at": time.time(),  # Add timestamp for sorting
-                "time_limit": time_limit,  # Store time limit
-                "turn_start_time": None,  # When the current turn started
-                "last_move_time": time.time()  # Time of the last move
-            }
+        self.seat_connection(client_socket)
+
+        # A gateway in front of several servers picks the ID itself, so that
+        # it knows which server has the game; it is used if it is free
+        game_id = message.get("game_id")
+        if not self.is_free_game_id(game_id):
+            game_id = self.new_game_id()
+
+        # Lets this player resume the game from a new connection
+        token = uuid.uuid4().hex
 
-        print(f"Game {game_id} created by {player_name} ({player_id}) with time limit {time_limit}s")
+        game = self.add_game(game_id, time_control, "waiting", {
+            "white": {"name": player_name, "id": player_id, "socket": client_socket,
+                      "token": token, "delta": bool(message.get("delta_updates"))}
+        })
+        with game["lock"]:
+            self.publish_game(game_id, game)
+
+        print(f"Game {game_id} created by {player_name} ({player_id}) with time control {time_control}")
 
         # Notify the client
         self.send_message(client_socket, {
             "type": "GAME_CREATED",
             "game_id": game_id,
             "color": "white",
-            "time_limit": time_limit
+            "time_limit": time_limit,
+            "time_control": time_control.to_dict(),
+            "session_token": token
         })
 
-        # Wait for opponent
-        self.wait_for_opponent(client_socket, game_id)
+        return game_id
+
+    def new_game_id(self):
+        """A 6-character game ID (3 letters + 3 numbers); in cluster mode, one of this worker's shard"""
+        # Use a combination of letters and numbers for easier sharing
+        import random
+        letters = 'ABCDEFGHJKLMNPQRSTUVWXYZ'  # Removed similar looking characters
+        numbers = '23456789'  # Removed 0/1 to avoid confusion with O/I
+
+        while True:
+            game_id = ''.join(random.choice(letters) for _ in range(3)) + \
+                     ''.join(random.choice(numbers) for _ in range(3))
+            if not self.shard or self.shard.owns(game_id):
+                return game_id
+
+    def add_game(self, game_id, time_control, status, players):
+        """Create a game with these seated players and add it to `games`; returns it"""
+        game = {
+            "board": chess.Board(),
+            "players": players,
+            "current_player": "white",
+            "status": status,
+            "spectators": [],
+            "created_at": time.time(),  # Add timestamp for sorting
+            "time_limit": time_control.base,  # Base time per player
+            "time_control": time_control,
+            "clock": GameClock(time_control),  # Starts with the game
+            "last_move_time": time.time(),  # Time of the last move
+            "lock": threading.RLock()  # Guards everything in this game
+        }
+        with self.games_lock:
+            games[game_id] = game
+        return game
+
+    def is_free_game_id(self, game_id):
+        """True if a client-chosen game ID is well formed, unused and, in cluster mode, ours"""
+        if not isinstance(game_id, str) or not 0 < len(game_id) <= MAX_GAME_ID_LENGTH:
+            return False
+        if not (game_id.isascii() and game_id.isalnum()):
+            return False
+        if self.shard and not self.shard.owns(game_id):
+            return False
+        return self.get_game(game_id) is None
 
     def handle_join_game(self, client_socket, message):
+        """Seat the client as black and notify both players.
+
+        Returns the game ID once the opponents have been told, or None if the
+        join was rejected. Starting the game is left to the caller.
+        """
         player_name = message.get("player_name")
         player_id = message.get("player_id")
         game_id = message.get("game_id")
 
         if not player_name or not player_id or not game_id:
             self.send_message(client_socket, {"type": "ERROR", "message": "Missing information"})
-            return
+            return None
 
         print(f"Attempting to join game {game_id} with player {player_name} ({player_id})")
 
         # Check if game exists
-        with self.lock:
-            if game_id not in games:
-                print(f"Game {game_id} not found")
-                self.send_message(client_socket, {"type": "ERROR", "message": "Game not found"})
-                return
-
-            game = games[game_id]
+        game = self.get_game(game_id)
+        if game is None:
+            print(f"Game {game_id} not found")
+            self.send_message(client_socket, {"type": "ERROR", "message": "Game not found"})
+            return None
 
+        with game["lock"]:
             # Check if game is waiting for a player
             if game["status"] != "waiting":
                 print(f"Game {game_id} is already full")
                 self.send_message(client_socket, {"type": "ERROR", "message": "Game is already full"})
-                return
+                return None
 
             # Add player to game
+            self.seat_connection(client_socket)
             time_limit = game.get("time_limit", DEFAULT_TIME_LIMIT)
+            token = uuid.uuid4().hex
             game["players"]["black"] = {
                 "name": player_name, 
                 "id": player_id, 
                 "socket": client_socket,
-                "time_remaining": time_limit
+                "token": token,
+                "delta": bool(message.get("delta_updates"))
             }
             game["status"] = "playing"
+            game_store.save_game_state(game_id, self.persisted_state(game))
+            self.publish_game(game_id, game)
 
         print(f"Player {player_name} ({player_id}) joined game {game_id}")
 
@@ -208,7 +483,9 @@ class SimpleServer:
                 "game_id": game_id,
                 "color": "black",
                 "opponent": game["players"]["white"]["name"],
-                "time_limit": time_limit
+                "time_limit": time_limit,
+                "time_control": game["time_control"].to_dict(),
+                "session_token": token
             })
 
             # Notify the other player
@@ -217,187 +494,466 @@ class SimpleServer:
                 "type": "OPPONENT_JOINED",
                 "opponent": player_name
             })
-
-            # Give a short delay to ensure messages are processed
-            time.sleep(0.5)
-
-            # Start the game
-            self.start_game(game_id)
+            return game_id
         except Exception as e:
             print(f"Error during game join process: {e}")
             # Try to recover by setting game back to waiting
-            with self.lock:
-                if game_id in games:
-                    games[game_id]["status"] = "waiting"
-                    if "black" in games[game_id]["players"]:
-                        del games[game_id]["players"]["black"]
+            with game["lock"]:
+                game["status"] = "waiting"
+                game["players"].pop("black", None)
+                self.publish_game(game_id, game)
+            game_store.remove_game(game_id)
+            return None
+
+    def handle_rejoin_game(self, client_socket, message):
+        """Seat a player again in a game recovered after a restart.
+
+        Returns the player's color, or None if the rejoin was rejected. The
+        clock resumes once every player is back.
+        """
+        player_id = message.get("player_id")
+        game_id = message.get("game_id")
+
+        if not player_id or not game_id:
+            self.send_message(client_socket, {"type": "ERROR", "message": "Missing information"})
+            return None
+
+        game = self.get_game(game_id)
+        if game is None:
+            print(f"Game {game_id} not found")
+            self.send_message(client_socket, {"type": "ERROR", "message": "Game not found"})
+            return None
+
+        with game["lock"]:
+            color = None
+            for seat, player_data in game["players"].items():
+                if player_data["id"] == player_id and player_data["socket"] is None:
+                    color = seat
+            if color is None or game["status"] != "playing":
+                self.send_message(client_socket, {"type": "ERROR", "message": "No seat to rejoin"})
+                return None
+
+            self.seat_player(game_id, game, color, client_socket, message.get("delta_updates"))
+            opponent = game["players"]["black" if color == "white" else "white"]
+            print(f"Player {player_id} rejoined game {game_id} as {color}")
+
+            self.send_message(client_socket, {
+                "type": "GAME_REJOINED",
+                "game_id": game_id,
+                "color": color,
+                "opponent": opponent["name"],
+                "board": game["board"].fen(),
+                "current_player": game["current_player"],
+                **self.clock_fields(game),
+                "time_limit": game["time_limit"],
+                "time_control": game["time_control"].to_dict()
+            })
+        return color
+
+    def handle_resume(self, client_socket, message):
+        """Resume a player's session from a new connection.
+
+        The session token issued by GAME_CREATED or GAME_JOINED identifies
+        the seat. The player gets a RESYNC with the position, the moves
+        played after `last_ply` and the clocks. Returns the player's color,
+        or None if the session cannot be resumed.
+        """
+        token = message.get("token")
+        game_id = message.get("game_id")
+
+        game = self.get_game(game_id) if token and game_id else None
+        if game is None:
+            self.send_message(client_socket, {"type": "RESUME_REJECTED", "message": "Game not found"})
+            return None
+
+        with game["lock"]:
+            color = None
+            for seat, player_data in game["players"].items():
+                if player_data.get("token") == token:
+                    color = seat
+            if color is None:
+                self.send_message(client_socket, {"type": "RESUME_REJECTED", "message": "Invalid session"})
+                return None
+
+            if game["status"] == "playing":
+                self.seat_player(game_id, game, color, client_socket, message.get("delta_updates"))
+                print(f"Player {game['players'][color]['id']} resumed game {game_id} as {color}")
+            # A finished game still gets the RESYNC so the client learns the result
+            self.send_message(client_socket, self.resync_message(game_id, game, color, message.get("last_ply")))
+            return color if game["status"] == "playing" else None
+
+    def seat_player(self, game_id, game, color, client_socket, delta=False):
+        """Attach a new connection to a player's seat. Called with the game's lock held.
+
+        Cancels the forfeit timer of a disconnected player and restarts the
+        clock of a recovered game once both players are back.
+        """
+        player = game["players"][color]
+        if player.get("reconnect_timer"):
+            player["reconnect_timer"].cancel()
+            player["reconnect_timer"] = None
+
+        old_socket = player["socket"]
+        self.seat_connection(client_socket)
+        player["socket"] = client_socket
+        player["delta"] = bool(delta)
+        if old_socket is not None and old_socket is not client_socket:
+            # The client gave up on it; its reader sees the seat taken and leaves quietly
+            old_socket.abort()
+
+        opponent = game["players"]["black" if color == "white" else "white"]
+        if opponent["socket"] is not None:
+            self.send_message(opponent["socket"], {
+                "type": "OPPONENT_RECONNECTED",
+                "opponent": player["name"]
+            })
 
-    def handle_join_lobby(self, client_socket, message):
+        if self.all_seated(game) and game["clock"].running is None:
+            # Time spent while the server was down is not charged
+            game["clock"].start(game["current_player"])
+            self.schedule_clock(game_id, game)
+            # Clients count down locally, so tell them the clock is running again
+            self.broadcast_time_update(game)
+
+    def seat_connection(self, client_socket):
+        """Set up a player's connection: player policy, and RTT samples for lag compensation"""
+        client_socket.policy = PLAYER_POLICY
+        if LAG_COMPENSATION and client_socket.heartbeat:
+            # On the scheduler's thread, which runs the heartbeat's checks
+            self.scheduler.call_later(0, client_socket.heartbeat.sample_every, RTT_SAMPLE_INTERVAL)
+
+    def move_lag(self, client_socket):
+        """Round-trip time to excuse on a move from this connection"""
+        heartbeat = client_socket.heartbeat
+        if not LAG_COMPENSATION or heartbeat is None or heartbeat.srtt is None:
+            return 0.0
+        return heartbeat.srtt
+
+    def resync_message(self, game_id, game, color, last_ply):
+        """RESYNC for a resuming player. Called with the game's lock held.
+
+        `moves` lists the moves after last_ply, or is None when the client's
+        ply is unknown or older than the board's move stack, in which case
+        the client rebuilds from the FEN.
+        """
+        board = game["board"]
+        ply = board.ply()
+        # A recovered board's move stack only starts at its last move
+        first_ply = ply - len(board.move_stack)
+        moves = None
+        if isinstance(last_ply, int) and first_ply <= last_ply <= ply:
+            moves = [move.uci() for move in board.move_stack[last_ply - first_ply:]]
+
+        opponent = None
+        if color is not None:
+            opponent = game["players"]["black" if color == "white" else "white"]["name"]
+
+        return {
+            "type": "RESYNC",
+            "game_id": game_id,
+            "color": color,
+            "opponent": opponent,
+            "board": board.fen(),
+            "ply": ply,
+            "moves": moves,
+            "current_player": game["current_player"],
+            **self.clock_fields(game),
+            "game_over": game["status"] == "finished",
+            "winner": game.get("winner")
+        }
+
+    def handle_join_lobby(self, client_socket, reader, message):
+        """Queue the player for matchmaking and serve them until matched, then play the game here"""
         player_id = message.get("player_id")
-        if not player_id:
-            self.send_message(client_socket, {"type": "ERROR", "message": "Missing player ID"})
-            return
-        
-        print(f"Player {player_id} joining lobby")
-        self.send_message(client_socket, {"type": "WAITING", "message": "Waiting for opponent..."})
-        
-        # In a real implementation, you would match this player with another waiting player
-        # For now, just keep the connection open until the client disconnects
+        # Until matched, a client without heartbeats is dropped once it goes quiet
+        idle = None if client_socket.heartbeat else IdleTimeout(self.scheduler, LOBBY_IDLE_TIMEOUT, client_socket.abort)
+        ticket = None
         try:
+            ticket = self.join_queue(client_socket, message, idle)
+            if ticket is None:
+                return
             while True:
-                data = client_socket.recv(1024).decode('utf-8')
-                if not data:
-                    print(f"Client {player_id} disconnected from lobby")
-                    break
-                
-                # Handle any messages from the client while in the lobby
-                message = json.loads(data)
-                message_type = message.get("type")
-                
-                if message_type == "GET_GAMES":
-                    # Send list of available games
-                    with self.lock:
-                        available_games = []
-                        for game_id, game in games.items():
-                            if game["status"] == "waiting":
-                                available_games.append(game_id)
-                        
-                        self.send_message(client_socket, {
-                            "type": "GAME_LIST",
-                            "games": available_games
-                        })
+                match = ticket.data["match"]
+                if match:
+                    self.handle_game(client_socket, reader, *match)
+                    return
+
+                message = self.read_message(client_socket, reader)
+                if not message:
+                    match = self.leave_queue(ticket)
+                    if match:
+                        print(f"Client {player_id} disconnected before its game started")
+                        self.handle_player_disconnect(client_socket, *match)
+                    else:
+                        print(f"Client {player_id} disconnected from lobby")
+                    return
+                if idle:
+                    idle.touch()
+
+                # The player may have been matched while we were blocked in recv
+                match = ticket.data["match"]
+                if match:
+                    self.dispatch_game_message(client_socket, *match, message)
+                elif message.get("type") in ("CANCEL_GAME", "LEAVE_LOBBY"):
+                    print(f"Player {player_id} left the lobby")
+                    return
+                else:
+                    # Handle any messages from the client while in the lobby
+                    self.handle_lobby_message(client_socket, message)
         except Exception as e:
             print(f"Error in lobby for player {player_id}: {e}")
         finally:
+            if idle:
+                idle.cancel()
+            if ticket:
+                self.leave_queue(ticket)
             client_socket.close()
 
+    def join_queue(self, client_socket, message, idle=None):
+        """Put a JOIN_LOBBY player in the matchmaking queue; returns their ticket, or None if rejected.
+
+        JOIN_LOBBY may give a "rating" and a "time_limit" as in CREATE_GAME;
+        only players on the same time control are matched. A player paired
+        straight away has a game by the time this returns. Otherwise
+        ticket.data["match"] becomes (game_id, color) once a matching pass
+        seats them, while their connection's thread is still reading.
+        """
+        player_id = message.get("player_id")
+        if not player_id:
+            self.send_message(client_socket, {"type": "ERROR", "message": "Missing player ID"})
+            return None
+        try:
+            rating = parse_rating(message.get("rating"))
+            time_control = TimeControl.parse(message.get("time_limit", DEFAULT_TIME_LIMIT))
+        except ValueError as e:
+            self.send_message(client_socket, {"type": "ERROR", "message": f"Invalid matchmaking request: {e}"})
+            return None
+
+        print(f"Player {player_id} joining lobby, rating {rating}, time control {time_control}")
+        self.send_message(client_socket, {"type": "WAITING", "message": "Waiting for opponent..."})
+
+        data = {"name": message.get("player_name") or player_id, "socket": client_socket,
+                "delta": bool(message.get("delta_updates")), "time_control": time_control,
+                "idle": idle, "match": None}
+        key = (time_control.base, time_control.increment, time_control.delay)
+        game_id = None
+        with self.match_lock:
+            ticket = self.matchmaker.enqueue(player_id, rating, key, data=data)
+            opponent = self.matchmaker.find_opponent(ticket)
+            if opponent:
+                game_id = self.seat_match(opponent, ticket)
+            else:
+                self.schedule_matchmaking()
+        if game_id:
+            self.start_game(game_id)
+        return ticket
+
+    def leave_queue(self, ticket):
+        """Take a lobby player out of the queue; returns their (game_id, color) if they were matched first"""
+        with self.match_lock:
+            self.matchmaker.cancel(ticket.player_id, ticket)
+            return ticket.data["match"]
+
+    def schedule_matchmaking(self):
+        """Make sure a matching pass is coming while anyone waits. Called with match_lock held."""
+        if self.match_timer is None and len(self.matchmaker):
+            self.match_timer = self.scheduler.call_later(MATCH_INTERVAL, self.run_matchmaking)
+
+    def run_matchmaking(self):
+        """Scheduler callback: pair waiting players whose rating windows have widened enough"""
+        started = []
+        with self.match_lock:
+            self.match_timer = None
+            try:
+                for first, second in self.matchmaker.match():
+                    started.append(self.seat_match(first, second))
+            except Exception as e:
+                print(f"Error in matchmaking pass: {e}")
+            finally:
+                self.schedule_matchmaking()
+        for game_id in started:
+            self.start_game(game_id)
+
+    def seat_match(self, first, second):
+        """Create the game for two matched tickets and send both MATCH_FOUND. Called with match_lock held.
+
+        Colors are drawn at random. The game is "playing" straight away;
+        the caller starts it with start_game() once match_lock is released.
+        """
+        import random
+        tickets = [first, second]
+        random.shuffle(tickets)
+        seats = dict(zip(("white", "black"), tickets))
+        time_control = first.data["time_control"]
+        game_id = self.new_game_id()
+        players = {color: {"name": ticket.data["name"], "id": ticket.player_id, "socket": ticket.data["socket"],
+                           "token": uuid.uuid4().hex, "delta": ticket.data["delta"]}
+                   for color, ticket in seats.items()}
+        game = self.add_game(game_id, time_control, "playing", players)
+        with game["lock"]:
+            game_store.save_game_state(game_id, self.persisted_state(game))
+            self.publish_game(game_id, game)
+
+        print(f"Matched {first.player_id} ({first.rating}) with {second.player_id} ({second.rating}) in game {game_id}")
+        for color, ticket in seats.items():
+            opponent = seats["black" if color == "white" else "white"]
+            if ticket.data["idle"]:
+                ticket.data["idle"].cancel()
+            ticket.data["match"] = (game_id, color)
+            self.seat_connection(ticket.data["socket"])
+            self.send_message(ticket.data["socket"], {
+                "type": "MATCH_FOUND",
+                "game_id": game_id,
+                "color": color,
+                "opponent": opponent.data["name"],
+                "opponent_rating": opponent.rating,
+                "time_limit": time_control.base,
+                "time_control": time_control.to_dict(),
+                "session_token": players[color]["token"]
+            })
+        return game_id
+
+    def handle_lobby_message(self, client_socket, message):
+        """Handle a message from a client waiting in the lobby"""
+        if message.get("type") == "GET_GAMES":
+            # A page of lobby entries like any GET_GAMES, by default of the games
+            # waiting for an opponent; a lobby connection cannot also subscribe
+            self.handle_get_games(client_socket, dict({"status": "waiting"}, **message))
+
     def handle_spectate_game(self, client_socket, message):
+        """Register the client as a spectator.
+
+        Returns the spectator ID on success so the caller can go on to serve
+        the spectator connection, or None if spectating failed.
+        """
         player_name = message.get("player_name")
         player_id = message.get("player_id")
         game_id = message.get("game_id")
 
         if not player_name or not player_id or not game_id:
             self.send_message(client_socket, {"type": "ERROR", "message": "Missing information"})
-            return
+            return None
 
         print(f"Attempting to spectate game {game_id} with player {player_name} ({player_id})")
 
         # Check if game exists
-        with self.lock:
-            if game_id not in games:
-                print(f"Game {game_id} not found")
-                self.send_message(client_socket, {"type": "ERROR", "message": "Game not found"})
-                return
-
-            game = games[game_id]
-
-            # Add spectator to game
+        game = self.get_game(game_id)
+        if game is None:
+            print(f"Game {game_id} not found")
+            self.send_message(client_socket, {"type": "ERROR", "message": "Game not found"})
+            return None
+
+        with game["lock"]:
+            # A busy game's further spectators watch through a relay, so
+            # its cost here stays the same however many there are
+            redirect = redirect_for(game_id, self.relays, len(game.get("spectators", [])), message,
+                                    RELAY_THRESHOLD)
+            if redirect:
+                print(f"Sending spectator {player_id} of game {game_id} to relay {redirect['host']}:{redirect['port']}")
+                self.send_message(client_socket, redirect)
+                return None
+
+            # Add spectator to game; spectators that fall behind are
+            # coalesced, downgraded and eventually evicted by the policy.
+            # A relay feeds many spectators and is only ever coalesced.
             if "spectators" not in game:
                 game["spectators"] = []
+            client_socket.policy = RELAY_POLICY if is_relay(message) else SPECTATOR_POLICY
             
             game["spectators"].append({
                 "name": player_name,
                 "id": player_id,
-                "socket": client_socket
+                "socket": client_socket,
+                "delta": bool(message.get("delta_updates"))
             })
+            self.publish_game(game_id, game)
 
         print(f"Player {player_name} ({player_id}) is now spectating game {game_id}")
 
         try:
-            # Get time information
-            white_time = game["players"]["white"]["time_remaining"]
-            black_time = game["players"]["black"]["time_remaining"] if "black" in game["players"] else game["time_limit"]
-            
             # Notify the spectator
             self.send_message(client_socket, {
                 "type": "SPECTATE_START",
                 "game_id": game_id,
                 "board": game["board"].fen(),
-                "white_time": white_time,
-                "black_time": black_time,
+                **self.clock_fields(game),
                 "current_player": game["current_player"]
             })
 
             # Notify players that a spectator joined
-            for color in ["white", "black"]:
-                if color in game["players"] and isinstance(game["players"][color], dict):
-                    player_socket = game["players"][color].get("socket")
-                    if player_socket:
-                        self.send_message(player_socket, {
-                            "type": "SPECTATOR_JOINED",
-                            "spectator_name": player_name,
-                            "spectator_count": len(game["spectators"])
-                        })
-
-            # Start a thread to handle the spectator
-            threading.Thread(target=self.handle_spectator,
-                           args=(client_socket, game_id, player_id),
-                           daemon=True).start()
+            self.broadcast(game, {
+                "type": "SPECTATOR_JOINED",
+                "spectator_name": player_name,
+                "spectator_count": len(game["spectators"])
+            }, spectators=False)
+            return player_id
         except Exception as e:
             print(f"Error during spectate process: {e}")
             # Remove spectator on error
-            with self.lock:
-                if game_id in games and "spectators" in games[game_id]:
-                    games[game_id]["spectators"] = [s for s in games[game_id]["spectators"] if s["id"] != player_id]
+            with game["lock"]:
+                game["spectators"] = [s for s in game["spectators"] if s["id"] != player_id]
+                self.publish_game(game_id, game)
+            return None
 
-    def wait_for_opponent(self, client_socket, game_id):
+    def wait_for_opponent(self, client_socket, reader, game_id):
         # This function handles the client that created the game
         try:
             while True:
-                with self.lock:
-                    if game_id not in games:
-                        # Game was deleted
-                        return
+                game = self.get_game(game_id)
+                if game is None:
+                    # Game was deleted
+                    return
 
-                    game = games[game_id]
+                with game["lock"]:
                     if game["status"] == "playing":
                         # Game has started
                         break
 
                 # Wait for messages (like move requests)
-                try:
-                    data = client_socket.recv(1024).decode('utf-8')
-                    if not data:
-                        print(f"Client disconnected while waiting for opponent")
-                        self.remove_player_from_game(client_socket, game_id)
-                        return
-
-                    message = json.loads(data)
-                    if message.get("type") == "CANCEL_GAME":
-                        self.remove_player_from_game(client_socket, game_id)
-                        return
-                except socket.timeout:
-                    # Just a timeout, keep waiting
-                    continue
+                message = self.read_message(client_socket, reader)
+                if not message:
+                    print(f"Client disconnected while waiting for opponent")
+                    self.remove_player_from_game(client_socket, game_id)
+                    return
+
+                if message.get("type") == "CANCEL_GAME":
+                    self.remove_player_from_game(client_socket, game_id)
+                    return
+
+                # The opponent may have joined while we were blocked in recv
+                if self.is_started(game_id):
+                    self.dispatch_game_message(client_socket, game_id, "white", message)
 
             # Handle the game
-            self.handle_game(client_socket, game_id, "white")
+            self.handle_game(client_socket, reader, game_id, "white")
 
         except Exception as e:
             print(f"Error waiting for opponent: {e}")
             self.remove_player_from_game(client_socket, game_id)
 
     def start_game(self, game_id):
-        try:
-            with self.lock:
-                if game_id not in games:
-                    print(f"Game {game_id} not found when starting")
-                    return
+        """Start the clocks and send GAME_START to both players.
 
-                game = games[game_id]
+        Returns True if the game was started.
+        """
+        try:
+            game = self.get_game(game_id)
+            if game is None:
+                print(f"Game {game_id} not found when starting")
+                return False
 
+            with game["lock"]:
                 # Verify both players are connected
                 if "white" not in game["players"] or "black" not in game["players"]:
                     print(f"Missing players in game {game_id}")
-                    return
+                    return False
 
-                # Set the turn start time
-                game["turn_start_time"] = time.time()
+                # White's clock starts now
+                game["clock"].start("white")
                 game["last_move_time"] = time.time()
                 
                 # Get time limits
-                white_time = game["players"]["white"]["time_remaining"]
-                black_time = game["players"]["black"]["time_remaining"]
+                clock = self.clock_fields(game)
 
                 # Send initial board state to both players
                 board_fen = game["board"].fen()
@@ -411,13 +967,12 @@ class SimpleServer:
                         "type": "GAME_START",
                         "board": board_fen,
                         "current_player": "white",
-                        "white_time": white_time,
-                        "black_time": black_time
+                        **clock
                     })
                     print(f"Sent GAME_START to white player in game {game_id}")
                 except Exception as e:
                     print(f"Error sending start message to white player: {e}")
-                    return
+                    return False
 
                 # Send to black player
                 try:
@@ -426,205 +981,209 @@ class SimpleServer:
                         "type": "GAME_START",
                         "board": board_fen,
                         "current_player": "white",
-                        "white_time": white_time,
-                        "black_time": black_time
+                        **clock
                     })
                     print(f"Sent GAME_START to black player in game {game_id}")
                 except Exception as e:
                     print(f"Error sending start message to black player: {e}")
-                    return
+                    return False
 
-                # Start a thread to handle the black player
-                try:
-                    black_socket = game["players"]["black"]["socket"]
-                    threading.Thread(target=self.handle_game,
-                                   args=(black_socket, game_id, "black"),
-                                   daemon=True).start()
-                    print(f"Started thread for black player in game {game_id}")
-                except Exception as e:
-                    print(f"Error starting thread for black player: {e}")
-
-                # Start a thread to manage the timer
-                threading.Thread(target=self.manage_timer, args=(game_id,), daemon=True).start()
-                print(f"Started timer thread for game {game_id}")
+                self.schedule_clock(game_id, game)
+                print(f"Scheduled clock for game {game_id}")
+                return True
 
         except Exception as e:
             print(f"Error in start_game: {e}")
+            return False
+
+    def schedule_clock(self, game_id, game, synced=True):
+        """(Re)arm the game's clock timer. Called with the game's lock held.
+
+        Clients count the running clock down themselves from the clocks in
+        the last message, so the timer only fires when the player on move
+        runs out of time or, failing that, for a TIME_UPDATE correction
+        CLOCK_SYNC_INTERVAL after the clocks were last sent. `synced` says
+        they have just been sent.
+        """
+        if game.get("clock_timer"):
+            game["clock_timer"].cancel()
+        now = self.scheduler.time()
+        if synced or game.get("clock_sync_at") is None:
+            game["clock_sync_at"] = now + CLOCK_SYNC_INTERVAL
+        delay = min(game["clock_sync_at"] - now, game["clock"].time_to_flag())
+        game["clock_timer"] = self.scheduler.call_later(max(0.0, delay), self.clock_tick, game_id)
+
+    def clock_tick(self, game_id):
+        """Scheduler callback: flag a timeout or send a TIME_UPDATE correction"""
+        game = self.get_game(game_id)
+        if game is None:
+            return
 
-    def manage_timer(self, game_id):
-        """Manage the timer for a game"""
-        print(f"Timer management started for game {game_id}")
-        try:
-            while True:
-                with self.lock:
-                    if game_id not in games:
-                        print(f"Game {game_id} no longer exists, stopping timer")
-                        return
-
-                    game = games[game_id]
-                    
-                    if game["status"] == "finished":
-                        print(f"Game {game_id} is finished, stopping timer")
-                        return
-                    
-                    # Only update time if the game is in progress
-                    if game["status"] == "playing" and game["turn_start_time"] is not None:
-                        current_player = game["current_player"]
-                        
-                        # Calculate elapsed time since turn start
-                        current_time = time.time()
-                        elapsed = current_time - game["turn_start_time"]
-                        
-                        # Update the player's remaining time
-                        if current_player in game["players"]:
-                            player = game["players"][current_player]
-                            player["time_remaining"] = max(0, player["time_remaining"] - elapsed)
-                            
-                            # Check for timeout
-                            if player["time_remaining"] <= 0:
-                                print(f"Player {current_player} in game {game_id} has run out of time")
-                                game["status"] = "finished"
-                                game["winner"] = "black" if current_player == "white" else "white"
-                                
-                                # Notify both players
-                                for color, player_data in game["players"].items():
-                                    if "socket" in player_data:
-                                        self.send_message(player_data["socket"], {
-                                            "type": "GAME_OVER",
-                                            "winner": game["winner"],
-                                            "reason": "timeout"
-                                        })
-                                
-                                # Notify spectators
-                                for spectator in game.get("spectators", []):
-                                    if "socket" in spectator:
-                                        self.send_message(spectator["socket"], {
-                                            "type": "GAME_OVER",
-                                            "winner": game["winner"],
-                                            "reason": "timeout"
-                                        })
-                                
-                                return
-                        
-                        # Update turn start time for next calculation
-                        game["turn_start_time"] = current_time
-                        
-                        # Send time updates every second
-                        if current_time - game["last_move_time"] >= 1.0:
-                            game["last_move_time"] = current_time
-                            
-                            # Get current time values
-                            white_time = game["players"]["white"]["time_remaining"]
-                            black_time = game["players"]["black"]["time_remaining"]
-                            
-                            # Send time updates to players
-                            for color, player_data in game["players"].items():
-                                if "socket" in player_data:
-                                    self.send_message(player_data["socket"], {
-                                        "type": "TIME_UPDATE",
-                                        "white_time": white_time,
-                                        "black_time": black_time,
-                                        "current_player": current_player
-                                    })
-                            
-                            # Send time updates to spectators
-                            for spectator in game.get("spectators", []):
-                                if "socket" in spectator:
-                                    self.send_message(spectator["socket"], {
-                                        "type": "TIME_UPDATE",
-                                        "white_time": white_time,
-                                        "black_time": black_time,
-                                        "current_player": current_player
-                                    })
-                
-                # Sleep for a short time to avoid excessive CPU usage
-                time.sleep(0.1)
-                
-        except Exception as e:
-            print(f"Error in timer management for game {game_id}: {e}")
+        with game["lock"]:
+            game["clock_timer"] = None
+            if game["status"] != "playing":
+                return
+
+            if not self.check_flag(game_id, game):
+                return
+
+            synced = self.scheduler.time() >= game["clock_sync_at"]
+            if synced:
+                self.broadcast_time_update(game)
+            self.schedule_clock(game_id, game, synced)
+
+    def clock_fields(self, game):
+        """Both clocks as of now, for a message. Called with the game's lock held.
+
+        `server_time` is the wall-clock time they were read at, so a client
+        can tell a newer reading from an older one; the client counts the
+        player on move down locally until the next reading. `clock_paused`
+        is set while no clock is running.
+        """
+        clocks = game["clock"].snapshot()
+        fields = {
+            "white_time": round(clocks["white"], 3),
+            "black_time": round(clocks["black"], 3),
+            "server_time": time.time()
+        }
+        if game["clock"].running is None and game["status"] != "finished":
+            fields["clock_paused"] = True
+        return fields
+
+    def broadcast_time_update(self, game):
+        """Send the clocks to players and spectators. Called with the game's lock held."""
+        self.broadcast(game, {
+            "type": "TIME_UPDATE",
+            **self.clock_fields(game),
+            "current_player": game["current_player"]
+        })
 
-    def handle_game(self, client_socket, game_id, color):
+    def check_flag(self, game_id, game, lag=0.0):
+        """End the game and return False if the player on move has run out of time.
+
+        `lag` is the round-trip allowance of a move being checked.
+        Called with the game's lock held.
+        """
+        if not game["clock"].flagged(lag=lag):
+            return True
+
+        current_player = game["current_player"]
+        print(f"Player {current_player} in game {game_id} has run out of time")
+        winner = "black" if current_player == "white" else "white"
+        self.finish_game(game_id, game, winner, "timeout")
+
+        # Notify both players and spectators
+        self.broadcast(game, {
+            "type": "GAME_OVER",
+            "winner": winner,
+            "reason": "timeout"
+        })
+        return False
+
+    def finish_game(self, game_id, game, winner, reason):
+        """Mark the game as over. Called with the game's lock held.
+
+        The clock is stopped and the game is dropped, with its remaining
+        connections, once FINISHED_GAME_LINGER has passed.
+        """
+        game["status"] = "finished"
+        game["winner"] = winner
+        self.lobby.remove(game_id)
+        game["clock"].stop()
+        if game.get("clock_timer"):
+            game["clock_timer"].cancel()
+            game["clock_timer"] = None
+        game_store.finish_game(game_id, winner, reason)
+        self.scheduler.call_later(FINISHED_GAME_LINGER, self.close_finished_game, game_id)
+
+    def close_finished_game(self, game_id):
+        with self.games_lock:
+            game = games.get(game_id)
+            if game is None or game["status"] != "finished":
+                return
+            del games[game_id]
+
+        with game["lock"]:
+            for player_data in game["players"].values():
+                if player_data["socket"] is not None:
+                    player_data["socket"].close()
+            for spectator in game.get("spectators", []):
+                spectator["socket"].close()
+        print(f"Closed finished game {game_id}")
+
+    def handle_game(self, client_socket, reader, game_id, color):
         try:
             while True:
-                with self.lock:
-                    if game_id not in games:
-                        # Game was deleted
-                        return
-
-                    game = games[game_id]
-                    if game["status"] == "finished":
-                        # Game is over
-                        return
+                if self.is_finished(game_id):
+                    return
 
                 # Wait for messages
-                try:
-                    data = client_socket.recv(1024).decode('utf-8')
-                    if not data:
-                        print(f"Client disconnected during game")
-                        self.handle_player_disconnect(client_socket, game_id, color)
-                        return
-
-                    message = json.loads(data)
-                    message_type = message.get("type")
-
-                    if message_type == "MOVE":
-                        self.handle_move(client_socket, game_id, color, message)
-                    elif message_type == "CHAT":
-                        self.handle_chat(client_socket, game_id, color, message)
-                    elif message_type == "RESIGN":
-                        self.handle_resign(client_socket, game_id, color)
-
-                except socket.timeout:
-                    # Just a timeout, keep waiting
-                    continue
+                message = self.read_message(client_socket, reader)
+                if not message:
+                    print(f"Client disconnected during game")
+                    self.handle_player_disconnect(client_socket, game_id, color)
+                    return
+
+                self.dispatch_game_message(client_socket, game_id, color, message)
 
         except Exception as e:
             print(f"Error handling game: {e}")
             self.handle_player_disconnect(client_socket, game_id, color)
 
-    def handle_spectator(self, client_socket, game_id, spectator_id):
+    def dispatch_game_message(self, client_socket, game_id, color, message):
+        """Route a message from a seated player to its handler"""
+        message_type = message.get("type")
+
+        if message_type == "MOVE":
+            self.handle_move(client_socket, game_id, color, message)
+        elif message_type == "CHAT":
+            self.handle_chat(client_socket, game_id, color, message)
+        elif message_type == "RESYNC_REQUEST":
+            self.handle_resync_request(client_socket, game_id, color, message)
+        elif message_type == "RESIGN":
+            self.handle_resign(client_socket, game_id, color)
+
+    def handle_spectator(self, client_socket, reader, game_id, spectator_id):
         try:
             while True:
-                with self.lock:
-                    if game_id not in games:
-                        # Game was deleted
-                        return
-
-                    game = games[game_id]
-                    if game["status"] == "finished":
-                        # Game is over
-                        return
+                if self.is_finished(game_id):
+                    return
 
                 # Wait for messages (only chat from spectators)
-                try:
-                    data = client_socket.recv(1024).decode('utf-8')
-                    if not data:
-                        print(f"Spectator disconnected")
-                        self.handle_spectator_disconnect(client_socket, game_id, spectator_id)
-                        return
-
-                    message = json.loads(data)
-                    message_type = message.get("type")
-
-                    if message_type == "CHAT":
-                        self.handle_spectator_chat(client_socket, game_id, spectator_id, message)
+                message = self.read_message(client_socket, reader)
+                if not message:
+                    print(f"Spectator disconnected")
+                    self.handle_spectator_disconnect(client_socket, game_id, spectator_id)
+                    return
 
-                except socket.timeout:
-                    # Just a timeout, keep waiting
-                    continue
+                if message.get("type") == "CHAT":
+                    self.handle_spectator_chat(client_socket, game_id, spectator_id, message)
+                elif message.get("type") == "RESYNC_REQUEST":
+                    self.handle_resync_request(client_socket, game_id, None, message)
 
         except Exception as e:
             print(f"Error handling spectator: {e}")
             self.handle_spectator_disconnect(client_socket, game_id, spectator_id)
 
+    def handle_resync_request(self, client_socket, game_id, color, message):
+        """Send the full position to a delta client that lost track of it.
+
+        `color` is None for spectators.
+        """
+        game = self.get_game(game_id)
+        if game is None:
+            return
+
+        with game["lock"]:
+            self.send_message(client_socket, self.resync_message(game_id, game, color, message.get("last_ply")))
+
     def handle_spectator_chat(self, client_socket, game_id, spectator_id, message):
         """Handle a chat message from a spectator"""
-        with self.lock:
-            if game_id not in games:
-                return
-
-            game = games[game_id]
+        game = self.get_game(game_id)
+        if game is None:
+            return
 
+        with game["lock"]:
             # Get the spectator's name
             spectator_name = None
             for spec in game.get("spectators", []):
@@ -643,32 +1202,19 @@ class SimpleServer:
             formatted_message = f"[Spectator] {spectator_name}: {chat_text}"
             print(f"Chat from spectator {spectator_name} in game {game_id}: {chat_text}")
 
-            # Forward the message to both players
-            for color in ["white", "black"]:
-                if color in game["players"]:
-                    player_socket = game["players"][color]["socket"]
-                    self.send_message(player_socket, {
-                        "type": "CHAT",
-                        "player_name": f"[Spectator] {spectator_name}",
-                        "message": chat_text
-                    })
-
-            # Forward to other spectators
-            for spec in game.get("spectators", []):
-                if spec["id"] != spectator_id:
-                    self.send_message(spec["socket"], {
-                        "type": "CHAT",
-                        "player_name": f"[Spectator] {spectator_name}",
-                        "message": chat_text
-                    })
+            # Forward the message to both players and the other spectators
+            self.broadcast(game, {
+                "type": "CHAT",
+                "player_name": f"[Spectator] {spectator_name}",
+                "message": chat_text
+            }, exclude=client_socket)
 
     def handle_spectator_disconnect(self, client_socket, game_id, spectator_id):
-        with self.lock:
-            if game_id not in games:
-                return
+        game = self.get_game(game_id)
+        if game is None:
+            return
 
-            game = games[game_id]
-            
+        with game["lock"]:
             # Get spectator name before removing
             spectator_name = None
             for spec in game.get("spectators", []):
@@ -679,28 +1225,24 @@ class SimpleServer:
             # Remove spectator from the game
             if "spectators" in game:
                 game["spectators"] = [s for s in game["spectators"] if s["id"] != spectator_id]
+                self.publish_game(game_id, game)
                 print(f"Spectator {spectator_id} disconnected from game {game_id}")
                 
                 # Notify players that a spectator left
-                for color in ["white", "black"]:
-                    if color in game["players"] and isinstance(game["players"][color], dict):
-                        player_socket = game["players"][color].get("socket")
-                        if player_socket:
-                            self.send_message(player_socket, {
-                                "type": "SPECTATOR_LEFT",
-                                "spectator_name": spectator_name,
-                                "spectator_count": len(game["spectators"])
-                            })
+                self.broadcast(game, {
+                    "type": "SPECTATOR_LEFT",
+                    "spectator_name": spectator_name,
+                    "spectator_count": len(game["spectators"])
+                }, spectators=False)
 
     def handle_move(self, client_socket, game_id, color, message):
         move_uci = message.get("move")
 
-        with self.lock:
-            if game_id not in games:
-                return
-
-            game = games[game_id]
+        game = self.get_game(game_id)
+        if game is None:
+            return
 
+        with game["lock"]:
             # Check if it's this player's turn
             if game["current_player"] != color:
                 self.send_message(client_socket, {
@@ -709,6 +1251,19 @@ class SimpleServer:
                 })
                 return
 
+            # A recovered game stays paused until both players have rejoined
+            if game["status"] == "playing" and game["clock"].running is None:
+                self.send_message(client_socket, {
+                    "type": "ERROR",
+                    "message": "Waiting for your opponent to rejoin"
+                })
+                return
+
+            # The move is lost if it came too late, even allowing for lag
+            lag = self.move_lag(client_socket)
+            if game["status"] == "playing" and not self.check_flag(game_id, game, lag):
+                return
+
             # Try to make the move
             try:
                 move = chess.Move.from_uci(move_uci)
@@ -716,35 +1271,29 @@ class SimpleServer:
                     # Make the move
                     game["board"].push(move)
 
-                    # Update current player
+                    # Charge the mover and start the next player's clock
+                    think_time = game["clock"].press(lag)
                     next_player = "black" if color == "white" else "white"
                     game["current_player"] = next_player
-                    
-                    # Reset turn start time for the next player
-                    game["turn_start_time"] = time.time()
                     game["last_move_time"] = time.time()
+                    print(f"Game {game_id}: {color} played {move_uci} after {think_time:.2f}s (lag allowance {lag:.3f}s)")
 
-                    # Check for game end conditions
-                    game_over = False
-                    winner = None
+                    # Journal the move before any result is recorded for it
+                    game_store.record_move(game_id, move_uci, self.persisted_state(game))
 
+                    # Check for game end conditions
                     if game["board"].is_checkmate():
-                        game_over = True
-                        winner = color
-                        game["status"] = "finished"
-                        game["winner"] = winner
-                    elif game["board"].is_stalemate() or game["board"].is_insufficient_material():
-                        game_over = True
-                        winner = "draw"
-                        game["status"] = "finished"
-                        game["winner"] = winner
-
-                    # Get current time values
-                    white_time = game["players"]["white"]["time_remaining"]
-                    black_time = game["players"]["black"]["time_remaining"]
-
-                    # Send updated board to both players and spectators
-                    self.broadcast_game_state(game, white_time, black_time)
+                        self.finish_game(game_id, game, color, "checkmate")
+                    elif game["board"].is_stalemate():
+                        self.finish_game(game_id, game, "draw", "stalemate")
+                    elif game["board"].is_insufficient_material():
+                        self.finish_game(game_id, game, "draw", "insufficient_material")
+                    elif game["status"] == "playing":
+                        # The next player's clock starts now
+                        self.schedule_clock(game_id, game)
+
+                    # Send updated board and clocks to both players and spectators
+                    self.broadcast_game_state(game, move)
                 else:
                     self.send_message(client_socket, {
                         "type": "ERROR",
@@ -758,12 +1307,11 @@ class SimpleServer:
 
     def handle_chat(self, client_socket, game_id, color, message):
         """Handle a chat message from a player"""
-        with self.lock:
-            if game_id not in games:
-                return
-
-            game = games[game_id]
+        game = self.get_game(game_id)
+        if game is None:
+            return
 
+        with game["lock"]:
             # Get the player's name
             player_name = message.get("player_name", "Unknown")
             chat_text = message.get("message", "")
@@ -773,135 +1321,354 @@ class SimpleServer:
 
             print(f"Chat from {player_name} in game {game_id}: {chat_text}")
 
-            # Forward the message to the other player
-            other_color = "black" if color == "white" else "white"
-            if other_color in game["players"]:
-                other_socket = game["players"][other_color]["socket"]
-                self.send_message(other_socket, {
-                    "type": "CHAT",
-                    "player_name": player_name,
-                    "message": chat_text
-                })
-                
-            # Forward to all spectators
-            for spectator in game.get("spectators", []):
-                self.send_message(spectator["socket"], {
-                    "type": "CHAT",
-                    "player_name": player_name,
-                    "message": chat_text
-                })
+            # Forward the message to the other player and all spectators
+            self.broadcast(game, {
+                "type": "CHAT",
+                "player_name": player_name,
+                "message": chat_text
+            }, exclude=client_socket)
 
     def handle_resign(self, client_socket, game_id, color):
-        with self.lock:
-            if game_id not in games:
-                return
+        game = self.get_game(game_id)
+        if game is None:
+            return
 
-            game = games[game_id]
-            game["status"] = "finished"
+        with game["lock"]:
+            if game["status"] == "finished":
+                return
 
             # The other player wins
             winner = "black" if color == "white" else "white"
-            game["winner"] = winner
-
-            # Notify both players
-            for player_color, player in game["players"].items():
-                self.send_message(player["socket"], {
-                    "type": "GAME_OVER",
-                    "winner": winner,
-                    "reason": "resignation"
-                })
-                
-            # Notify spectators
-            for spectator in game.get("spectators", []):
-                self.send_message(spectator["socket"], {
-                    "type": "GAME_OVER",
-                    "winner": winner,
-                    "reason": "resignation"
-                })
+            self.finish_game(game_id, game, winner, "resignation")
+
+            # Notify both players and spectators
+            self.broadcast(game, {
+                "type": "GAME_OVER",
+                "winner": winner,
+                "reason": "resignation"
+            })
 
     def handle_player_disconnect(self, client_socket, game_id, color):
-        with self.lock:
-            if game_id not in games:
+        game = self.get_game(game_id)
+        if game is None:
+            return
+
+        with game["lock"]:
+            if game["status"] == "finished":
                 return
 
-            game = games[game_id]
-            game["status"] = "finished"
+            player = game["players"][color]
+            if player["socket"] is not client_socket:
+                # The player already resumed on a new connection
+                return
+
+            # Keep the seat for RECONNECT_GRACE; the clock keeps running
+            player["socket"] = None
+            player["reconnect_timer"] = self.scheduler.call_later(
+                RECONNECT_GRACE, self.forfeit_disconnected, game_id, color)
+            print(f"Player {color} disconnected from game {game_id}, waiting {RECONNECT_GRACE}s to resume")
+
+            self.broadcast(game, {
+                "type": "OPPONENT_DISCONNECTED",
+                "player_name": player["name"],
+                "grace": RECONNECT_GRACE
+            })
+
+    def forfeit_disconnected(self, game_id, color):
+        """Scheduler callback: a disconnected player did not resume in time"""
+        game = self.get_game(game_id)
+        if game is None:
+            return
+
+        with game["lock"]:
+            player = game["players"][color]
+            player["reconnect_timer"] = None
+            if game["status"] != "playing" or player["socket"] is not None:
+                return
 
             # The other player wins
             winner = "black" if color == "white" else "white"
-            game["winner"] = winner
+            self.finish_game(game_id, game, winner, "disconnect")
 
-            # Notify the other player
-            other_color = "black" if color == "white" else "white"
-            if other_color in game["players"]:
-                other_socket = game["players"][other_color]["socket"]
-                self.send_message(other_socket, {
-                    "type": "GAME_OVER",
-                    "winner": winner,
-                    "reason": "disconnect"
-                })
-                
-            # Notify spectators
-            for spectator in game.get("spectators", []):
-                self.send_message(spectator["socket"], {
-                    "type": "GAME_OVER",
-                    "winner": winner,
-                    "reason": "disconnect"
-                })
+            # Notify the other player and spectators
+            self.broadcast(game, {
+                "type": "GAME_OVER",
+                "winner": winner,
+                "reason": "disconnect"
+            })
+
+    def broadcast_game_state(self, game, move=None):
+        """Send the current game state to all players and spectators.
 
-    def broadcast_game_state(self, game, white_time, black_time):
-        """Send the current game state to all players and spectators."""
+        Recipients that asked for delta_updates get a BOARD_DELTA with just
+        the move, the ply and a position hash to check it against; everyone
+        else gets the full BOARD_UPDATE. Each variant is encoded once.
+        """
         try:
-            state = {
+            clock = self.clock_fields(game)
+            update = {
+                "type": "BOARD_UPDATE",
                 "board": game["board"].fen(),
                 "current_player": game["current_player"],
                 "game_over": game["status"] == "finished",
                 "winner": game.get("winner"),
-                "white_time": white_time,
-                "black_time": black_time
+                **clock
             }
-            
-            message = {
-                "type": "BOARD_UPDATE",
-                "board": state["board"],
-                "current_player": state["current_player"],
-                "game_over": state["game_over"],
-                "winner": state["winner"],
-                "white_time": state["white_time"],
-                "black_time": state["black_time"]
+            if move is None:
+                self.broadcast(game, update)
+                return
+
+            delta = {
+                "type": "BOARD_DELTA",
+                "move": move.uci(),
+                "ply": game["board"].ply(),
+                "hash": position_hash(game["board"]),
+                "current_player": game["current_player"],
+                **clock
             }
-            
-            # Send to both players with error handling for each
-            for color in ["white", "black"]:
-                if color in game["players"]:
-                    try:
-                        player_socket = game["players"][color]["socket"]
-                        self.send_message(player_socket, message)
-                    except Exception as e:
-                        print(f"Error sending to {color} player: {e}")
-            
-            # Send to all spectators with error handling for each
-            for spectator in game.get("spectators", []):
-                try:
-                    self.send_message(spectator["socket"], message)
-                except Exception as e:
-                    print(f"Error sending to spectator: {e}")
-                    
+            if game["status"] == "finished":
+                delta["game_over"] = True
+                delta["winner"] = game.get("winner")
+
+            # One frame per (delta, binary) variant actually in use
+            frames = {}
+            for recipient in self.recipients(game):
+                connection = recipient["socket"]
+                variant = (bool(recipient.get("delta")), connection.binary)
+                data = frames.get(variant)
+                if data is None:
+                    data = frames[variant] = encode_message(delta if variant[0] else update, connection.binary)
+                self.send_bytes(connection, data, delta["type"] if variant[0] else update["type"])
         except Exception as e:
             print(f"Error in broadcast_game_state: {e}")
 
+    def broadcast(self, game, message, players=True, spectators=True, exclude=None):
+        """Send one message to everyone in a game.
+
+        The message is serialized once per wire encoding and the same
+        immutable frame is handed to every recipient using it, so a move
+        costs at most two encodes however many spectators are watching.
+        `exclude` skips one socket, e.g. the sender of a chat message.
+        """
+        frames = {}
+        kind = message.get("type")
+        for recipient in self.recipients(game, players, spectators):
+            connection = recipient["socket"]
+            if connection is exclude:
+                continue
+            data = frames.get(connection.binary)
+            if data is None:
+                data = frames[connection.binary] = encode_message(message, connection.binary)
+            self.send_bytes(connection, data, kind)
+
+    def recipients(self, game, players=True, spectators=True):
+        """Player and spectator entries of a game that have a connection"""
+        entries = []
+        if players:
+            entries.extend(game["players"].values())
+        if spectators:
+            entries.extend(game.get("spectators", []))
+        return [entry for entry in entries if entry.get("socket")]
+
+    def all_seated(self, game):
+        """True if every player in the game has a connection"""
+        return all(player_data["socket"] is not None for player_data in game["players"].values())
+
+    def persisted_state(self, game):
+        """The part of a game that survives a restart. Called with the game's lock held."""
+        return {
+            "server": "simple_server",
+            "board": game["board"].fen(),
+            "current_player": game["current_player"],
+            "status": game["status"],
+            "game_over": game["status"] == "finished",
+            "time_limit": game["time_limit"],
+            "time_control": game["time_control"].to_dict(),
+            "created_at": game["created_at"],
+            "players": {color: {"name": player_data["name"], "id": player_data["id"],
+                                "token": player_data.get("token")}
+                        for color, player_data in game["players"].items()},
+            "clocks": game["clock"].snapshot(),
+            "think_times": list(game["clock"].think_times)
+        }
+
+    def recover_games(self, store=None):
+        """Rebuild the games that were being played when the server last stopped.
+
+        Each board is set up from the position after the last move, without
+        replaying the journal, so its move stack is empty and a resuming
+        client rebuilds from the FEN. Each clock is restored as of the last
+        move. The games stay paused
+        until their players send REJOIN_GAME; games not rejoined within
+        RECOVERY_GRACE are abandoned. Returns the number of games recovered.
+        """
+        store = store or game_store.get_store()
+        started = time.monotonic()
+        recovered = 0
+        for game_id in store.active_game_ids():
+            if self.shard and not self.shard.owns(game_id):
+                # Another worker's game
+                continue
+            try:
+                state, board = store.load_game(game_id, replay=False)
+            except Exception as e:
+                print(f"Error recovering game {game_id}: {e}")
+                continue
+            if state is None or state.get("server") != "simple_server":
+                continue
+            if state.get("status") != "playing" or state.get("game_over"):
+                store.remove(game_id)
+                continue
+
+            game = self.restore_game(state, board)
+            with self.games_lock:
+                games[game_id] = game
+            with game["lock"]:
+                self.publish_game(game_id, game)
+            self.scheduler.call_later(RECOVERY_GRACE, self.abandon_recovered_game, game_id)
+            recovered += 1
+
+        if recovered:
+            print(f"Recovered {recovered} games in {time.monotonic() - started:.2f}s")
+        return recovered
+
+    def restore_game(self, state, board):
+        """Build a games entry from a persisted state, with every seat empty"""
+        players = {}
+        for color, player_data in state["players"].items():
+            players[color] = {
+                "name": player_data["name"],
+                "id": player_data["id"],
+                "socket": None,
+                "token": player_data.get("token")
+            }
+        # Games journaled before time controls existed only have time_limit
+        time_control = TimeControl.parse(state.get("time_control") or state["time_limit"])
+        clock = GameClock(time_control, state["clocks"])
+        clock.think_times = list(state.get("think_times", []))
+        return {
+            "board": board,
+            "players": players,
+            "current_player": state["current_player"],
+            "status": "playing",
+            "spectators": [],
+            "created_at": state["created_at"],
+            "time_limit": state["time_limit"],
+            "time_control": time_control,
+            "clock": clock,  # Stopped until the last player rejoins
+            "last_move_time": time.time(),
+            "lock": threading.RLock()
+        }
+
+    def abandon_recovered_game(self, game_id):
+        """Scheduler callback: end a recovered game its players did not come back to"""
+        game = self.get_game(game_id)
+        if game is None:
+            return
+
+        with game["lock"]:
+            if game["status"] != "playing" or self.all_seated(game):
+                return
+
+            # A player who came back wins; if nobody did it is a draw
+            present = [color for color, player_data in game["players"].items()
+                       if player_data["socket"] is not None]
+            winner = present[0] if present else "draw"
+            print(f"Game {game_id} was not rejoined after recovery")
+            self.finish_game(game_id, game, winner, "abandoned")
+            self.broadcast(game, {
+                "type": "GAME_OVER",
+                "winner": winner,
+                "reason": "abandoned"
+            })
+
+    def is_started(self, game_id):
+        """True if the game exists and is no longer waiting for an opponent"""
+        game = self.get_game(game_id)
+        if game is None:
+            return False
+        with game["lock"]:
+            return game["status"] != "waiting"
+
+    def is_finished(self, game_id):
+        """True if the game is over or has been deleted"""
+        game = self.get_game(game_id)
+        if game is None:
+            return True
+        with game["lock"]:
+            return game["status"] == "finished"
+
     def remove_player_from_game(self, client_socket, game_id):
-        with self.lock:
-            if game_id in games:
-                del games[game_id]
+        with self.games_lock:
+            games.pop(game_id, None)
+        self.lobby.remove(game_id)
 
     def send_message(self, socket, message):
-        try:
-            data = json.dumps(message).encode('utf-8')
-            socket.send(data)
-        except Exception as e:
-            print(f"Error sending message: {e}")
+        self.send_bytes(socket, encode_message(message, socket.binary), message.get("type"))
+
+    def send_bytes(self, connection, data, kind=None):
+        """Queue an already encoded frame for a client.
+
+        `kind` is the message type, which the connection's slow-consumer
+        policy uses to decide what can be coalesced or dropped.
+        """
+        if not connection.send(data, kind):
+            print(f"Dropped {kind} for {connection.addr}: connection closed, queue full or slow consumer")
+
+def create_server(engine, shard=None, port=None, relays=None):
+    if engine == "asyncio":
+        # Imported lazily so the threaded server has no asyncio dependency at startup
+        from simple_async_server import AsyncSimpleServer
+        return AsyncSimpleServer(shard, port, relays)
+    return SimpleServer(shard, port, relays)
+
+
+def use_journal(directory):
+    """Journal games in `directory`, so several servers on one host (e.g. behind gateway.py) keep apart"""
+    game_store.configure_store(JournalStore(directory))
+
+
+def run_worker(index, workers, engine, port=None, journal=None, relays=None):
+    """Entry point of one cluster worker process"""
+    port = port or PORT
+    if journal:
+        use_journal(journal)
+    create_server(engine, Shard(index, workers, port), port, relays).start()
+
 
 if __name__ == "__main__":
-    server = SimpleServer()
-    server.start()
+    args = sys.argv[1:]
+    journal = None
+    if "--journal" in args:
+        position = args.index("--journal")
+        journal = args[position + 1] if position + 1 < len(args) else ""
+        del args[position:position + 2]
+    relays = []
+    while "--relay" in args:
+        position = args.index("--relay")
+        host, _, relay_port = (args[position + 1] if position + 1 < len(args) else "").rpartition(":")
+        relays.append((host or "127.0.0.1", int(relay_port) if relay_port.isdigit() else 0))
+        del args[position:position + 2]
+    options = {"--workers": CLUSTER_WORKERS, "--port": PORT}
+    for option in options:
+        if option in args:
+            position = args.index(option)
+            try:
+                options[option] = int(args[position + 1])
+            except (IndexError, ValueError):
+                options[option] = 0
+            del args[position:position + 2]
+    workers, port = options["--workers"], options["--port"]
+    if len(args) > 1 or (args and args[0] not in ["threads", "asyncio"]) or workers < 1 or port < 1 \
+            or journal == "" or any(relay_port < 1 for _, relay_port in relays):
+        print("Usage: python simple_server.py [threads|asyncio] [--workers N] [--port PORT] [--journal DIR] "
+              "[--relay HOST:PORT]...")
+        sys.exit(1)
+    engine = args[0] if args else SERVER_ENGINE
+    if workers > 1:
+        print(f"Starting {workers} workers on port {port}")
+        run_workers(workers, run_worker, engine, port, journal, relays or None)
+    else:
+        if journal:
+            use_journal(journal)
+        create_server(engine, port=port, relays=relays or None).start()
@@ -0,0 +1,81 @@
+import os
+import socket
+import sys
+import threading
+import time
+
+import pytest
+
+# The tests import the server and client modules the way the scripts do, from the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common.framing import FrameReader, encode_message
+from server.journal import JournalStore
+from server.utils import configure_store
+from simple_server import create_server
+
+SERVER_TIMEOUT = 5.0  # Seconds a test waits for the server before failing
+
+
+class Client:
+    """A bare protocol client: sends dicts and reads the dicts the server sends back"""
+
+    def __init__(self, port):
+        self.sock = socket.create_connection(("127.0.0.1", port), timeout=SERVER_TIMEOUT)
+        self.reader = FrameReader(self.sock)
+
+    def send(self, message):
+        self.sock.sendall(encode_message(message))
+
+    def receive(self):
+        return self.reader.read_message()
+
+    def until(self, message_type):
+        """Skip messages up to the next one of this type and return it"""
+        while True:
+            message = self.receive()
+            assert message is not None, f"Connection closed while waiting for {message_type}"
+            if message.get("type") == message_type:
+                return message
+
+    def close(self):
+        self.sock.close()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="module", params=["threads", "asyncio"])
+def server_port(request, tmp_path_factory):
+    """Port of a SimpleServer on each engine, journaling to a temporary directory"""
+    configure_store(JournalStore(str(tmp_path_factory.mktemp("journal")), fsync_policy="never"))
+    port = free_port()
+    threading.Thread(target=create_server(request.param, port=port).start, daemon=True).start()
+    deadline = time.monotonic() + SERVER_TIMEOUT
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=SERVER_TIMEOUT).close()
+            return port
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+@pytest.fixture
+def connect(server_port):
+    """Opens Client connections to the server, closing them after the test"""
+    clients = []
+
+    def connect():
+        client = Client(server_port)
+        clients.append(client)
+        return client
+
+    yield connect
+    for client in clients:
+        client.close()
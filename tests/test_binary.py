@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from common.binary import decode_binary, decode_move, encode_binary, encode_move, is_binary
+from common.framing import HEADER, FrameDecoder, decode_payload, encode_message
+
+DELTA = {
+    "type": "BOARD_DELTA", "move": "e7e8q", "ply": 41, "hash": "463b96181691fc9c",
+    "current_player": "black", "white_time": 181.25, "black_time": 9.5, "server_time": 1760700000.123,
+    "game_over": True, "winner": "white"
+}
+
+
+@pytest.mark.parametrize("uci", ["a1a2", "h8h1", "e2e4", "e7e8q", "b2a1n", "g7g8r", "c2c1b"])
+def test_move_codes_round_trip(uci):
+    assert decode_move(encode_move(uci)) == uci
+    assert 0 <= encode_move(uci) < 1 << 16
+
+
+@pytest.mark.parametrize("message", [
+    {"type": "MOVE", "move": "g1f3"},
+    DELTA,
+    {"type": "TIME_UPDATE", "white_time": 12.345, "black_time": 0.0, "server_time": 1760700000.5,
+     "current_player": "white"},
+    {"type": "BOARD_UPDATE", "board": "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1",
+     "current_player": "black", "game_over": False, "winner": None, "white_time": 300.0,
+     "black_time": 299.9, "server_time": 1760700001.0},
+])
+def test_binary_payloads_decode_to_the_json_form(message):
+    payload = encode_binary(message)
+    assert is_binary(payload)
+    assert len(payload) < len(json.dumps(message))
+    assert decode_binary(payload) == message
+
+
+def test_messages_without_a_layout_stay_json():
+    assert encode_binary({"type": "CHAT", "text": "hi"}) is None
+    # An extra key the layout cannot carry
+    assert encode_binary({"type": "MOVE", "move": "e2e4", "game_id": "ABC123"}) is None
+    # A field out of the layout's range
+    assert encode_binary({"type": "MOVE", "move": "e2e9"}) is None
+    frame = encode_message({"type": "MOVE", "move": "e2e4", "game_id": "ABC123"}, binary=True)
+    assert frame[HEADER.size:HEADER.size + 1] == b"{"
+
+
+def test_binary_and_json_frames_mix_on_one_stream():
+    messages = [{"type": "MOVE", "move": "e2e4"}, {"type": "CHAT", "text": "gl"}, DELTA]
+    stream = b"".join(encode_message(message, binary=True) for message in messages)
+    assert FrameDecoder().feed_messages(stream) == messages
+
+
+def test_malformed_binary_payloads_raise_value_error():
+    with pytest.raises(ValueError):
+        decode_payload(encode_binary(DELTA)[:-3])
+    with pytest.raises(ValueError):
+        decode_binary(b"\x1f")
@@ -0,0 +1,55 @@
+import chess
+
+from common.binary import is_binary
+from common.position import position_hash
+from test_resume import start_game
+
+
+def test_position_hash_is_the_zobrist_key():
+    # The polyglot key of the starting position, from the polyglot book format
+    assert position_hash(chess.Board()) == "463b96181691fc9c"
+    board = chess.Board()
+    board.push_uci("e2e4")
+    assert position_hash(board) == "823c9b50fd114196"
+    # The same position reached by different move orders
+    first, second = chess.Board(), chess.Board()
+    for move in ("g1f3", "g8f6", "b1c3"):
+        first.push_uci(move)
+    for move in ("b1c3", "g8f6", "g1f3"):
+        second.push_uci(move)
+    assert position_hash(first) == position_hash(second)
+
+
+def test_deltas_replayed_on_a_board_match_the_server(connect):
+    white, black, _, _, _ = start_game(connect, delta_updates=True)
+    board = chess.Board()
+    for mover, move in ((white, "e2e4"), (black, "c7c5"), (white, "g1f3")):
+        mover.send({"type": "MOVE", "move": move})
+        # Both players get the delta, the mover included
+        deltas = [white.until("BOARD_DELTA"), black.until("BOARD_DELTA")]
+        board.push_uci(move)
+        for delta in deltas:
+            assert "board" not in delta
+            assert delta["move"] == move
+            assert delta["ply"] == board.ply()
+            assert delta["hash"] == position_hash(board)
+
+
+def test_deltas_go_binary_to_clients_that_negotiated_it(connect):
+    white = connect()
+    white.send({"type": "HELLO", "encodings": ["binary", "json"]})
+    assert white.until("HELLO")["encoding"] == "binary"
+    white.send({"type": "CREATE_GAME", "player_name": "White", "player_id": "w", "delta_updates": True})
+    game_id = white.until("GAME_CREATED")["game_id"]
+    black = connect()
+    black.send({"type": "JOIN_GAME", "player_name": "Black", "player_id": "b", "game_id": game_id})
+    black.until("GAME_START")
+    white.until("GAME_START")
+
+    white.send({"type": "MOVE", "move": "e2e4"})
+    black.until("BOARD_UPDATE")
+    while True:
+        payload = white.reader.read_payload()
+        if is_binary(payload):
+            break
+    assert payload[0] == 0x02  # BOARD_DELTA_TAG
@@ -0,0 +1,92 @@
+import pytest
+
+from server.clock import MAX_LAG_COMPENSATION, GameClock, TimeControl
+
+
+def started(time_control, at=100.0):
+    clock = GameClock(time_control)
+    clock.start("white", now=at)
+    return clock
+
+
+def test_parse_notation():
+    blitz = TimeControl.parse("5+3")
+    assert (blitz.base, blitz.increment, blitz.delay) == (300.0, 3.0, 0.0)
+    delayed = TimeControl.parse("5d2")
+    assert (delayed.base, delayed.increment, delayed.delay) == (300.0, 0.0, 2.0)
+    assert TimeControl.parse(" 1.5 ").base == 90.0
+    assert str(blitz) == "5+3" and str(delayed) == "5d2"
+
+
+def test_parse_seconds_and_dict():
+    assert TimeControl.parse(600).base == 600.0
+    control = TimeControl.parse({"base": 180, "increment": 2})
+    assert (control.base, control.increment) == (180.0, 2.0)
+    assert TimeControl.parse(control) is control
+
+
+@pytest.mark.parametrize("spec", ["5+", "5x3", "", True, None, {"increment": 2}, 0, -5,
+                                  {"base": 60, "increment": 1, "delay": 1}, "5+-3"])
+def test_parse_rejects_bad_specs(spec):
+    with pytest.raises(ValueError):
+        TimeControl.parse(spec)
+
+
+def test_press_charges_the_mover_and_starts_the_opponent():
+    clock = started(TimeControl(60))
+    assert clock.press(now=104.0) == 4.0
+    assert clock.running == "black"
+    assert clock.snapshot(now=106.0) == {"white": 56.0, "black": 58.0}
+    assert clock.think_times == [4.0]
+
+
+def test_increment_is_added_after_the_move():
+    clock = started(TimeControl(60, increment=3))
+    clock.press(now=110.0)
+    assert clock.time_left("white") == 53.0
+
+
+def test_delay_is_not_charged():
+    clock = started(TimeControl(60, delay=2))
+    assert clock.time_left("white", now=101.5) == 60.0
+    assert clock.time_left("white", now=105.0) == 57.0
+    clock.press(now=101.0)
+    assert clock.remaining["white"] == 60.0
+
+
+def test_lag_compensation_is_capped():
+    clock = started(TimeControl(60))
+    assert clock.press(lag=0.5, now=103.0) == 2.5
+    assert clock.press(lag=10.0, now=106.0) == 3.0 - MAX_LAG_COMPENSATION
+    assert clock.remaining == {"white": 57.5, "black": 58.0}
+
+
+def test_lag_never_refunds_more_than_the_move_took():
+    clock = started(TimeControl(60))
+    assert clock.press(lag=MAX_LAG_COMPENSATION, now=100.25) == 0.0
+    assert clock.remaining["white"] == 60.0
+
+
+def test_flagged_and_time_to_flag():
+    clock = started(TimeControl(10))
+    assert clock.time_to_flag(now=104.0) == 6.0
+    assert not clock.flagged(now=109.5)
+    assert clock.flagged(now=110.0)
+    # A move in transit when the flag fell is excused up to the lag allowance
+    assert not clock.flagged(now=110.5, lag=1.0)
+    assert clock.time_left("white", now=120.0) == 0.0
+
+
+def test_time_to_flag_includes_the_delay():
+    clock = started(TimeControl(10, delay=2))
+    assert clock.time_to_flag(now=101.0) == 11.0
+    assert clock.time_to_flag(now=105.0) == 7.0
+    assert clock.flagged(now=112.0)
+
+
+def test_stopped_clock_does_not_run():
+    clock = started(TimeControl(60))
+    clock.stop(now=105.0)
+    assert clock.running is None
+    assert clock.time_to_flag() is None and not clock.flagged()
+    assert clock.snapshot(now=500.0) == {"white": 55.0, "black": 60.0}
@@ -0,0 +1,108 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from conftest import SERVER_TIMEOUT, Client, free_port
+from server.cluster import DIRECT_PORT_OFFSET, Shard, shard_for
+from server.journal import JournalStore
+from server.utils import configure_store
+from simple_server import SimpleServer, create_server
+
+GAME_IDS = [f"G{number:05d}" for number in range(3000)]
+
+
+def owned_by(index, shards):
+    return next(game_id for game_id in GAME_IDS if shard_for(game_id, shards) == index)
+
+
+def test_games_spread_evenly():
+    counts = [0] * 4
+    for game_id in GAME_IDS:
+        counts[shard_for(game_id, 4)] += 1
+    assert all(600 < count < 900 for count in counts)
+    assert shard_for("ABC234", 1) == 0
+    with pytest.raises(ValueError):
+        Shard(2, 2, 5000)
+
+
+def test_foreign_games_are_redirected_to_their_owner():
+    shard = Shard(0, 3, 5000)
+    own, foreign = owned_by(0, 3), owned_by(2, 3)
+    for message_type in ("JOIN_GAME", "SPECTATE", "REJOIN_GAME", "RESUME"):
+        assert shard.redirect_for({"type": message_type, "game_id": own}) is None
+        assert shard.redirect_for({"type": message_type, "game_id": foreign}) == \
+            {"type": "REDIRECT", "game_id": foreign, "port": 5000 + DIRECT_PORT_OFFSET + 2}
+    # Lobby requests and malformed IDs are answered where they land
+    assert shard.redirect_for({"type": "GET_GAMES", "game_id": foreign}) is None
+    assert shard.redirect_for({"type": "JOIN_GAME", "game_id": 42}) is None
+    assert Shard(0, 3, 5000, "chess.example")\
+        .redirect_for({"type": "SPECTATE", "game_id": foreign})["host"] == "chess.example"
+
+
+def test_workers_only_create_games_in_their_shard():
+    server = SimpleServer(Shard(1, 3, 5000))
+    try:
+        assert all(shard_for(server.new_game_id(), 3) == 1 for _ in range(50))
+        assert server.is_free_game_id(owned_by(1, 3))
+        assert not server.is_free_game_id(owned_by(0, 3))
+    finally:
+        server.server_socket.close()
+
+
+def wait_for_port(port):
+    deadline = time.monotonic() + SERVER_TIMEOUT
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=SERVER_TIMEOUT).close()
+            return port
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def free_ports(count):
+    """The first of `count` consecutive free ports"""
+    while True:
+        port = free_port()
+        try:
+            for offset in range(1, count):
+                with socket.socket() as sock:
+                    sock.bind(("127.0.0.1", port + offset))
+            return port
+        except OSError:
+            continue
+
+
+@pytest.fixture(scope="module")
+def workers(tmp_path_factory):
+    """Direct ports of two threaded workers sharing a public port"""
+    configure_store(JournalStore(str(tmp_path_factory.mktemp("journal")), fsync_policy="never"))
+    port = free_ports(1 + DIRECT_PORT_OFFSET + 2)
+    shards = [Shard(index, 2, port) for index in range(2)]
+    for shard in shards:
+        threading.Thread(target=create_server("threads", shard, port).start, daemon=True).start()
+    return [wait_for_port(shard.direct_port()) for shard in shards]
+
+
+def test_join_on_the_wrong_worker_is_redirected(workers):
+    white = Client(workers[0])
+    white.send({"type": "CREATE_GAME", "player_name": "White", "player_id": "cw", "time_limit": 60})
+    game_id = white.until("GAME_CREATED")["game_id"]
+    assert shard_for(game_id, 2) == 0
+
+    black = Client(workers[1])
+    black.send({"type": "JOIN_GAME", "player_name": "Black", "player_id": "cb", "game_id": game_id})
+    redirect = black.until("REDIRECT")
+    assert redirect["game_id"] == game_id and redirect["port"] == workers[0]
+    black.close()
+
+    # Repeating the request on the owner joins the game
+    black = Client(redirect["port"])
+    black.send({"type": "JOIN_GAME", "player_name": "Black", "player_id": "cb", "game_id": game_id})
+    black.until("GAME_JOINED")
+    white.until("GAME_START")
+    white.close()
+    black.close()
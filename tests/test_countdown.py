@@ -0,0 +1,49 @@
+from common.countdown import Countdown
+
+
+def reading(white, black, server_time, **fields):
+    return {"white_time": white, "black_time": black, "server_time": server_time, **fields}
+
+
+def test_only_the_player_on_move_counts_down():
+    clocks = Countdown()
+    clocks.update(reading(120.0, 90.0, 1000.0), now=50.0)
+    assert clocks.time_left("white", "white", now=57.5) == 112.5
+    assert clocks.time_left("black", "white", now=57.5) == 90.0
+    # Never below zero, however late the next reading is
+    assert clocks.time_left("white", "white", now=500.0) == 0
+
+
+def test_new_reading_restarts_the_countdown():
+    clocks = Countdown()
+    clocks.update(reading(120.0, 90.0, 1000.0), now=50.0)
+    clocks.update(reading(110.0, 90.0, 1010.0), now=60.0)
+    assert clocks.time_left("black", "black", now=64.0) == 86.0
+    assert clocks.time_left("white", "black", now=64.0) == 110.0
+
+
+def test_overtaken_readings_are_ignored():
+    clocks = Countdown()
+    assert clocks.update(reading(110.0, 90.0, 1010.0), now=60.0)
+    assert not clocks.update(reading(120.0, 95.0, 1000.0), now=61.0)
+    assert clocks.time_left("white", "white", now=60.0) == 110.0
+    # Readings without server_time are always taken
+    assert clocks.update({"white_time": 100.0}, now=62.0)
+    assert clocks.white_time == 100.0 and clocks.black_time == 90.0
+
+
+def test_paused_clocks_hold():
+    clocks = Countdown(60)
+    assert clocks.time_left("white", "white", now=clocks.read_at + 30) == 60
+    clocks.update(reading(45.0, 50.0, 1000.0, clock_paused=True), now=10.0)
+    assert clocks.time_left("white", "white", now=100.0) == 45.0
+
+
+def test_stop_freezes_the_clocks_where_they_are():
+    clocks = Countdown()
+    clocks.update(reading(30.0, 40.0, 1000.0), now=0.0)
+    clocks.stop("black", now=15.0)
+    assert (clocks.white_time, clocks.black_time) == (30.0, 25.0)
+    assert clocks.time_left("black", "black", now=100.0) == 25.0
+    clocks.reset(300)
+    assert clocks.time_left("white", None) == clocks.time_left("black", None) == 300
@@ -0,0 +1,75 @@
+import asyncio
+import json
+import socket
+
+import pytest
+
+from common.framing import (HEADER, MAX_FRAME_SIZE, FrameDecoder, FrameError, FrameReader, encode_frame,
+                            encode_message, read_message_async)
+from common.message import Message
+
+
+def test_frame_is_length_prefixed_json():
+    frame = encode_message({"type": "MOVE", "move": "e2e4"})
+    (length,) = HEADER.unpack_from(frame)
+    assert length == len(frame) - HEADER.size
+    assert json.loads(frame[HEADER.size:]) == {"type": "MOVE", "move": "e2e4"}
+
+
+def test_message_objects_are_framed_as_their_json():
+    frame = encode_message(Message("CHAT", {"text": "hi"}))
+    assert json.loads(frame[HEADER.size:]) == {"type": "CHAT", "data": {"text": "hi"}}
+
+
+def test_decoder_reassembles_frames_split_across_chunks():
+    messages = [{"type": "MOVE", "move": "e2e4"}, {"type": "CHAT", "text": "x" * 1000}, {"type": "PING"}]
+    stream = b"".join(encode_message(message) for message in messages)
+    decoder = FrameDecoder()
+    received = []
+    for start in range(0, len(stream), 7):
+        received.extend(decoder.feed_messages(stream[start:start + 7]))
+    assert received == messages
+    assert not decoder.has_partial_frame()
+
+
+def test_decoder_returns_every_frame_of_one_chunk():
+    stream = encode_message({"type": "PING"}) * 3 + encode_message({"type": "PONG"})[:5]
+    decoder = FrameDecoder()
+    assert decoder.feed_messages(stream) == [{"type": "PING"}] * 3
+    assert decoder.has_partial_frame()
+
+
+def test_oversized_frames_are_rejected():
+    with pytest.raises(FrameError):
+        encode_frame(b"x" * (MAX_FRAME_SIZE + 1))
+    with pytest.raises(FrameError):
+        FrameDecoder().feed(HEADER.pack(MAX_FRAME_SIZE + 1))
+
+
+def test_reader_reads_messages_until_the_peer_closes():
+    ours, theirs = socket.socketpair()
+    with ours, theirs:
+        theirs.sendall(encode_message({"type": "PING"}) + encode_message({"type": "PONG"}))
+        theirs.close()
+        reader = FrameReader(ours)
+        assert reader.read_message() == {"type": "PING"}
+        assert reader.read_message() == {"type": "PONG"}
+        assert reader.read_message() is None
+
+
+def test_async_reader_matches_the_blocking_one():
+    async def read_all(data):
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        messages = []
+        while True:
+            message = await read_message_async(reader)
+            if message is None:
+                return messages
+            messages.append(message)
+
+    data = encode_message({"type": "MOVE", "move": "g1f3"}) + encode_message({"type": "PING"})
+    assert asyncio.run(read_all(data)) == [{"type": "MOVE", "move": "g1f3"}, {"type": "PING"}]
+    with pytest.raises(FrameError):
+        asyncio.run(read_all(data[:2]))
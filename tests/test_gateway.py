@@ -0,0 +1,164 @@
+import asyncio
+import socket
+import threading
+import time
+
+import pytest
+
+from conftest import SERVER_TIMEOUT, Client, free_port
+from gateway import Gateway, HashRing
+from server.journal import JournalStore
+from server.utils import configure_store
+from simple_server import create_server
+
+NODES = [("10.0.0.1", 1), ("10.0.0.2", 1), ("10.0.0.3", 1)]
+KEYS = [f"game-{number}" for number in range(2000)]
+
+
+def owners(ring):
+    return {key: ring.node_for(key) for key in KEYS}
+
+
+def test_adding_a_node_only_takes_keys_for_itself():
+    before = owners(HashRing(NODES[:2]))
+    after = owners(HashRing(NODES))
+    moved = [key for key in KEYS if before[key] != after[key]]
+    assert moved and all(after[key] == NODES[2] for key in moved)
+    # Roughly its fair share
+    assert 0.2 < len(moved) / len(KEYS) < 0.5
+
+
+def test_removing_a_node_only_moves_its_own_keys():
+    ring = HashRing(NODES)
+    before = owners(ring)
+    ring.remove(NODES[1])
+    after = owners(ring)
+    for key in KEYS:
+        if before[key] != NODES[1]:
+            assert after[key] == before[key]
+        else:
+            assert after[key] in (NODES[0], NODES[2])
+    assert HashRing().node_for("anything") is None
+
+
+def test_rebalance_pins_live_games_where_they_are():
+    gateway = Gateway(NODES)
+    gateway.rebalance(set(NODES[:2]))
+    games = {node: [key for key in KEYS[:300] if gateway.ring.node_for(key) == node] for node in NODES[:2]}
+    gateway.node_games.update({node: [{"game_id": key} for key in keys] for node, keys in games.items()})
+
+    # The new node takes over arcs of the ring, but not the games being played there
+    gateway.rebalance(set(NODES))
+    moved = {key for key in KEYS[:300] if gateway.ring.node_for(key) == NODES[2]}
+    assert moved and set(gateway.pins) == moved
+    for node in NODES[:2]:
+        assert all(gateway.node_for(key) == node for key in games[node])
+    assert gateway.node_for("new-game") == gateway.ring.node_for("new-game")
+
+    # Pins go once their games are no longer listed
+    gateway.node_games = {node: [] for node in NODES}
+    gateway.prune_pins(time.monotonic())
+    assert not gateway.pins
+
+
+def wait_for_port(port):
+    deadline = time.monotonic() + SERVER_TIMEOUT
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=SERVER_TIMEOUT).close()
+            return port
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+@pytest.fixture(scope="module")
+def gateway_port(tmp_path_factory):
+    """A Gateway in front of two threaded SimpleServer nodes"""
+    configure_store(JournalStore(str(tmp_path_factory.mktemp("journal")), fsync_policy="never"))
+    nodes = []
+    for _ in range(2):
+        port = free_port()
+        threading.Thread(target=create_server("threads", port=port).start, daemon=True).start()
+        nodes.append(("127.0.0.1", wait_for_port(port)))
+    port = free_port()
+    gateway = Gateway(nodes, host="127.0.0.1", port=port)
+    threading.Thread(target=asyncio.run, args=(gateway.serve(),), daemon=True).start()
+    return wait_for_port(port)
+
+
+@pytest.fixture
+def gateway_client(gateway_port):
+    clients = []
+
+    def connect():
+        client = Client(gateway_port)
+        clients.append(client)
+        return client
+
+    yield connect
+    for client in clients:
+        client.close()
+
+
+def create_games(gateway_client, count, prefix):
+    game_ids = []
+    for number in range(count):
+        creator = gateway_client()
+        creator.send({"type": "CREATE_GAME", "player_name": f"{prefix}{number}", "player_id": f"{prefix}{number}",
+                      "time_limit": 60})
+        game_ids.append(creator.until("GAME_CREATED")["game_id"])
+    return game_ids
+
+
+def test_pages_cover_every_node(gateway_client):
+    created = create_games(gateway_client, 6, "page")
+    seen = []
+    cursor = None
+    for _ in range(10):
+        client = gateway_client()
+        client.send({"type": "GET_GAMES", "status": "waiting", "limit": 4, **({"cursor": cursor} if cursor else {})})
+        page = client.until("GAME_LIST")
+        assert len(page["games"]) <= 4
+        assert all(isinstance(game, dict) for game in page["games"])
+        seen.extend(game["game_id"] for game in page["games"])
+        cursor = page["cursor"]
+        if cursor is None:
+            break
+    assert set(created) <= set(seen) and len(seen) == len(set(seen)) == page["total"]
+    times = [game["created_at"] for game in page["games"]]
+    assert times == sorted(times, reverse=True)
+
+
+def test_bad_page_request_gets_the_nodes_error(gateway_client):
+    client = gateway_client()
+    client.send({"type": "GET_GAMES", "order": "sideways"})
+    assert "Bad GET_GAMES" in client.until("ERROR")["message"]
+
+
+def test_subscriber_gets_diffs_from_every_node(gateway_client):
+    watcher = gateway_client()
+    watcher.send({"type": "GET_GAMES", "subscribe": True, "limit": 5})
+    first = watcher.until("GAME_LIST")
+    assert "version" in first and len(first["games"]) <= 5
+    created = set(create_games(gateway_client, 4, "watch"))
+    added = set()
+    while not created <= added:
+        diff = watcher.until("LOBBY_DIFF")
+        assert diff["version"] > first["version"]
+        added.update(game["game_id"] for game in diff["added"])
+    # Further pages on the same connection
+    watcher.send({"type": "GET_GAMES", "limit": 2})
+    assert len(watcher.until("GAME_LIST")["games"]) == 2
+
+
+def test_lobby_players_get_the_same_game_list(gateway_client):
+    created = create_games(gateway_client, 2, "lobby")
+    player = gateway_client()
+    player.send({"type": "JOIN_LOBBY", "player_name": "lobby-player", "player_id": "lobby-player"})
+    player.until("WAITING")
+    player.send({"type": "GET_GAMES"})
+    games = player.until("GAME_LIST")["games"]
+    assert set(created) <= {game["game_id"] for game in games}
+    assert all(game["status"] == "waiting" for game in games)
@@ -0,0 +1,134 @@
+import threading
+import time
+
+from server.heartbeat import Heartbeat
+from server.metrics import Metrics
+from server.scheduler import TimerHandle
+
+
+class FakeScheduler:
+    """Scheduler interface on a manual clock; advance() fires due timers in order"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.timers = []
+
+    def time(self):
+        return self.now
+
+    def call_at(self, when, callback, *args):
+        handle = TimerHandle(when, callback, args)
+        self.timers.append(handle)
+        return handle
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self.now + delay, callback, *args)
+
+    def pending(self):
+        return [handle for handle in self.timers if not handle.cancelled]
+
+    def advance(self, seconds):
+        self.now += seconds
+        while True:
+            due = [handle for handle in self.pending() if handle.when <= self.now]
+            if not due:
+                return
+            handle = min(due, key=lambda handle: handle.when)
+            handle.cancelled = True
+            handle.run()
+
+
+def heartbeat(scheduler, pings, dead):
+    return Heartbeat(scheduler, pings.append, lambda: dead.append(scheduler.now),
+                     interval=10, timeout=5, metrics=Metrics())
+
+
+def test_silent_peer_is_pinged_then_declared_dead():
+    scheduler = FakeScheduler()
+    pings, dead = [], []
+    beat = heartbeat(scheduler, pings, dead)
+    scheduler.advance(10)
+    assert pings == [1] and dead == []
+    scheduler.advance(5)
+    assert dead == [15]
+    assert scheduler.pending() == []
+    assert beat.metrics.snapshot()["counters"]["heartbeat.dead"] == 1
+
+
+def test_activity_postpones_the_ping():
+    scheduler = FakeScheduler()
+    pings, dead = [], []
+    beat = heartbeat(scheduler, pings, dead)
+    scheduler.advance(6)
+    beat.touch()
+    scheduler.advance(4)
+    assert pings == []
+    scheduler.advance(6)
+    assert pings == [1]
+
+
+def test_pong_keeps_the_peer_alive_and_samples_rtt():
+    scheduler = FakeScheduler()
+    pings, dead = [], []
+    beat = heartbeat(scheduler, pings, dead)
+    scheduler.advance(10)
+    scheduler.now += 0.2
+    beat.pong(pings[-1])
+    assert round(beat.rtt, 3) == 0.2 and beat.srtt == beat.rtt
+    scheduler.advance(5)
+    assert dead == []
+    # A stale or unknown PONG still counts as activity but not as a sample
+    scheduler.advance(5)
+    assert pings == [1, 2]
+    beat.pong(99)
+    assert round(beat.rtt, 3) == 0.2 and beat.ping_id == 2
+    scheduler.advance(5)
+    assert dead == []
+
+
+def test_sample_every_pings_an_active_peer():
+    scheduler = FakeScheduler()
+    pings, dead = [], []
+    beat = heartbeat(scheduler, pings, dead)
+    beat.sample_every(5)
+    assert len(scheduler.pending()) == 1
+    for _ in range(3):
+        scheduler.advance(0)
+        beat.pong(pings[-1])
+        scheduler.advance(5)
+    assert pings == [1, 2, 3, 4] and dead == []
+
+
+def test_cancel_stops_the_heartbeat():
+    scheduler = FakeScheduler()
+    pings, dead = [], []
+    beat = heartbeat(scheduler, pings, dead)
+    beat.cancel()
+    beat.sample_every(1)
+    scheduler.advance(100)
+    assert pings == [] and dead == [] and scheduler.pending() == []
+
+
+def test_cancel_during_check_is_not_undone():
+    # check() runs on the scheduler thread; cancel() from another thread
+    # while it decides to re-arm must still leave no timer behind
+    class SlowClock(FakeScheduler):
+        def time(self):
+            if checking.is_set():
+                in_check.set()
+                time.sleep(0.05)
+            return self.now
+
+    scheduler = SlowClock()
+    checking = threading.Event()
+    in_check = threading.Event()
+    pings, dead = [], []
+    beat = heartbeat(scheduler, pings, dead)
+    checking.set()
+    check = threading.Thread(target=scheduler.advance, args=(10,))
+    check.start()
+    assert in_check.wait(2)
+    checking.clear()
+    beat.cancel()
+    check.join()
+    assert scheduler.pending() == []
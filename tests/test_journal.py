@@ -0,0 +1,97 @@
+import os
+
+import chess
+
+from server.journal import JOURNAL_DIR, JournalStore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MOVES = ["e2e4", "e7e5", "g1f3", "b8c6", "f1b5", "a7a6", "b5a4", "g8f6", "e1g1", "f8e7"]
+
+
+def state_after(board, clocks=None):
+    return {
+        "board": board.fen(),
+        "current_player": "white" if board.turn else "black",
+        "game_over": board.is_game_over(),
+        "clocks": clocks or {"white": 300.0, "black": 300.0},
+    }
+
+
+def play(store, game_id, moves):
+    """Save a new game and journal its moves; returns the board they lead to"""
+    board = chess.Board()
+    store.save_state(game_id, state_after(board))
+    for number, move in enumerate(moves):
+        board.push_uci(move)
+        store.record_move(game_id, move, state_after(board, {"white": 300.0 - number, "black": 299.0 - number}))
+    return board
+
+
+def test_moves_replay_onto_the_snapshot(tmp_path):
+    store = JournalStore(str(tmp_path), fsync_policy="never", snapshot_every=4)
+    board = play(store, "G1", MOVES)
+    store.journal("G1").close()
+
+    state, loaded = JournalStore(str(tmp_path)).load_game("G1")
+    assert loaded.fen() == board.fen()
+    assert state["ply"] == len(MOVES)
+    assert state["current_player"] == "white"
+    assert state["clocks"] == {"white": 291.0, "black": 290.0}
+    # Moves after the last snapshot are on the move stack
+    assert [move.uci() for move in loaded.move_stack] == MOVES[8:]
+
+
+def test_loading_without_replay_starts_from_the_last_position(tmp_path):
+    store = JournalStore(str(tmp_path), fsync_policy="never", snapshot_every=4)
+    board = play(store, "G1", MOVES)
+    store.journal("G1").close()
+
+    state, loaded = JournalStore(str(tmp_path)).load_game("G1", replay=False)
+    assert loaded.fen() == board.fen() and not loaded.move_stack
+    assert state["ply"] == len(MOVES) and state["clocks"] == {"white": 291.0, "black": 290.0}
+
+
+def test_a_torn_last_record_is_skipped(tmp_path):
+    store = JournalStore(str(tmp_path), fsync_policy="never", snapshot_every=100)
+    play(store, "G2", MOVES[:3])
+    store.journal("G2").close()
+    with open(os.path.join(str(tmp_path), "G2.log"), "a", encoding="utf-8") as f:
+        f.write('{"ply":4,"mo')
+
+    state, board = JournalStore(str(tmp_path)).load_game("G2")
+    assert state["ply"] == 3
+    assert [move.uci() for move in board.move_stack] == MOVES[:3]
+
+
+def test_batches_are_applied_in_order(tmp_path):
+    store = JournalStore(str(tmp_path), fsync_policy="never")
+    board = chess.Board()
+    events = [("state", "G3", (state_after(board),))]
+    for move in MOVES[:4]:
+        board.push_uci(move)
+        events.append(("move", "G3", (move, state_after(board))))
+    events.append(("state", "G4", (state_after(chess.Board()),)))
+    events.append(("finish", "G4", ("white",)))
+    store.write_batch(events)
+    store.journal("G3").close()
+
+    assert store.load_state("G3")["board"] == board.fen()
+    assert sorted(JournalStore(str(tmp_path)).active_game_ids()) == ["G3"]
+
+
+def test_open_files_are_bounded(tmp_path):
+    store = JournalStore(str(tmp_path), fsync_policy="never", max_open=3)
+    boards = {f"G{number}": play(store, f"G{number}", MOVES[:2]) for number in range(10)}
+    assert sum(journal.file is not None for journal in store.journals.values()) == 3
+    # Closed journals reopen on their next move
+    boards["G0"].push_uci("g1f3")
+    store.record_move("G0", "g1f3", state_after(boards["G0"]))
+    for journal in store.journals.values():
+        journal.close()
+    for game_id, board in boards.items():
+        assert store.load_state(game_id)["board"] == board.fen()
+
+
+def test_default_directory_is_outside_the_source_tree():
+    assert not os.path.abspath(JOURNAL_DIR).startswith(ROOT + os.sep)
@@ -0,0 +1,70 @@
+from server.outbound import (CHAT_LANE, CLOCK_LANE, CONTROL_LANE, LANES, STATE_LANE, OutboundQueue,
+                             message_lane)
+
+
+def push(queue, kind, data=None):
+    return queue.push(data or kind.encode(), kind, message_lane(kind))
+
+
+def test_message_types_map_to_their_lanes():
+    assert message_lane("BOARD_UPDATE") == STATE_LANE
+    assert message_lane("BOARD_DELTA") == STATE_LANE
+    assert message_lane("GAME_OVER") == STATE_LANE
+    assert message_lane("CHAT") == CHAT_LANE
+    assert message_lane("TIME_UPDATE") == CLOCK_LANE
+    assert message_lane("SPECTATOR_JOINED") == CONTROL_LANE
+
+
+def test_game_progress_shares_the_state_lane():
+    # A client reads these as steps of one game; none may overtake another
+    for kind in ("WAITING", "OPPONENT_JOINED", "GAME_START", "MATCH_FOUND", "ERROR",
+                 "OPPONENT_DISCONNECTED", "OPPONENT_RECONNECTED", "RESUME_REJECTED"):
+        assert message_lane(kind) == STATE_LANE, kind
+
+
+def test_lanes_are_written_in_priority_order():
+    queue = OutboundQueue(lanes=LANES)
+    push(queue, "CHAT", b"chat 1")
+    push(queue, "SPECTATOR_JOINED")
+    push(queue, "CHAT", b"chat 2")
+    push(queue, "BOARD_DELTA")
+    assert queue.pop_all() == [b"BOARD_DELTA", b"SPECTATOR_JOINED", b"chat 1", b"chat 2"]
+
+
+def test_time_update_replaces_a_queued_tick():
+    queue = OutboundQueue(lanes=LANES)
+    push(queue, "TIME_UPDATE", b"tick 1")
+    push(queue, "CHAT")
+    push(queue, "TIME_UPDATE", b"tick 2")
+    assert queue.superseded == 1
+    assert queue.pop_all() == [b"CHAT", b"tick 2"]
+
+
+def test_board_updates_drop_queued_ticks():
+    queue = OutboundQueue(lanes=LANES)
+    push(queue, "TIME_UPDATE", b"tick")
+    push(queue, "BOARD_DELTA", b"delta 1")
+    push(queue, "TIME_UPDATE", b"tick")
+    push(queue, "BOARD_UPDATE", b"board")
+    # Deltas build on each other, so a newer one never drops an older one
+    push(queue, "BOARD_DELTA", b"delta 2")
+    assert queue.superseded == 2
+    assert queue.pop_all() == [b"delta 1", b"board", b"delta 2"]
+    assert queue.backlog_bytes() == len(b"delta 1board" + b"delta 2")
+
+
+def test_batch_limit_lets_a_later_move_overtake():
+    queue = OutboundQueue(lanes=LANES)
+    for number in range(4):
+        push(queue, "CHAT", b"%d" % number * 10)
+    assert queue.pop_all(max_bytes=25) == [b"0" * 10, b"1" * 10]
+    push(queue, "BOARD_DELTA", b"move")
+    assert queue.pop_all(max_bytes=20) == [b"move", b"2" * 10]
+
+
+def test_batch_limit_takes_at_least_one_frame():
+    queue = OutboundQueue(lanes=LANES)
+    push(queue, "BOARD_UPDATE", b"x" * 100)
+    push(queue, "CHAT", b"y")
+    assert queue.pop_all(max_bytes=10) == [b"x" * 100]
+    assert len(queue) == 1
@@ -0,0 +1,122 @@
+import pytest
+
+from server.lobby_index import MAX_PAGE_SIZE, LobbyIndex, merge_pages
+
+
+class ManualTimers:
+    """call_later for a LobbyIndex whose timers the test fires itself"""
+
+    def __init__(self):
+        self.pending = []
+
+    def __call__(self, delay, callback):
+        self.pending.append(callback)
+        return callback  # Stands in for the scheduler's handle
+
+    def fire(self):
+        callbacks, self.pending = self.pending, []
+        for callback in callbacks:
+            callback()
+
+
+def entry(game_id, status="waiting", created_at=0.0, spectators=0):
+    return {"game_id": game_id, "status": status, "spectator_count": spectators,
+            "players": {"white": game_id.lower()}, "created_at": created_at}
+
+
+def test_pages_follow_their_cursor_without_gaps():
+    index = LobbyIndex(ManualTimers())
+    for number in range(25):
+        index.update(entry(f"G{number:02}", "waiting" if number % 2 else "playing", created_at=float(number)))
+    seen = []
+    cursor = None
+    while True:
+        games, cursor, total, _ = index.page(cursor=cursor, limit=10)
+        seen.extend(game["game_id"] for game in games)
+        if cursor is None:
+            break
+    assert total == 25
+    assert seen == [f"G{number:02}" for number in reversed(range(25))]
+    games, _, total, _ = index.page(status="waiting", limit=MAX_PAGE_SIZE + 1)
+    assert total == 12 and all(game["status"] == "waiting" for game in games)
+
+
+def test_popular_order_puts_most_watched_first():
+    index = LobbyIndex(ManualTimers())
+    index.update(entry("QUIET", "playing", created_at=2.0, spectators=1))
+    index.update(entry("BUSY", "playing", created_at=1.0, spectators=40))
+    index.update(entry("BUSY", "playing", created_at=1.0, spectators=2))
+    index.update(entry("NEW", "playing", created_at=3.0, spectators=2))
+    games, _, _, _ = index.page(order="popular")
+    assert [game["game_id"] for game in games] == ["NEW", "BUSY", "QUIET"]
+
+
+def test_bad_page_requests_raise_value_error():
+    index = LobbyIndex(ManualTimers())
+    for request in ({"status": "finished"}, {"order": "oldest"}, {"cursor": "abc"}):
+        with pytest.raises(ValueError):
+            index.page(**request)
+
+
+def test_subscribers_get_one_diff_per_interval():
+    timers = ManualTimers()
+    index = LobbyIndex(timers)
+    index.update(entry("OLD", created_at=1.0))
+    index.update(entry("GONE", created_at=2.0))
+    everything, waiting = [], []
+    index.subscribe(everything.append)
+    index.subscribe(waiting.append, status="waiting")
+
+    index.update(entry("NEW", created_at=3.0))
+    index.update(entry("OLD", "playing", created_at=1.0))
+    index.update(entry("OLD", "playing", created_at=1.0, spectators=3))
+    index.remove("GONE")
+    assert len(timers.pending) == 1 and everything == []
+    timers.fire()
+
+    assert len(everything) == 1
+    diff = everything[0]
+    assert diff["version"] == index.version
+    assert [game["game_id"] for game in diff["added"]] == ["NEW"]
+    assert diff["changed"] == [entry("OLD", "playing", created_at=1.0, spectators=3)]
+    assert diff["removed"] == ["GONE"]
+    # A game that stops waiting leaves a waiting-only subscriber's list
+    assert [game["game_id"] for game in waiting[0]["added"]] == ["NEW"]
+    assert sorted(waiting[0]["removed"]) == ["GONE", "OLD"]
+
+    timers.fire()
+    assert len(everything) == 1
+
+
+def test_finished_games_leave_the_index():
+    index = LobbyIndex(ManualTimers())
+    index.update(entry("DONE", "playing"))
+    version = index.version
+    index.update(entry("DONE", "finished"))
+    assert index.all() == [] and index.version == version + 1
+
+
+def as_reply(page):
+    games, cursor, total, version = page
+    return {"type": "GAME_LIST", "games": games, "cursor": cursor, "total": total, "version": version}
+
+
+@pytest.mark.parametrize("order", ["newest", "popular"])
+def test_merged_pages_of_several_servers_match_one_index(order):
+    indexes = [LobbyIndex(ManualTimers()) for _ in range(3)]
+    combined = LobbyIndex(ManualTimers())
+    for number in range(40):
+        game = entry(f"G{number:02}", created_at=float(number % 17), spectators=number % 5)
+        indexes[number * 7 % 3].update(game)
+        combined.update(game)
+    seen = []
+    cursor = None
+    while True:
+        merged = merge_pages([as_reply(index.page(None, order, cursor, 6)) for index in indexes], order, 6)
+        assert merged["total"] == 40 and len(merged["games"]) <= 6
+        seen.extend(game["game_id"] for game in merged["games"])
+        cursor = merged["cursor"]
+        if cursor is None:
+            break
+    assert seen == [game["game_id"] for game in combined.page(None, order, None, MAX_PAGE_SIZE)[0]]
+
@@ -0,0 +1,151 @@
+import threading
+
+import pytest
+
+from conftest import Client
+from server.journal import JournalStore
+from server.lobby import Lobby
+from server.matchmaking import BASE_WINDOW, DEFAULT_RATING, MAX_WINDOW, WIDEN_RATE, Matchmaker, parse_rating
+from server.server import ChessServer
+from server.utils import configure_store
+
+
+def queue(matchmaker, *players, time_control="5+0", now=0.0):
+    return [matchmaker.enqueue(player_id, rating, time_control, now=now) for player_id, rating in players]
+
+
+def test_newcomer_is_paired_with_the_closest_acceptable_player():
+    matchmaker = Matchmaker()
+    # In separate buckets; within one the longest-waiting acceptable player is taken
+    queue(matchmaker, ("far", 1460), ("near", 1510), ("other", 1900))
+    ticket = matchmaker.enqueue("new", 1500, "5+0", now=0.0)
+    assert matchmaker.find_opponent(ticket, now=0.0).player_id == "near"
+    assert "new" not in matchmaker and "near" not in matchmaker
+    assert len(matchmaker) == 2
+
+
+def test_only_equal_time_controls_meet():
+    matchmaker = Matchmaker()
+    queue(matchmaker, ("blitz", 1500), time_control="3+2")
+    ticket = matchmaker.enqueue("rapid", 1500, "10+0", now=0.0)
+    assert matchmaker.find_opponent(ticket, now=0.0) is None
+    assert matchmaker.match(now=1000.0) == []
+
+
+def test_windows_widen_with_waiting():
+    difference = BASE_WINDOW + 5 * WIDEN_RATE
+    matchmaker = Matchmaker()
+    low, high = queue(matchmaker, ("low", 1500), ("high", 1500 + difference))
+    assert matchmaker.find_opponent(high, now=0.0) is None
+    assert matchmaker.match(now=4.0) == []
+    assert matchmaker.match(now=5.0) == [(low, high)]
+    assert len(matchmaker) == 0
+
+
+def test_windows_stop_widening():
+    matchmaker = Matchmaker()
+    queue(matchmaker, ("low", 1000), ("high", 1000 + MAX_WINDOW + 1))
+    assert matchmaker.match(now=1e6) == []
+
+
+def test_match_pairs_neighbours_in_rating_order():
+    matchmaker = Matchmaker()
+    queue(matchmaker, ("a", 1200), ("b", 1700), ("c", 1230), ("d", 1690), ("e", 2600))
+    pairs = matchmaker.match(now=0.0)
+    assert {(first.player_id, second.player_id) for first, second in pairs} == {("a", "c"), ("d", "b")}
+    assert list(matchmaker.tickets) == ["e"]
+
+
+def test_cancel_only_removes_the_current_ticket():
+    matchmaker = Matchmaker()
+    old = matchmaker.enqueue("p", 1500, now=0.0)
+    new = matchmaker.enqueue("p", 1600, now=1.0)
+    assert matchmaker.cancel("p", old) is None
+    assert matchmaker.get("p") is new
+    assert matchmaker.cancel("p") is new
+    assert len(matchmaker) == 0 and matchmaker.queues == {} and matchmaker.buckets == {}
+
+
+@pytest.mark.parametrize("value", ["1500", True, -1, 10 ** 6])
+def test_unusable_ratings_are_rejected(value):
+    with pytest.raises(ValueError):
+        parse_rating(value)
+
+
+def test_rating_defaults():
+    assert parse_rating(None) == DEFAULT_RATING
+    assert parse_rating(1612.7) == 1612
+
+
+def test_lobby_seats_the_waiting_player_as_white():
+    lobby = Lobby()
+    assert lobby.add_player("first", "first-socket", 1500, (300.0, 0.0, 0.0)) is None
+    assert lobby.add_player("elsewhere", "elsewhere-socket", 1500, (60.0, 0.0, 0.0)) is None
+    game_id = lobby.add_player("second", "second-socket", 1520, (300.0, 0.0, 0.0))
+    assert list(lobby.get_game_players(game_id).items()) == [("first", "first-socket"), ("second", "second-socket")]
+    assert list(lobby.waiting_players) == ["elsewhere"]
+
+
+def join_lobby(connect, player_id, rating, time_limit):
+    client = connect()
+    client.send({"type": "JOIN_LOBBY", "player_name": player_id, "player_id": player_id, "rating": rating,
+                 "time_limit": time_limit})
+    return client
+
+
+def test_server_matches_lobby_players_on_the_same_time_control(connect):
+    first = join_lobby(connect, "mm-first", 1500, "3+2")
+    first.until("WAITING")
+    join_lobby(connect, "mm-other", 1500, "10+0").until("WAITING")
+    second = join_lobby(connect, "mm-second", 1510, {"base": 180, "increment": 2})
+    found = [first.until("MATCH_FOUND"), second.until("MATCH_FOUND")]
+    assert found[0]["game_id"] == found[1]["game_id"]
+    assert sorted(match["color"] for match in found) == ["black", "white"]
+    assert found[0]["time_control"] == {"base": 180.0, "increment": 2.0, "delay": 0.0}
+    first.until("GAME_START")
+    second.until("GAME_START")
+
+
+def test_server_rejects_an_invalid_time_control(connect):
+    client = join_lobby(connect, "mm-invalid", 1500, "fast")
+    assert client.until("ERROR")
+
+
+@pytest.fixture
+def chess_server(tmp_path):
+    """A ChessServer on free ports, persisting to a temporary directory"""
+    configure_store(JournalStore(str(tmp_path), fsync_policy="never"))
+    server = ChessServer(host="127.0.0.1", port=0, chat_port=0)
+    server.bind()
+    threading.Thread(target=server.serve, daemon=True).start()
+    yield server
+    server.server_socket.close()
+    server.chat_socket.close()
+
+
+def join_chess_lobby(chess_server, player_id, time_limit):
+    client = Client(chess_server.port)
+    client.send({"type": "JOIN_LOBBY", "data": {"player_id": player_id, "rating": 1500, "time_limit": time_limit}})
+    return client
+
+
+def test_chess_server_plays_on_the_matched_time_control(chess_server):
+    first = join_chess_lobby(chess_server, "cs-first", "3+2")
+    first.until("WAITING")
+    other = join_chess_lobby(chess_server, "cs-other", "10+0")
+    other.until("WAITING")
+    second = join_chess_lobby(chess_server, "cs-second", {"base": 180, "increment": 2})
+    try:
+        start = first.until("GAME_START")["data"]
+        assert second.until("GAME_START")["data"]["game_id"] == start["game_id"]
+        assert start["time_control"] == {"base": 180.0, "increment": 2.0, "delay": 0.0}
+        game = chess_server.games[start["game_id"]]
+        assert game.clock.time_control.increment == 2.0
+        white = first if start["color"] == "white" else second
+        white.send({"type": "MOVE", "data": {"move": "e2e4"}})
+        clocks = white.until("GAME_UPDATE")["data"]["clocks"]
+        # The increment is added to white's clock once the move is made
+        assert 180.0 < clocks["white"] <= 182.0 and clocks["black"] <= 180.0
+    finally:
+        for client in (first, other, second):
+            client.close()
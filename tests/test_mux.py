@@ -0,0 +1,108 @@
+import socket
+
+import pytest
+
+from common.framing import FrameDecoder, HEADER
+from common.message import Message
+from common.mux import (CHANNEL_LANES, CHAT, CONTROL, GAME, channel_for, decode_channel_payload,
+                        encode_channel_frame, is_channel_payload)
+from server.outbound import CHAT_LANE, CONTROL_LANE, STATE_LANE, MessageConnection
+
+
+def test_messages_travel_on_their_channel():
+    assert channel_for("MOVE") == GAME
+    assert channel_for("GAME_UPDATE") == GAME
+    assert channel_for("CHAT") == CHAT
+    assert channel_for("PING") == CONTROL
+    assert channel_for("JOIN_LOBBY") == CONTROL
+
+
+def test_channel_frames_round_trip():
+    frame = encode_channel_frame(Message("CHAT", {"message": "gg"}))
+    payload = FrameDecoder().feed(frame)[0]
+    assert is_channel_payload(payload)
+    channel, message = decode_channel_payload(payload)
+    assert channel == CHAT
+    assert (message.type, message.data) == ("CHAT", {"message": "gg"})
+    # A channel can be given explicitly, e.g. PONGs on the control channel
+    frame = encode_channel_frame(Message("MOVE", {"move": "e2e4"}), CONTROL)
+    assert frame[HEADER.size] == CONTROL
+
+
+def test_plain_json_is_not_a_channel_payload():
+    payload = FrameDecoder().feed(Message("MOVE", {"move": "e2e4"}).to_frame())[0]
+    assert not is_channel_payload(payload)
+    with pytest.raises(ValueError):
+        decode_channel_payload(payload)
+    with pytest.raises(ValueError):
+        decode_channel_payload(bytes([GAME]) + b"{not json")
+
+
+def test_channel_lanes_match_the_outbound_lanes():
+    assert CHANNEL_LANES == {GAME: STATE_LANE, CONTROL: CONTROL_LANE, CHAT: CHAT_LANE}
+
+
+def backlogged_connection(sock):
+    """A multiplexed MessageConnection whose writer is stuck behind queued chat"""
+    connection = MessageConnection(sock, ("127.0.0.1", 1))
+    connection.multiplex()
+    sent = 0
+    # The peer does not read, so the socket buffer fills up and chat starts to queue
+    while len(connection.outbound) < 20:
+        assert connection.send_message(Message("CHAT", {"message": "x" * 1000, "number": sent}))
+        sent += 1
+    return connection, sent
+
+
+def read_messages(sock, count):
+    decoder = FrameDecoder()
+    messages = []
+    while len(messages) < count:
+        data = sock.recv(65536)
+        assert data, "Connection closed early"
+        messages.extend(decode_channel_payload(payload)[1] for payload in decoder.feed(data))
+    return messages
+
+
+def test_a_move_overtakes_queued_chat():
+    ours, theirs = socket.socketpair()
+    with ours, theirs:
+        theirs.settimeout(5.0)
+        connection, chats = backlogged_connection(ours)
+        with connection.condition:
+            queued_chat = len(connection.outbound)
+            connection.send_message(Message("GAME_UPDATE", {"board": "fen", "ack": 1}))
+
+        messages = read_messages(theirs, chats + 1)
+        types = [message.type for message in messages]
+        # Only chat already handed to the socket is written before the move
+        assert types.index("GAME_UPDATE") == chats - queued_chat
+        numbers = [message.data["number"] for message in messages if message.type == "CHAT"]
+        assert numbers == list(range(chats))
+        connection.close()
+
+
+def test_one_fifo_without_channel_priority(monkeypatch):
+    monkeypatch.setattr("server.outbound.CHANNEL_PRIORITY", False)
+    ours, theirs = socket.socketpair()
+    with ours, theirs:
+        theirs.settimeout(5.0)
+        connection, chats = backlogged_connection(ours)
+        connection.send_message(Message("GAME_UPDATE", {"board": "fen", "ack": 1}))
+        assert read_messages(theirs, chats + 1)[-1].type == "GAME_UPDATE"
+        connection.close()
+
+
+def test_without_multiplexing_frames_keep_their_order():
+    ours, theirs = socket.socketpair()
+    with ours, theirs:
+        theirs.settimeout(5.0)
+        connection = MessageConnection(ours, ("127.0.0.1", 1))
+        for number in range(50):
+            connection.send_message(Message("CHAT" if number % 2 else "GAME_UPDATE", {"number": number}))
+        decoder = FrameDecoder()
+        numbers = []
+        while len(numbers) < 50:
+            numbers.extend(message["data"]["number"] for message in decoder.feed_messages(theirs.recv(65536)))
+        assert numbers == list(range(50))
+        connection.close()
@@ -0,0 +1,115 @@
+import socket
+import time
+
+from server.metrics import Metrics
+from server.outbound import DROP, EVICT, QUEUE, Connection, OutboundQueue, SlowConsumerPolicy
+
+
+class Peer:
+    addr = ("127.0.0.1", 1)
+
+
+def policy(**options):
+    return SlowConsumerPolicy("test", coalesce_depth=2, downgrade_bytes=1000, evict_bytes=4000,
+                              stall_timeout=10.0, metrics=Metrics(), **options)
+
+
+def offer(policy, queue, data, kind):
+    """Run a frame through the policy and queue it if admitted, as Connection.send does"""
+    action = policy.admit(Peer(), queue, data, kind)
+    if action == QUEUE:
+        queue.push(data, kind)
+    return action
+
+
+def test_queue_is_bounded():
+    queue = OutboundQueue(limit=2)
+    assert queue.push(b"a") and queue.push(b"b")
+    assert not queue.push(b"c")
+    assert queue.dropped == 1 and len(queue) == 2
+
+
+def test_in_flight_bytes_count_until_drained():
+    queue = OutboundQueue()
+    queue.push(b"x" * 10)
+    queue.push(b"y" * 5)
+    assert queue.pop_all() == [b"x" * 10, b"y" * 5]
+    assert len(queue) == 0 and queue.backlog_bytes() == 15 and not queue.is_idle()
+    queue.mark_drained()
+    assert queue.is_idle() and queue.backlog_bytes() == 0
+
+
+def test_superseded_state_updates_are_coalesced_in_a_backlog():
+    slow = policy()
+    queue = OutboundQueue()
+    offer(slow, queue, b"board 1", "BOARD_UPDATE")
+    offer(slow, queue, b"chat", "CHAT")
+    # Below coalesce_depth nothing is dropped
+    assert len(queue) == 2
+    offer(slow, queue, b"board 2", "BOARD_UPDATE")
+    assert queue.pop_all() == [b"chat", b"board 2"]
+    assert slow.metrics.counters["outbound.test.coalesced"] == 1
+
+
+def test_backlogged_connections_are_downgraded_then_restored():
+    slow = policy(evict=False)
+    queue = OutboundQueue(limit=1000)
+    offer(slow, queue, b"x" * 1200, "BOARD_DELTA")
+    assert offer(slow, queue, b"tick", "TIME_UPDATE") == DROP
+    assert offer(slow, queue, b"chat", "CHAT") == DROP
+    assert queue.downgraded
+    # Moves still go through
+    assert offer(slow, queue, b"move", "BOARD_DELTA") == QUEUE
+
+    queue.pop_all()
+    queue.mark_drained()
+    assert offer(slow, queue, b"chat", "CHAT") == QUEUE
+    assert not queue.downgraded
+    assert slow.metrics.counters["outbound.test.downgraded"] == 1
+    assert slow.metrics.counters["outbound.test.restored"] == 1
+
+
+def test_oversized_backlogs_are_evicted():
+    slow = policy()
+    queue = OutboundQueue(limit=1000)
+    for _ in range(3):
+        assert offer(slow, queue, b"x" * 1000, "BOARD_DELTA") == QUEUE
+    assert offer(slow, queue, b"x" * 1001, "BOARD_DELTA") == EVICT
+    assert slow.metrics.counters["outbound.test.evicted"] == 1
+
+
+def test_stalled_connections_are_evicted():
+    slow = policy()
+    queue = OutboundQueue()
+    offer(slow, queue, b"move", "BOARD_DELTA")
+    queue.last_drain = time.monotonic() - 11.0
+    assert offer(slow, queue, b"move", "BOARD_DELTA") == EVICT
+    # An idle connection is not stalled however long ago it last wrote
+    queue = OutboundQueue()
+    queue.last_drain = time.monotonic() - 11.0
+    assert offer(slow, queue, b"move", "BOARD_DELTA") == QUEUE
+
+
+def test_players_are_never_evicted_or_downgraded():
+    player = policy(downgrade=False, evict=False)
+    queue = OutboundQueue(limit=1000)
+    offer(player, queue, b"x" * 10000, "BOARD_DELTA")
+    queue.last_drain = time.monotonic() - 100.0
+    assert offer(player, queue, b"tick", "TIME_UPDATE") == QUEUE
+    assert offer(player, queue, b"chat", "CHAT") == QUEUE
+    assert not queue.downgraded
+    assert "outbound.test.evicted" not in player.metrics.counters
+
+
+def test_an_evicted_connection_is_shut_down():
+    ours, theirs = socket.socketpair()
+    with theirs:
+        connection = Connection(ours, Peer.addr, policy=policy())
+        # Hold the writer back so the frames stay queued
+        with connection.condition:
+            connection.outbound.push(b"x" * 3000, "BOARD_DELTA")
+            connection.outbound.pop_all()
+        assert not connection.send(b"x" * 2000, "BOARD_DELTA")
+        assert connection.closed
+        theirs.settimeout(5.0)
+        assert theirs.recv(1) == b""
@@ -0,0 +1,105 @@
+import threading
+
+import pytest
+
+from server.metrics import Metrics
+from server.persistence import BatchWriteError, PersistenceWorker
+
+
+class RecordingStore:
+    """Applies batches to a list; fail_once makes the first write stop after that many events"""
+
+    def __init__(self, fail_once=None):
+        self.written = []
+        self.batches = []
+        self.fail_once = fail_once
+
+    def write_batch(self, events):
+        self.batches.append(len(events))
+        if self.fail_once is not None:
+            applied, self.fail_once = self.fail_once, None
+            self.written.extend(events[:applied])
+            if applied:
+                raise BatchWriteError(applied, OSError("disk full"))
+            raise OSError("database is locked")
+        self.written.extend(events)
+
+
+def worker(store, **options):
+    options.setdefault("batch_interval", 0.01)
+    return PersistenceWorker(store, metrics=Metrics(), retry_delay=0.01, **options)
+
+
+def submit_moves(persistence, count, game_id="g1"):
+    for number in range(count):
+        persistence.record_move(game_id, f"m{number}", {"ply": number})
+    return [("move", game_id, (f"m{number}", {"ply": number})) for number in range(count)]
+
+
+def test_events_are_written_in_order():
+    store = RecordingStore()
+    persistence = worker(store)
+    expected = submit_moves(persistence, 5)
+    persistence.finish("g1", "white", "checkmate")
+    assert persistence.flush(timeout=2)
+    assert store.written == expected + [("finish", "g1", ("white", "checkmate"))]
+    persistence.stop(timeout=2)
+
+
+def test_batches_are_bounded():
+    store = RecordingStore()
+    persistence = worker(store, batch_size=4, batch_interval=1.0)
+    expected = submit_moves(persistence, 10)
+    assert persistence.flush(timeout=2)
+    assert store.written == expected
+    assert max(store.batches) <= 4
+    persistence.stop(timeout=2)
+
+
+@pytest.mark.parametrize("applied", [0, 3])
+def test_failed_batch_is_retried_without_loss_or_duplicates(applied):
+    store = RecordingStore(fail_once=applied)
+    persistence = worker(store, batch_interval=0.05)
+    expected = submit_moves(persistence, 8)
+    assert persistence.flush(timeout=2)
+    assert store.written == expected
+    counters = persistence.metrics.snapshot()["counters"]
+    assert counters["persistence.failed"] == 8 - applied
+    assert counters["persistence.events"] == 8
+    persistence.stop(timeout=2)
+
+
+def test_flush_times_out_while_the_store_is_blocked():
+    release = threading.Event()
+
+    class BlockedStore(RecordingStore):
+        def write_batch(self, events):
+            release.wait(2)
+            super().write_batch(events)
+
+    store = BlockedStore()
+    persistence = worker(store)
+    expected = submit_moves(persistence, 2)
+    assert not persistence.flush(timeout=0.05)
+    release.set()
+    assert persistence.flush(timeout=2)
+    assert store.written == expected
+    persistence.stop(timeout=2)
+
+
+def test_stop_writes_what_is_queued():
+    store = RecordingStore()
+    persistence = worker(store, batch_interval=10.0)
+    expected = submit_moves(persistence, 3)
+    persistence.stop(timeout=2)
+    assert not persistence.thread.is_alive()
+    assert store.written == expected
+    with pytest.raises(RuntimeError):
+        persistence.remove("g1")
+
+
+def test_unknown_event_is_rejected():
+    persistence = worker(RecordingStore())
+    with pytest.raises(ValueError):
+        persistence.submit("bogus", "g1")
+    persistence.stop(timeout=2)
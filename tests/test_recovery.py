@@ -0,0 +1,65 @@
+import chess
+
+import simple_server
+from server.clock import TimeControl
+from server.journal import JournalStore
+from simple_server import SimpleServer
+
+MOVES = ["d2d4", "d7d5", "c2c4", "e7e6", "b1c3", "g8f6"]
+
+
+def players():
+    return {color: {"name": color.title(), "id": color[0], "socket": None, "token": f"{color}-token"}
+            for color in ("white", "black")}
+
+
+def journal_game(server, store, game_id, moves, status="playing"):
+    """Journal a game of `server` as its move handler does, then take it out of the server's games"""
+    game = server.add_game(game_id, TimeControl.parse("5+3"), status, players())
+    store.save_state(game_id, server.persisted_state(game))
+    for move in moves:
+        game["board"].push_uci(move)
+        game["current_player"] = "white" if game["board"].turn else "black"
+        game["clock"].remaining[game["current_player"]] -= 1.5
+        store.record_move(game_id, move, server.persisted_state(game))
+    store.journal(game_id).close()
+    del simple_server.games[game_id]
+    return game
+
+
+def test_live_games_are_rebuilt_from_the_journal(tmp_path):
+    store = JournalStore(str(tmp_path), fsync_policy="never", snapshot_every=4)
+    before = journal_game(SimpleServer(), store, "REC001", MOVES)
+
+    server = SimpleServer()
+    assert server.recover_games(JournalStore(str(tmp_path))) == 1
+    game = server.get_game("REC001")
+    assert game["board"].fen() == before["board"].fen()
+    assert game["board"].ply() == len(MOVES)
+    assert game["current_player"] == "white"
+    assert str(game["time_control"]) == "5+3"
+    assert game["clock"].remaining == before["clock"].remaining
+    assert game["clock"].running is None
+    # Seats wait for REJOIN_GAME or RESUME with the journaled tokens
+    assert all(player["socket"] is None for player in game["players"].values())
+    assert game["players"]["black"]["token"] == "black-token"
+    assert [entry["game_id"] for entry in server.lobby.all()] == ["REC001"]
+
+
+def test_finished_and_waiting_games_are_not_recovered(tmp_path):
+    store = JournalStore(str(tmp_path), fsync_policy="never")
+    journal_game(SimpleServer(), store, "REC002", [], status="waiting")
+    finished = chess.Board()
+    for move in ("f2f3", "e7e5", "g2g4", "d8h4"):
+        finished.push_uci(move)
+    journal_game(SimpleServer(), store, "REC003", ["f2f3", "e7e5", "g2g4"])
+    state = store.load_state("REC003")
+    state.update(board=finished.fen(), game_over=True, status="finished")
+    store.save_state("REC003", state)
+    store.journal("REC003").close()
+
+    server = SimpleServer()
+    assert server.recover_games(JournalStore(str(tmp_path))) == 0
+    assert server.get_game("REC002") is None and server.get_game("REC003") is None
+    # Nothing is left to recover on the next start either
+    assert JournalStore(str(tmp_path)).active_game_ids() == []
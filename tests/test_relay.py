@@ -0,0 +1,52 @@
+import simple_server
+from server.clock import TimeControl
+from server.outbound import RELAY_POLICY, SPECTATOR_POLICY
+from server.relay import redirect_for, relay_for
+from simple_server import SimpleServer
+
+RELAYS = [("127.0.0.1", 50020), ("127.0.0.1", 50021), ("127.0.0.1", 50022)]
+
+
+class FakeConnection:
+    addr = ("127.0.0.1", 1)
+    binary = False
+    heartbeat = None
+
+    def __init__(self):
+        self.policy = None
+        self.sent = []
+
+    def send(self, data, kind=None):
+        self.sent.append(kind)
+        return True
+
+
+def spectate(game_id, **options):
+    return {"type": "SPECTATE", "player_name": "watcher", "player_id": "watcher", "game_id": game_id, **options}
+
+
+def test_busy_games_redirect_to_a_stable_relay():
+    assert redirect_for("ABC234", RELAYS, 9, spectate("ABC234"), 10) is None
+    redirect = redirect_for("ABC234", RELAYS, 10, spectate("ABC234"), 10)
+    assert redirect["type"] == "REDIRECT" and redirect["game_id"] == "ABC234"
+    assert (redirect["host"], redirect["port"]) == relay_for("ABC234", RELAYS)
+    # Games spread over the relays
+    assert len({relay_for(f"G{number}", RELAYS) for number in range(50)}) == len(RELAYS)
+
+
+def test_relays_and_servers_without_relays_never_redirect():
+    assert redirect_for("ABC234", RELAYS, 1000, spectate("ABC234", relay=True), 10) is None
+    assert redirect_for("ABC234", [], 1000, spectate("ABC234"), 10) is None
+
+
+def test_relay_spectators_are_never_evicted():
+    server = SimpleServer(relays=[])
+    server.add_game("RLY234", TimeControl(60), "playing", {})
+    try:
+        spectator, relay = FakeConnection(), FakeConnection()
+        assert server.handle_spectate_game(spectator, spectate("RLY234"))
+        assert server.handle_spectate_game(relay, spectate("RLY234", player_id="relay", relay=True))
+        assert spectator.policy is SPECTATOR_POLICY
+        assert relay.policy is RELAY_POLICY and not RELAY_POLICY.evict and not RELAY_POLICY.downgrade
+    finally:
+        del simple_server.games["RLY234"]
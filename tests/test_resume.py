@@ -0,0 +1,59 @@
+def start_game(connect, **options):
+    """Create and join a game; returns (white, black, game_id, white token, black token)"""
+    white = connect()
+    white.send({"type": "CREATE_GAME", "player_name": "White", "player_id": "w", "time_limit": 60, **options})
+    created = white.until("GAME_CREATED")
+    black = connect()
+    black.send({"type": "JOIN_GAME", "player_name": "Black", "player_id": "b", "game_id": created["game_id"],
+                **options})
+    joined = black.until("GAME_JOINED")
+    white.until("GAME_START")
+    black.until("GAME_START")
+    return white, black, created["game_id"], created["session_token"], joined["session_token"]
+
+
+def test_resume_replays_the_moves_missed_while_away(connect):
+    white, black, game_id, _, token = start_game(connect)
+    white.send({"type": "MOVE", "move": "e2e4"})
+    black.until("BOARD_UPDATE")
+    black.send({"type": "MOVE", "move": "e7e5"})
+    white.until("BOARD_UPDATE")
+
+    black.close()
+    white.until("OPPONENT_DISCONNECTED")
+    white.send({"type": "MOVE", "move": "g1f3"})
+    white.until("BOARD_UPDATE")
+
+    black = connect()
+    black.send({"type": "RESUME", "game_id": game_id, "token": token, "last_ply": 1})
+    resync = black.until("RESYNC")
+    assert resync["color"] == "black"
+    assert resync["ply"] == 3
+    assert resync["moves"] == ["e7e5", "g1f3"]
+    assert resync["current_player"] == "black"
+    assert not resync["game_over"]
+    white.until("OPPONENT_RECONNECTED")
+
+    # The resumed connection plays on
+    black.send({"type": "MOVE", "move": "b8c6"})
+    assert white.until("BOARD_UPDATE")["board"].startswith("r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/")
+
+
+def test_resync_request_sends_the_full_position(connect):
+    white, black, _, _, _ = start_game(connect)
+    white.send({"type": "MOVE", "move": "d2d4"})
+    update = black.until("BOARD_UPDATE")
+    black.send({"type": "RESYNC_REQUEST", "last_ply": None})
+    resync = black.until("RESYNC")
+    assert resync["board"] == update["board"]
+    assert resync["moves"] is None
+
+
+def test_resume_with_an_unknown_token_is_rejected(connect):
+    _, _, game_id, _, _ = start_game(connect)
+    client = connect()
+    client.send({"type": "RESUME", "game_id": game_id, "token": "not-a-token"})
+    assert client.until("RESUME_REJECTED")["message"] == "Invalid session"
+    client = connect()
+    client.send({"type": "RESUME", "game_id": "NOSUCH", "token": "not-a-token"})
+    assert client.until("RESUME_REJECTED")["message"] == "Game not found"
@@ -0,0 +1,146 @@
+import threading
+import time
+
+from server.scheduler import IdleTimeout, Scheduler, TimerHandle
+
+
+class FakeScheduler:
+    """Scheduler interface on a manual clock; advance() fires due timers in order"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.timers = []
+
+    def time(self):
+        return self.now
+
+    def call_at(self, when, callback, *args):
+        handle = TimerHandle(when, callback, args)
+        self.timers.append(handle)
+        return handle
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self.now + delay, callback, *args)
+
+    def pending(self):
+        return [handle for handle in self.timers if not handle.cancelled]
+
+    def advance(self, seconds):
+        self.now += seconds
+        while True:
+            due = [handle for handle in self.pending() if handle.when <= self.now]
+            if not due:
+                return
+            handle = min(due, key=lambda handle: handle.when)
+            handle.cancelled = True
+            handle.run()
+
+
+def test_timers_fire_in_deadline_order():
+    scheduler = Scheduler()
+    scheduler.start()
+    fired = []
+    done = threading.Event()
+    try:
+        scheduler.call_later(0.03, fired.append, "late")
+        scheduler.call_later(0.01, fired.append, "early")
+        scheduler.call_later(0.02, fired.append, "middle")
+        scheduler.call_later(0.04, done.set)
+        assert done.wait(2)
+    finally:
+        scheduler.stop()
+    assert fired == ["early", "middle", "late"]
+
+
+def test_cancelled_timer_does_not_fire():
+    scheduler = Scheduler()
+    scheduler.start()
+    fired = []
+    done = threading.Event()
+    try:
+        scheduler.call_later(0.01, fired.append, "cancelled").cancel()
+        scheduler.call_later(0.02, done.set)
+        assert done.wait(2)
+    finally:
+        scheduler.stop()
+    assert fired == []
+
+
+def test_cancel_counts_once_and_compacts_the_heap():
+    scheduler = Scheduler()
+    handles = [scheduler.call_later(60, print) for _ in range(10)]
+    handles[0].cancel()
+    handles[0].cancel()
+    assert scheduler.cancelled == 1 and len(scheduler) == 9
+    for handle in handles[1:5]:
+        handle.cancel()
+    assert len(scheduler.heap) == 10 and len(scheduler) == 5
+    # The sixth cancelled entry tips it over COMPACT_RATIO
+    handles[5].cancel()
+    assert len(scheduler.heap) == 4 and scheduler.cancelled == 0
+    assert all(not entry[2].cancelled for entry in scheduler.heap)
+
+
+def test_idle_timeout_expires():
+    scheduler = FakeScheduler()
+    expired = []
+    IdleTimeout(scheduler, 10, lambda: expired.append(scheduler.now))
+    scheduler.advance(9)
+    assert expired == []
+    scheduler.advance(1)
+    assert expired == [10]
+    assert scheduler.pending() == []
+
+
+def test_activity_rearms_for_the_remaining_time():
+    scheduler = FakeScheduler()
+    expired = []
+    idle = IdleTimeout(scheduler, 10, lambda: expired.append(scheduler.now))
+    scheduler.advance(4)
+    idle.touch()
+    idle.touch()
+    assert len(scheduler.pending()) == 1
+    scheduler.advance(6)
+    assert expired == [] and len(scheduler.pending()) == 1
+    scheduler.advance(4)
+    assert expired == [14]
+
+
+def test_reset_and_cancel():
+    scheduler = FakeScheduler()
+    expired = []
+    idle = IdleTimeout(scheduler, 10, lambda: expired.append(scheduler.now))
+    scheduler.advance(5)
+    idle.reset(30)
+    scheduler.advance(20)
+    assert expired == []
+    idle.cancel()
+    assert scheduler.pending() == []
+    scheduler.advance(100)
+    assert expired == []
+
+
+def test_cancel_during_check_is_not_undone():
+    # check() runs on the scheduler thread; cancel() from another thread
+    # while it decides to re-arm must still leave no timer behind
+    class SlowClock(FakeScheduler):
+        def time(self):
+            if checking.is_set():
+                in_check.set()
+                time.sleep(0.05)
+            return self.now
+
+    scheduler = SlowClock()
+    checking = threading.Event()
+    in_check = threading.Event()
+    idle = IdleTimeout(scheduler, 10, lambda: None)
+    scheduler.now = 5
+    idle.touch()
+    checking.set()
+    check = threading.Thread(target=scheduler.advance, args=(5,))
+    check.start()
+    assert in_check.wait(2)
+    checking.clear()
+    idle.cancel()
+    check.join()
+    assert scheduler.pending() == []
@@ -0,0 +1,76 @@
+import os
+
+import chess
+import pytest
+
+from server.sqlite_store import DB_PATH, SQLiteGameStore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MOVES = ["e2e4", "e7e5", "g1f3"]
+
+
+def state_after(board, players=None):
+    state = {
+        "board": board.fen(),
+        "current_player": "white" if board.turn else "black",
+        "game_over": board.is_game_over(),
+        "clocks": {"white": 300.0, "black": 300.0},
+    }
+    if players:
+        state["players"] = players
+    return state
+
+
+def play(store, game_id, moves, players=None):
+    board = chess.Board()
+    store.save_state(game_id, state_after(board, players))
+    for move in moves:
+        board.push_uci(move)
+        store.record_move(game_id, move, state_after(board, players))
+    return board
+
+
+def test_game_round_trips(tmp_path):
+    path = tmp_path / "data" / "games.db"
+    store = SQLiteGameStore(str(path))
+    players = {"white": {"name": "alice", "id": "p1"}, "black": {"name": "bob", "id": "p2"}}
+    board = play(store, "g1", MOVES, players)
+    store.close()
+
+    reopened = SQLiteGameStore(str(path))
+    state, loaded = reopened.load_game("g1")
+    assert loaded.fen() == board.fen()
+    assert state["ply"] == len(MOVES) and state["current_player"] == "black"
+    assert state["clocks"] == {"white": 300.0, "black": 300.0}
+    assert reopened.load_moves("g1") == MOVES
+    assert reopened.load_moves("g1", after_ply=1) == MOVES[1:]
+    assert reopened.active_game_ids() == ["g1"]
+    assert reopened.games_for_player("p2") == [{"game_id": "g1", "status": "active"}]
+    assert reopened.load_game("unknown") == (None, None)
+
+
+def test_batches_finish_and_remove(tmp_path):
+    store = SQLiteGameStore(str(tmp_path / "games.db"))
+    board = chess.Board()
+    board.push_uci("f2f3")
+    store.write_batch([
+        ("move", "g1", ("f2f3", state_after(board))),
+        ("state", "g2", (state_after(chess.Board()),)),
+        ("finish", "g1", ("black", "resignation")),
+    ])
+    assert store.active_game_ids() == ["g2"]
+    assert [(game["game_id"], game["winner"], game["reason"]) for game in store.finished_games()] == \
+        [("g1", "black", "resignation")]
+    store.remove("g1")
+    assert store.load_game("g1") == (None, None) and store.finished_games() == []
+
+
+def test_failed_batch_is_rolled_back(tmp_path):
+    store = SQLiteGameStore(str(tmp_path / "games.db"))
+    with pytest.raises(ValueError):
+        store.write_batch([("state", "g1", (state_after(chess.Board()),)), ("bogus", "g1", ())])
+    assert store.load_game("g1") == (None, None)
+
+
+def test_default_path_is_outside_the_source_tree():
+    assert not os.path.abspath(DB_PATH).startswith(ROOT + os.sep)